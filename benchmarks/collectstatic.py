@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of collectstatic with SmartManifestStaticFilesStorage against
+Django's ManifestStaticFilesStorage, on a synthetic tree of static files.
+
+The tree has CSS files with url() references and @import rules, JavaScript
+files with asset URL markers, images in nested directories and a few large
+binaries. Each storage runs in a fresh process against the local file system
+and against a storage which adds latency to every call, like a remote storage
+does. Throughput, peak memory and calls of storage methods are reported.
+
+With --native-async, the storage also provides native async methods
+(``async_exists``, ``async_save`` and ``async_delete``), which wait for the
+latency in the event loop of the async I/O engine instead of in a thread.
+
+Usage::
+
+    python benchmarks/collectstatic.py [--css 1000] [--js 200] [--images 500]
+        [--large 2] [--large-size 20] [--latency 0.002]
+        [--config '{"SAVE_WORKERS": 8, "EXISTS_CACHE_ENABLED": true}']
+        [--native-async]
+"""
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+STORAGES = {
+    'stock': '__main__.StockManifestStorage',
+    'smart': '__main__.SmartManifestStorage',
+}
+
+
+def generate_tree(src, args):
+    # Generate the synthetic tree of static files. The result only depends on
+    # the arguments.
+    rand = random.Random(args.seed)
+    directories = ['app%d/%s' % (i, sub) for i in range(10)
+                   for sub in ('', 'a', 'a/b', 'a/b/c')]
+
+    def make_path(kind, i, extension):
+        return '%s/%s/%s%d.%s' % (rand.choice(directories).rstrip('/'), kind,
+                                  kind, i, extension)
+
+    images = [make_path('img', i, 'png') for i in range(args.images)]
+    css_files = [make_path('css', i, 'css') for i in range(args.css)]
+    js_files = [make_path('js', i, 'js') for i in range(args.js)]
+    large_files = [make_path('media', i, 'bin')
+                   for i in range(args.large)]
+
+    def relative(source, target):
+        return os.path.relpath(target, os.path.dirname(source)) \
+            .replace(os.sep, '/')
+
+    def write(path, content):
+        full_path = os.path.join(src, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'wb') as f:
+            f.write(content)
+
+    for path in images:
+        write(path, b'\x89PNG' + os.urandom(rand.randint(200, 20000)))
+    # Stylesheets import base ones, which import nothing, so that chains of
+    # imports stay in the limit of passes of Django's storage
+    base_css_count = min(len(css_files), 10)
+    for i, path in enumerate(css_files):
+        lines = []
+        if i >= base_css_count:
+            for target in rand.sample(css_files[:base_css_count], 2):
+                lines.append('@import url("%s");' % relative(path, target))
+        for j, target in enumerate(rand.sample(images, min(len(images), 8))):
+            lines.append('.c%d-%d { background: url("%s"); }'
+                         % (i, j, relative(path, target)))
+        lines.extend('.r%d-%d { color: #%06x; margin: %dpx; }'
+                     % (i, j, rand.randint(0, 0xffffff), j)
+                     for j in range(40))
+        write(path, '\n'.join(lines).encode('utf-8'))
+    for i, path in enumerate(js_files):
+        lines = ['var assets%d = [' % i]
+        for target in rand.sample(images, min(len(images), 5)):
+            lines.append('  /*! rev */ "%s" /*! endrev */,'
+                         % relative(path, target))
+        lines.append('];')
+        lines.extend('function f%d_%d(x) { return x * %d + %d; }'
+                     % (i, j, j, rand.randint(0, 1000)) for j in range(40))
+        write(path, '\n'.join(lines).encode('utf-8'))
+    chunk = os.urandom(1048576)
+    for path in large_files:
+        full_path = os.path.join(src, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'wb') as f:
+            for _ in range(args.large_size):
+                f.write(chunk)
+
+
+def get_tree_size(src):
+    count = size = 0
+    for dirpath, dirnames, filenames in os.walk(src):
+        for filename in filenames:
+            count += 1
+            size += os.path.getsize(os.path.join(dirpath, filename))
+    return count, size
+
+
+def get_peak_rss():
+    # Peak resident set size of this process in bytes, or None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run(args):
+    # Run collectstatic once with a storage in this process, and print the
+    # result as JSON
+    import django
+    from django.conf import settings
+    config = {'JS_ASSETS_REPL_ENABLED': True}
+    config.update(json.loads(args.config))
+    settings.configure(
+        DEBUG=False, STATIC_URL='/static/', STATIC_ROOT=args.root,
+        STATICFILES_DIRS=[args.src],
+        STATICFILES_STORAGE=STORAGES[args.run],
+        INSTALLED_APPS=['django.contrib.staticfiles'],
+        SMARTSTATICFILES_CONFIG=config,
+        LOGGING_CONFIG=None, USE_I18N=False,
+    )
+    django.setup()
+    # The target storage starts empty, so its manifest has no files
+    logging.getLogger('django_smartstaticfiles').setLevel(logging.ERROR)
+    define_storages(args.latency, args.native_async)
+
+    from django.contrib.staticfiles.storage import staticfiles_storage
+    from django.core.management import call_command
+    started = default_timer()
+    call_command('collectstatic', interactive=False, verbosity=0)
+    seconds = default_timer() - started
+    storage = staticfiles_storage._wrapped
+    print(json.dumps({
+        'seconds': seconds,
+        'post_process_seconds': storage.post_process_seconds,
+        'peak_rss': get_peak_rss(),
+        'calls': storage.calls,
+    }))
+
+
+def define_storages(latency, native_async=False):
+    # Storage classes are defined after settings are configured
+    from django.contrib.staticfiles.storage import (
+        ManifestFilesMixin, StaticFilesStorage,
+    )
+    from django_smartstaticfiles.storage import SmartManifestFilesMixin
+
+    class LatencyStorage(StaticFilesStorage):
+        # Counts calls of storage methods, and adds latency to each of them
+        def __init__(self, *args, **kwargs):
+            self.calls = {}
+            self._calls_lock = threading.Lock()
+            self.post_process_seconds = None
+            super(LatencyStorage, self).__init__(*args, **kwargs)
+
+        def _count_call(self, name):
+            with self._calls_lock:
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+        def _call(self, name):
+            self._count_call(name)
+            if latency:
+                time.sleep(latency)
+
+        def _async_call(self, name, func, *args):
+            # Return a future of the result of a blocking call after the
+            # latency, without blocking the event loop meanwhile
+            import asyncio
+            self._count_call(name)
+            future = asyncio.get_event_loop().create_future()
+
+            def call():
+                try:
+                    future.set_result(func(*args))
+                except Exception as exc:
+                    future.set_exception(exc)
+
+            asyncio.get_event_loop().call_later(latency, call)
+            return future
+
+        def exists(self, name):
+            self._call('exists')
+            return super(LatencyStorage, self).exists(name)
+
+        def _open(self, name, mode='rb'):
+            self._call('open')
+            return super(LatencyStorage, self)._open(name, mode)
+
+        def _save(self, name, content):
+            self._call('save')
+            return super(LatencyStorage, self)._save(name, content)
+
+        def delete(self, name):
+            self._call('delete')
+            return super(LatencyStorage, self).delete(name)
+
+        def listdir(self, path):
+            self._call('listdir')
+            return super(LatencyStorage, self).listdir(path)
+
+    class NativeAsyncLatencyStorage(LatencyStorage):
+        # Native async methods call methods of the local storage without
+        # the latency of blocking methods
+        def async_exists(self, name):
+            return self._async_call('async_exists', StaticFilesStorage.exists,
+                                    self, name)
+
+        def async_save(self, name, content):
+            return self._async_call('async_save', StaticFilesStorage._save,
+                                    self, name, content)
+
+        def async_delete(self, name):
+            return self._async_call('async_delete', StaticFilesStorage.delete,
+                                    self, name)
+
+    base_storage = NativeAsyncLatencyStorage if native_async \
+        else LatencyStorage
+
+    def timed_post_process(self, *args, **kwargs):
+        started = default_timer()
+        for post_processed in super(type(self), self).post_process(
+                *args, **kwargs):
+            yield post_processed
+        self.post_process_seconds = default_timer() - started
+
+    module = sys.modules[__name__]
+    module.StockManifestStorage = type(
+        str('StockManifestStorage'), (ManifestFilesMixin, base_storage),
+        {'post_process': timed_post_process}
+    )
+    module.SmartManifestStorage = type(
+        str('SmartManifestStorage'), (SmartManifestFilesMixin,
+                                              base_storage),
+        {'post_process': timed_post_process}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--css', type=int, default=1000,
+                        help='number of CSS files')
+    parser.add_argument('--js', type=int, default=200,
+                        help='number of JavaScript files')
+    parser.add_argument('--images', type=int, default=500,
+                        help='number of images')
+    parser.add_argument('--large', type=int, default=2,
+                        help='number of large binaries')
+    parser.add_argument('--large-size', type=int, default=20,
+                        help='size of each large binary in MB')
+    parser.add_argument('--latency', type=float, default=0.002,
+                        help='latency of each call of the simulated remote '
+                             'storage in seconds')
+    parser.add_argument('--config', default='{}',
+                        help='SMARTSTATICFILES_CONFIG for the smart storage '
+                             'as JSON')
+    parser.add_argument('--native-async', action='store_true',
+                        help='provide native async methods in the simulated '
+                             'remote storage')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the synthetic tree')
+    parser.add_argument('--run', choices=sorted(STORAGES),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--src', help=argparse.SUPPRESS)
+    parser.add_argument('--root', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args)
+        return
+
+    temp_dir = tempfile.mkdtemp(prefix='smartstaticfiles-bench-')
+    try:
+        src = os.path.join(temp_dir, 'src')
+        generate_tree(src, args)
+        count, size = get_tree_size(src)
+        print('%d files, %.1f MB' % (count, size / 1048576))
+        print('%-30s %9s %9s %9s %9s %9s  %s' % (
+            'storage', 'total s', 'post s', 'files/s', 'MB/s', 'peak MB',
+            'storage calls'))
+
+        for latency in sorted(set([0, args.latency])):
+            for storage in ('stock', 'smart'):
+                root = os.path.join(temp_dir, 'root-%s-%s' % (storage,
+                                                              latency))
+                command = [sys.executable, os.path.abspath(__file__),
+                           '--run', storage, '--src', src, '--root', root,
+                           '--latency', str(latency)]
+                if storage == 'smart':
+                    command += ['--config', args.config]
+                else:
+                    command += ['--config', '{}']
+                if args.native_async:
+                    command.append('--native-async')
+                output = subprocess.check_output(command)
+                result = json.loads(output.decode('utf-8').strip()
+                                    .split('\n')[-1])
+                calls = ', '.join('%s=%d' % item
+                                  for item in sorted(result['calls'].items()))
+                title = '%s (%s)' % (storage, 'local' if not latency else
+                                     '%gms latency' % (latency * 1000))
+                peak_rss = result['peak_rss']
+                print('%-30s %9.2f %9.2f %9.0f %9.1f %9s  %s' % (
+                    title, result['seconds'], result['post_process_seconds'],
+                    count / result['seconds'],
+                    size / 1048576 / result['seconds'],
+                    '%.0f' % (peak_rss / 1048576) if peak_rss else '-',
+                    calls,
+                ))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
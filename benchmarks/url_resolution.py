@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark of resolving static URLs by "url()" of storages, which is what
+the "static" template tag does on every call.
+
+Usage::
+
+    python benchmarks/url_resolution.py [--entries 40000] [--names 300]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+
+def write_manifest(root, entries):
+    paths = {}
+    for i in range(entries):
+        name = 'app%d/css/file%d.css' % (i % 50, i)
+        paths[name] = 'app%d/css/file%d.%012x.css' % (i % 50, i, i)
+    with open(os.path.join(root, 'staticfiles.json'), 'w') as f:
+        json.dump({'paths': paths, 'version': '1.0'}, f)
+    return sorted(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--entries', type=int, default=40000,
+                        help='number of entries in the manifest')
+    parser.add_argument('--names', type=int, default=300,
+                        help='number of distinct names resolved per round')
+    parser.add_argument('--rounds', type=int, default=20,
+                        help='number of rounds')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='smartstaticfiles-bench-')
+    try:
+        all_names = write_manifest(root, args.entries)
+        step = max(1, len(all_names) // args.names)
+        names = all_names[::step][:args.names]
+        # Query strings and fragments are resolved as well
+        names = [name + suffix for name, suffix in zip(
+            names, ['', '?v=1', '#frag', '?#iefix'] * len(names))]
+
+        import django
+        from django.conf import settings
+        settings.configure(
+            DEBUG=False, STATIC_URL='/static/', STATIC_ROOT=root,
+            INSTALLED_APPS=['django.contrib.staticfiles'],
+            USE_I18N=False,
+        )
+        django.setup()
+
+        from django.contrib.staticfiles.storage import \
+            ManifestStaticFilesStorage
+        from django_smartstaticfiles.settings import clear_settings_cache
+        from django_smartstaticfiles.storage import \
+            SmartManifestStaticFilesStorage
+
+        calls = len(names) * args.rounds
+        print('%d manifest entries, %d calls' % (args.entries, calls))
+        expected = None
+        for title, storage_class, config in (
+                ('ManifestStaticFilesStorage',
+                 ManifestStaticFilesStorage, {}),
+                ('SmartManifestStaticFilesStorage (no URL cache)',
+                 SmartManifestStaticFilesStorage, {'URL_CACHE_MAX_SIZE': 0}),
+                ('SmartManifestStaticFilesStorage',
+                 SmartManifestStaticFilesStorage, {}),
+        ):
+            settings.SMARTSTATICFILES_CONFIG = config
+            clear_settings_cache()
+            storage = storage_class()
+            urls = [storage.url(name) for name in names]
+            if expected is None:
+                expected = urls
+            assert urls == expected
+
+            def run():
+                url = storage.url
+                for name in names:
+                    url(name)
+
+            seconds = min(timeit.repeat(run, number=args.rounds, repeat=5))
+            print('%-50s %8.2f us/call' % (title, seconds / calls * 1e6))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
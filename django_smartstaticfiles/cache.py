@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+from tempfile import NamedTemporaryFile, mkdtemp
+
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.utils.encoding import force_bytes
+from django.utils.six import itervalues
+
+
+def get_callable_path(func):
+    # Return the dotted path of a callable, e.g. "rjsmin.jsmin"
+    module = getattr(func, '__module__', None) or ''
+    name = getattr(func, '__qualname__', None) or \
+        getattr(func, '__name__', None) or repr(func)
+    return '%s.%s' % (module, name) if module else name
+
+
+class MinifiedContentCache(object):
+    # An on-disk cache of minified content which persists across runs of
+    # collectstatic. Entries are addressed by a hash of the original content
+    # plus the dotted path and keyword arguments of the minifier. The mtime of
+    # an entry is refreshed on every hit, so that the least recently used
+    # entries are evicted first when the cache grows beyond "max_size" bytes.
+    def __init__(self, location, max_size=None):
+        self.location = os.path.abspath(location)
+        self.max_size = max_size
+
+    def make_key(self, content, min_func, min_func_kwargs=None):
+        hasher = hashlib.sha256()
+        hasher.update(force_bytes(get_callable_path(min_func)))
+        hasher.update(b'\0')
+        hasher.update(force_bytes(json.dumps(min_func_kwargs or {},
+                                             sort_keys=True, default=repr)))
+        hasher.update(b'\0')
+        hasher.update(force_bytes(content))
+        return hasher.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.location, key[:2], key)
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            # Mark the entry as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return content
+
+    def set(self, key, content):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        # Write to a temporary file first, so that concurrent readers never
+        # see a partially written entry
+        with NamedTemporaryFile(dir=directory, delete=False) as temp_file:
+            temp_file.write(force_bytes(content))
+        try:
+            os.rename(temp_file.name, path)
+        except OSError:
+            # The entry may already exist on platforms which refuse to
+            # overwrite it (e.g. Windows)
+            os.remove(temp_file.name)
+
+    def get_minified(self, key, with_source_map=False):
+        # Return a tuple of minified content and its source map (None if there
+        # is none), or None if the entry is missing. If "with_source_map" is
+        # True, an entry without a recorded source map is missing as well.
+        content = self.get(key)
+        if content is None:
+            return None
+        if not with_source_map:
+            return content, None
+        source_map = self.get(key + '.map')
+        if source_map is None:
+            return None
+        return content, source_map or None
+
+    def set_minified(self, key, content, source_map=None,
+                     with_source_map=False):
+        self.set(key, content)
+        if with_source_map:
+            # An empty source map records that the minifier returned none
+            self.set(key + '.map', source_map or b'')
+
+    def cull(self):
+        # Evict least recently used entries until the total size of the cache
+        # no longer exceeds "max_size". Returns the number of evicted entries.
+        if not self.max_size or not os.path.isdir(self.location):
+            return 0
+
+        entries = []
+        total_size = 0
+        for dirpath, dirnames, filenames in os.walk(self.location):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        culled = 0
+        if total_size > self.max_size:
+            entries.sort()
+            for mtime, size, path in entries:
+                if total_size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total_size -= size
+                culled += 1
+        return culled
+
+
+class MinifiedContentBuffer(object):
+    # Holds minified content of the current run of collectstatic in memory,
+    # up to "max_size" bytes in total. Content beyond the limit is spilled to
+    # files in a single temporary directory. Set "max_size" to None for no
+    # limit.
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.size = 0
+        self.buffers = {}
+        self.spilled_files = {}
+        self.temp_dir = None
+
+    def __contains__(self, name):
+        return name in self.buffers or name in self.spilled_files
+
+    def __len__(self):
+        return len(self.buffers) + len(self.spilled_files)
+
+    def set(self, name, content):
+        content = force_bytes(content)
+        self.discard(name)
+        if self.max_size is None or \
+                self.size + len(content) <= self.max_size:
+            self.buffers[name] = content
+            self.size += len(content)
+        else:
+            if self.temp_dir is None:
+                self.temp_dir = mkdtemp(prefix='smartstaticfiles-')
+            with NamedTemporaryFile(dir=self.temp_dir,
+                                    delete=False) as temp_file:
+                temp_file.write(content)
+            self.spilled_files[name] = temp_file.name
+
+    def discard(self, name):
+        if name in self.buffers:
+            self.size -= len(self.buffers.pop(name))
+        elif name in self.spilled_files:
+            try:
+                os.remove(self.spilled_files.pop(name))
+            except OSError:
+                pass
+
+    def open(self, name):
+        # Return the content as a file. Content in memory isn't copied.
+        if name in self.buffers:
+            return ContentFile(self.buffers[name])
+        return File(open(self.spilled_files[name], 'rb'))
+
+    def clear(self):
+        # Release all content. Returns paths of deleted spilled files.
+        spilled_paths = list(itervalues(self.spilled_files))
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.size = 0
+        self.buffers = {}
+        self.spilled_files = {}
+        self.temp_dir = None
+        return spilled_paths
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import gzip
+from io import BytesIO
+
+
+def gzip_compress(content):
+    # Use a fixed modification time so that the result is reproducible
+    buf = BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf,
+                       compresslevel=9, mtime=0) as gzip_file:
+        gzip_file.write(content)
+    return buf.getvalue()
+
+
+def brotli_compress(content):
+    import brotli
+    return brotli.compress(content)
+
+
+# Supported formats of precompressed files, mapping to tuples of the file
+# extension and the compression callable
+compressors = {
+    'gzip': ('.gz', gzip_compress),
+    'brotli': ('.br', brotli_compress),
+}
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import functools
+import threading
+from collections import deque
+
+try:
+    import asyncio
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from concurrent.futures import wait as wait_futures
+except ImportError:  # Python 2
+    asyncio = None
+
+# Whether the async I/O engine can be used. It relies on asyncio of Python
+# 3.4.4 or later.
+async_io_available = asyncio is not None and \
+    hasattr(asyncio, 'ensure_future')
+
+
+class IOResult(object):
+    # Result of an operation submitted to AsyncIOEngine, with the interface of
+    # results of multiprocessing.pool.ThreadPool used for writer threads
+    __slots__ = ('future',)
+
+    def __init__(self, future):
+        self.future = future
+
+    def ready(self):
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        wait_futures([self.future], timeout)
+
+    def get(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class AsyncIOEngine(object):
+    # Runs I/O operations of a storage with an asyncio event loop of a
+    # background thread, at most "concurrency" of them at a time, and the rest
+    # in order of submission. Operations are blocking calls which are run in a
+    # pool of threads, and may in turn run native coroutines of the storage
+    # backend in the event loop with run(). They can be submitted from any
+    # thread but the one of the event loop.
+    #
+    # No coroutine syntax is used, so that the module can still be imported
+    # by Python 2.
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self._queue = deque()
+        self._running = 0
+        self._futures = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._thread = threading.Thread(target=self._run_loop,
+                                        name='smartstaticfiles-io')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def apply_async(self, func, args=()):
+        # Run a blocking call in the pool of threads. Same as apply_async() of
+        # multiprocessing.pool.ThreadPool.
+        if self._closed:
+            raise RuntimeError('The async I/O engine is closed')
+        future = Future()
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard_future)
+        self._loop.call_soon_threadsafe(self._enqueue, (future, func, args))
+        return IOResult(future)
+
+    def _discard_future(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _enqueue(self, operation):
+        # Called in the event loop
+        self._queue.append(operation)
+        self._start_operations()
+
+    def _start_operations(self):
+        # Called in the event loop
+        while self._queue and self._running < self.concurrency:
+            future, func, args = self._queue.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                task = self._loop.run_in_executor(None, func, *args)
+            except Exception as exc:
+                # E.g. the pool of threads is shut down on exit
+                future.set_exception(exc)
+                continue
+            self._running += 1
+            task.add_done_callback(functools.partial(self._finish, future))
+
+    def _finish(self, future, task):
+        # Called in the event loop
+        self._running -= 1
+        self._set_result(future, task)
+        self._start_operations()
+
+    @staticmethod
+    def _set_result(future, task):
+        if task.cancelled():
+            future.set_exception(asyncio.CancelledError())
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def run(self, coroutine_func, *args):
+        # Run the coroutine (or another awaitable) returned by
+        # "coroutine_func" in the event loop, and wait for its result. It
+        # isn't counted in the concurrency, since it's called by operations
+        # which are counted (or by the thread which submits them).
+        future = Future()
+
+        def start():
+            try:
+                task = asyncio.ensure_future(coroutine_func(*args),
+                                             loop=self._loop)
+            except Exception as exc:
+                future.set_exception(exc)
+            else:
+                task.add_done_callback(
+                    functools.partial(self._set_result, future))
+
+        self._loop.call_soon_threadsafe(start)
+        return future.result()
+
+    def join(self):
+        # Wait for all submitted operations, including those submitted
+        # meanwhile
+        while True:
+            with self._lock:
+                futures = list(self._futures)
+            if not futures:
+                return
+            wait_futures(futures)
+
+    def close(self):
+        # Wait for all submitted operations, and stop the event loop
+        if self._closed:
+            return
+        self.join()
+        self._closed = True
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        if not self._loop.is_running():
+            # It may be left running if the thread is stopped on exit
+            self._loop.close()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import errno
+import os
+import sys
+
+# Size of buffers for streaming file content
+STREAM_BUFFER_SIZE = 1048576  # 1 MB
+
+# Errors on which a kernel-side copy falls back to the next method
+KERNEL_COPY_UNSUPPORTED_ERRORS = frozenset(
+    getattr(errno, name) for name in (
+        'EBADF', 'EINVAL', 'ENOSYS', 'ENOTSUP', 'EOPNOTSUPP', 'EXDEV',
+    ) if hasattr(errno, name)
+)
+
+
+def _copy_file_range(source_fd, target_fd, offset, count):
+    return os.copy_file_range(source_fd, target_fd, count, offset, offset)
+
+
+def _sendfile(source_fd, target_fd, offset, count):
+    # The target is written at its current position, which follows offset
+    return os.sendfile(target_fd, source_fd, offset, count)
+
+
+# Request of ioctl() on Linux which clones a file by sharing its data blocks,
+# on file systems supporting reflinks (e.g. Btrfs and XFS)
+FICLONE = 0x40049409
+
+kernel_copy_funcs = []
+if hasattr(os, 'copy_file_range'):
+    kernel_copy_funcs.append(_copy_file_range)
+if hasattr(os, 'sendfile'):
+    kernel_copy_funcs.append(_sendfile)
+
+
+def default_file_mode():
+    # Mode of files created by open() under the current umask, for
+    # temporary files (created with 0600) which are renamed into place
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def hash_file(hasher, f, buf):
+    # Feed the content of a real file to the hasher through a reusable
+    # buffer (a bytearray), without allocating memory for each chunk
+    view = memoryview(buf)
+    f.seek(0)
+    while True:
+        size = f.readinto(buf)
+        if not size:
+            break
+        hasher.update(view[:size])
+
+
+def hash_copy_file(hasher, source, target, buf):
+    # Feed the content of a real file to the hasher while copying it to
+    # another one through a reusable buffer, so that it's read only once.
+    # Returns the number of bytes copied.
+    view = memoryview(buf)
+    copied = 0
+    source.seek(0)
+    while True:
+        count = source.readinto(buf)
+        if not count:
+            break
+        hasher.update(view[:count])
+        target.write(view[:count])
+        copied += count
+    target.flush()
+    return copied
+
+
+def copy_file(source, target, buf=None):
+    # Copy the content of a real file to another empty one. The content is
+    # copied inside the kernel if possible (copy_file_range or sendfile),
+    # otherwise through a fixed-size buffer. Returns the number of bytes
+    # copied.
+    source_fd = source.fileno()
+    target_fd = target.fileno()
+    size = os.fstat(source_fd).st_size
+    target.flush()
+
+    for kernel_copy in kernel_copy_funcs:
+        copied = 0
+        try:
+            while copied < size:
+                count = kernel_copy(source_fd, target_fd, copied,
+                                    size - copied)
+                if not count:
+                    # The source is truncated meanwhile
+                    break
+                copied += count
+        except OSError as err:
+            if copied or err.errno not in KERNEL_COPY_UNSUPPORTED_ERRORS:
+                raise
+            continue
+        return copied
+
+    if buf is None:
+        buf = bytearray(STREAM_BUFFER_SIZE)
+    view = memoryview(buf)
+    copied = 0
+    source.seek(0)
+    while True:
+        count = source.readinto(buf)
+        if not count:
+            break
+        target.write(view[:count])
+        copied += count
+    target.flush()
+    return copied
+
+
+def clone_file(source, target):
+    # Clone the content of a real file to another empty one as a reflink.
+    # Raises OSError or IOError if it isn't supported.
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported')
+    import fcntl
+    fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
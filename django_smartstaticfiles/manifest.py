@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import mmap
+import os
+import struct
+from tempfile import NamedTemporaryFile
+
+from django.utils.six import iteritems
+
+from .files import default_file_mode
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+# Layout of a compact manifest:
+#   header: magic (8 bytes), number of entries (uint32)
+#   offsets: (number of entries + 1) uint32 offsets of records from the start
+#            of the file, the last one being the end of the last record
+#   records: UTF-8 encoded "<key>\0<value>", sorted by key in bytes
+COMPACT_MANIFEST_MAGIC = b'SSFIDX01'
+HEADER = struct.Struct(str('<8sI'))
+OFFSET = struct.Struct(str('<I'))
+
+
+def write_compact_manifest(path, hashed_files, permissions_mode=None):
+    # Write a mapping of hash keys to hashed names as a compact manifest. The
+    # file is written to a temporary file first, and then renamed, so that
+    # readers never see a partially written file.
+    records = sorted(
+        (key.encode('utf-8'), value.encode('utf-8'))
+        for key, value in iteritems(hashed_files)
+    )
+    offset = HEADER.size + OFFSET.size * (len(records) + 1)
+    offsets = []
+    for key, value in records:
+        offsets.append(offset)
+        offset += len(key) + 1 + len(value)
+    offsets.append(offset)
+
+    if permissions_mode is None:
+        permissions_mode = default_file_mode()
+
+    directory = os.path.dirname(path)
+    temp_file = NamedTemporaryFile(dir=directory, delete=False)
+    try:
+        with temp_file:
+            temp_file.write(HEADER.pack(COMPACT_MANIFEST_MAGIC, len(records)))
+            temp_file.write(
+                b''.join(OFFSET.pack(offset) for offset in offsets))
+            for key, value in records:
+                temp_file.write(key + b'\0' + value)
+        os.chmod(temp_file.name, permissions_mode)
+        try:
+            os.rename(temp_file.name, path)
+        except OSError:
+            # The target can't be overwritten on some platforms (e.g.
+            # Windows)
+            os.remove(path)
+            os.rename(temp_file.name, path)
+    except Exception:
+        if os.path.exists(temp_file.name):
+            os.remove(temp_file.name)
+        raise
+
+
+class CompactManifest(Mapping):
+    # A read-only mapping of hash keys to hashed names over a memory-mapped
+    # compact manifest. Entries are looked up by binary search without
+    # loading the whole manifest, and pages of the file are shared between
+    # processes.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._mmap, 0)
+        if magic != COMPACT_MANIFEST_MAGIC or \
+                len(self._mmap) < self._offset(self._count):
+            self._mmap.close()
+            raise ValueError("Invalid compact manifest '%s'" % path)
+
+    def _offset(self, i):
+        return OFFSET.unpack_from(self._mmap, HEADER.size + OFFSET.size * i)[0]
+
+    def _record(self, i):
+        record = self._mmap[self._offset(i):self._offset(i + 1)]
+        key, value = record.split(b'\0', 1)
+        return key, value
+
+    def _key(self, i):
+        start = self._offset(i)
+        return self._mmap[start:self._mmap.find(b'\0', start)]
+
+    def _find(self, key):
+        # Return the index of the entry of the key, or -1 if it's missing
+        key = key.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._key(low) == key:
+            return low
+        return -1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._record(i)[1].decode('utf-8')
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._key(i).decode('utf-8')
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        self._mmap.close()
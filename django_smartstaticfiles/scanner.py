@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import re
+
+from django.utils.encoding import force_bytes
+
+# Characters which end the literal prefix of a regular expression
+REGEX_META_CHARS = '.^$*+?{}[]|()'
+
+# Patterns which can't be wrapped in a group and combined with others
+RE_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def get_literal_prefix(pattern):
+    # Return the literal text which every match of the regular expression
+    # (a string) starts with. Returns an empty string if it can't be told.
+    if '|' in pattern:
+        # Alternatives may start with different text
+        return ''
+
+    i = 0
+    # Skip opening capturing groups
+    while i < len(pattern) and pattern[i] == '(' and \
+            not pattern.startswith('(?', i):
+        i += 1
+
+    literal = []
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if not escaped or escaped.isalnum():
+                # A character class such as \s, or a backreference
+                break
+            literal.append(escaped)
+            i += 2
+        elif char in REGEX_META_CHARS:
+            break
+        else:
+            literal.append(char)
+            i += 1
+
+    if literal and i < len(pattern) and pattern[i] in '*?{':
+        # The last character is optional
+        literal.pop()
+    return ''.join(literal)
+
+
+class SubMatchObj(object):
+    # A duck-typed match object for a single pattern in a combined pattern
+    def __init__(self, groups):
+        self._groups = groups
+
+    def groups(self):
+        return self._groups
+
+
+class CombinedPattern(object):
+    # Combines a list of (compiled pattern, template) tuples into a single
+    # alternation regular expression, so that content is scanned only once
+    # instead of once per pattern. A match is dispatched to the converter of
+    # the pattern which matched, with the groups of that pattern only.
+    def __init__(self, patterns, encoding='utf-8'):
+        self.patterns = list(patterns)
+        self.regex = None
+        # Group index of each wrapped pattern -> (index of pattern, slice of
+        # groups of the pattern)
+        self.dispatch_table = {}
+        self.literals = None
+
+        flags = set(pattern.flags for pattern, template in self.patterns)
+        if len(self.patterns) > 1 and len(flags) == 1 and not any(
+                pattern.groupindex or
+                RE_BACKREFERENCE.search(pattern.pattern)
+                for pattern, template in self.patterns):
+            parts = []
+            group_index = 1
+            for i, (pattern, template) in enumerate(self.patterns):
+                parts.append('(%s)' % pattern.pattern)
+                self.dispatch_table[group_index] = (
+                    i, slice(group_index, group_index + pattern.groups)
+                )
+                group_index += 1 + pattern.groups
+            try:
+                self.regex = re.compile('|'.join(parts), flags.pop())
+            except re.error:
+                self.regex = None
+
+        literals = [get_literal_prefix(pattern.pattern)
+                    for pattern, template in self.patterns]
+        if literals and all(literals):
+            self.ignore_case = any(pattern.flags & re.IGNORECASE
+                                   for pattern, template in self.patterns)
+            if self.ignore_case:
+                literals = [literal.lower() for literal in literals]
+            self.literals = [force_bytes(literal, encoding)
+                             for literal in literals]
+
+    def may_match(self, content):
+        # Cheaply tell whether the raw bytes of the content may contain a
+        # match, without decoding and scanning it
+        if self.literals is None:
+            return True
+        if self.ignore_case:
+            content = content.lower()
+        return any(literal in content for literal in self.literals)
+
+    def subn(self, make_converter, content):
+        # Return a tuple of the new content and the number of substitutions.
+        # "make_converter" is called with the template of each pattern, and
+        # should return a converter for matches of that pattern.
+        converters = [make_converter(template)
+                      for pattern, template in self.patterns]
+
+        if self.regex is None:
+            # Fall back to one pass per pattern
+            total = 0
+            for (pattern, template), converter in zip(self.patterns,
+                                                      converters):
+                content, num_sub = pattern.subn(converter, content)
+                total += num_sub
+            return content, total
+
+        dispatch_table = self.dispatch_table
+
+        def converter(matchobj):
+            i, group_slice = dispatch_table[matchobj.lastindex]
+            groups = matchobj.groups()[group_slice]
+            return converters[i](SubMatchObj(groups))
+
+        return self.regex.subn(converter, content)
@@ -1,14 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import fnmatch
+import hashlib
 import re
+from importlib import import_module
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.core.signals import setting_changed
+from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
+from django.utils import six
 from django.utils.six import iteritems, iterkeys
 
+from .compressors import compressors
+from .engine import async_io_available
+
 settings_attr = 'SMARTSTATICFILES_CONFIG'
 
 settings_defaults = {
@@ -57,23 +65,220 @@ settings_defaults = {
         'keep_bang_comments': True,
     },
 
+    # Number of worker processes used to minify JavaScript and CSS files in
+    # parallel. If it's greater than 1, files being copied are minified in a
+    # process pool while collectstatic goes on, and saved once they're
+    # minified (before post-processing starts, or before collectstatic exits
+    # with "--no-post-process"). Minifiable files which aren't copied again
+    # (e.g. unmodified files) are minified in the pool at the beginning of
+    # post-processing. Set it to None or 0 to disable parallel minification.
+    'MIN_WORKERS': None,
+
+    # Maximum size in bytes of minified content kept in memory during a run of
+    # collectstatic. Content beyond the limit is written to temporary files.
+    # Set it to None for no limit.
+    'MIN_BUFFER_MAX_SIZE': 64 * 1024 * 1024,
+
+    # Path of a directory for caching minified content across runs of
+    # collectstatic. Cached content is looked up by a hash of the original
+    # content plus the dotted path and keyword arguments of the minification
+    # callable. Set it to None to disable the cache.
+    'MIN_CACHE_DIR': None,
+
+    # Maximum size in bytes of the minification cache directory. The least
+    # recently used content is evicted at the end of post-processing when the
+    # size is exceeded. Set it to None for no limit.
+    'MIN_CACHE_MAX_SIZE': 100 * 1024 * 1024,
+
     # A regular expression (case-sensitive by default) which is used to
     # search against assets (in relative URL without STATIC_URL prefix). The
     # mathced assets won't be minified. Set it to None to ignore no assets.
     # (Assets with .min.js or .min.css extensions are always ignored.)
     'RE_IGNORE_MIN': None,
 
+    # Whether to save source maps generated by minification. If it's True, the
+    # callables for JavaScript and CSS minification may return a tuple of the
+    # minified content and its source map (a string, or a dict which is
+    # serialized as JSON) instead of the minified content only. The source map
+    # of "app.js" is saved as hashed "app.js.map" (e.g.
+    # "app.js.4c1f5d1e8b2a.map"), and a "sourceMappingURL" comment referencing
+    # it is substituted in the minified content, along with other URLs. Notice
+    # that "sourceMappingURL" comments of all JavaScript and CSS files are
+    # substituted then, and those referencing missing source maps are kept
+    # as is.
+    'SOURCE_MAPS_ENABLED': False,
+
     # Whether to enable deletion of unhashed files.
     'DELETE_UNHASHED_ENABLED': True,
 
     # Whether to enable deletion of intermediate hashed files.
     'DELETE_INTERMEDIATE_ENABLED': True,
 
+    # Whether to list all files in the target storage once at the beginning of
+    # post-processing, and answer existence checks from the list instead of
+    # querying the storage for each file. This saves a lot of requests with
+    # remote storage backends (e.g. Amazon S3).
+    'EXISTS_CACHE_ENABLED': False,
+
+    # Number of threads used to save hashed files to the target storage
+    # concurrently while other files are being hashed. This hides most of the
+    # latency of remote storage backends. Set it to None or 0 to save files one
+    # by one.
+    'SAVE_WORKERS': None,
+
+    # Whether to run I/O of post-processing against the target storage in an
+    # asyncio event loop of a background thread (Python 3.4.4 or later).
+    # Hashed files are saved, source files are read and hashed, existence of
+    # their hashed names is checked ahead of processing, and files are
+    # deleted concurrently, up to "ASYNC_IO_CONCURRENCY" operations at a time.
+    # Native coroutine methods of the storage backend ("async_exists(name)",
+    # "async_save(name, content)" and "async_delete(name)") are used if it
+    # provides them, otherwise blocking methods are run in a pool of threads.
+    # "SAVE_WORKERS" is ignored if it's enabled.
+    'ASYNC_IO_ENABLED': False,
+
+    # Maximum number of concurrent I/O operations if "ASYNC_IO_ENABLED" is
+    # True.
+    'ASYNC_IO_CONCURRENCY': 16,
+
+    # How large files (which aren't read into memory) are copied to their
+    # hashed names when both the source and the target storage are in the local
+    # file system, and the target storage doesn't override _save() of
+    # FileSystemStorage. "copy" copies them to temporary files through a
+    # fixed-size buffer while hashing them, so that they're read only once,
+    # or copies them inside the kernel if possible (copy_file_range or
+    # sendfile) after hashing them if their hashed files of the previous run
+    # exist. "hardlink" creates hard links to source files instead, and falls
+    # back to "copy" (e.g. across file systems). Notice that a hard-linked
+    # file changes along with its source file. Set it to None to save them
+    # through the storage as other files.
+    'LOCAL_COPY_METHOD': 'copy',
+
+    # Whether to store identical content of hashed files only once while
+    # post-processing. A hashed file with the same content as a file saved
+    # earlier in the run is linked to it as specified by "DEDUP_LINK_METHOD"
+    # when the storage is in the local file system, or copied with the
+    # "copy(name, new_name)" method of the storage backend if it provides one
+    # (e.g. a server-side copy of a remote storage). Otherwise it's saved as
+    # usual.
+    'DEDUP_ENABLED': False,
+
+    # How duplicate files are linked in the local file system. "hardlink"
+    # creates hard links, "reflink" creates clones sharing data blocks on file
+    # systems which support them (e.g. Btrfs and XFS on Linux), and "symlink"
+    # creates relative symbolic links. Files are copied instead if linking
+    # fails. Notice that hard-linked files change along with each other.
+    'DEDUP_LINK_METHOD': 'hardlink',
+
     # A regular expression (case-sensitive by default) which is used to
     # search against assets (in relative URL without STATIC_URL prefix). The
     # matched assets won't be hashed. Set it to None to ignore no assets.
     'RE_IGNORE_HASHING': None,
 
+    # Hash algorithm used for hashing file content. Either the name of an
+    # algorithm provided by hashlib (e.g. "md5", "sha1" or "blake2b"), or a
+    # dotted string of the module path and a callable which returns a new
+    # hash object (e.g. "xxhash.xxh64"). The first 12 characters of the hex
+    # digest are used in hashed file names.
+    'HASH_ALGORITHM': 'md5',
+
+    # Whether to enable incremental post-processing. If enabled, a file is
+    # skipped if neither itself nor any file it references (transitively) has
+    # changed since the previous run, and its hashed name in the previous
+    # manifest is reused. Changes are detected with an index file saved
+    # alongside the manifest, which records the modification time, size and
+    # content hash of each source file.
+    'INCREMENTAL_ENABLED': False,
+
+    # Whether to write a compact manifest ("staticfiles.json.idx") alongside
+    # "staticfiles.json", and load it instead when available. The compact
+    # manifest is memory-mapped and looked up by binary search, so it isn't
+    # loaded as a whole on startup, and its pages are shared between processes.
+    # Only available when the storage is in the local file system.
+    'COMPACT_MANIFEST_ENABLED': False,
+
+    # Maximum number of URLs resolved by "url()" of the storage (e.g. for the
+    # "static" template tag) to be cached in each process. The least recently
+    # used URL is evicted when it's full. Set it to None for no limit, or 0 to disable the
+    # cache. URLs are never cached when DEBUG is True.
+    'URL_CACHE_MAX_SIZE': 10000,
+
+    # Interval in seconds of checking whether the manifest has changed (e.g.
+    # by a new deployment) in long-running processes. The manifest is loaded
+    # on first use of the storage, and then its modification time and size
+    # are checked at most once per interval when URLs are resolved. It's
+    # reloaded only if they have changed. Set it to None to never reload the
+    # manifest.
+    'MANIFEST_RELOAD_INTERVAL': None,
+
+    # Name of a JSON file which is written next to the manifest (e.g.
+    # "staticfiles.preload.json"), or None for no file. It maps the hashed
+    # name of each CSS and JavaScript file to hashed names of files it
+    # references transitively (e.g. imported stylesheets, images and fonts),
+    # nearest first. They can be looked up with "preload_urls(name)" of the
+    # storage, e.g. for "Link: rel=preload" headers or 103 Early Hints.
+    'PRELOAD_MANIFEST_NAME': None,
+
+    # Interval in seconds of saving a checkpoint of post-processing (hashed
+    # names of completed files, intermediate files and files ignored for
+    # hashing) to "staticfiles.checkpoint.json" in the target storage. If
+    # collectstatic is interrupted, the next run with the same source files
+    # and settings resumes from the checkpoint: completed files are skipped if
+    # their hashed files still exist. The manifest is written and unhashed and
+    # intermediate files are deleted only once all files are done, and then
+    # the checkpoint is deleted. Source files must be in the local file
+    # system. Set it to None to disable checkpoints.
+    'CHECKPOINT_INTERVAL': None,
+
+    # Number of shards for post-processing in multiple processes or on
+    # multiple build nodes against the same target storage. Run collectstatic
+    # once per shard with "SHARD_INDEX" from 0 to "SHARD_COUNT" - 1: each
+    # shard run copies its share of files, processes its share of
+    # non-adjustable files, and writes a partial manifest. Then run
+    # collectstatic once more with "SHARD_INDEX" set to None to merge partial
+    # manifests, process adjustable files, write the manifest and delete
+    # unhashed and intermediate files. Note that the storage of a shard run
+    # skips files of other shards silently, so collectstatic still reports
+    # them as copied. Set it to None to disable sharding.
+    'SHARD_COUNT': None,
+
+    # Index of the shard of a shard run, or None for the merge run.
+    'SHARD_INDEX': None,
+
+    # Whether to collect statistics of post-processing: wall time per stage,
+    # bytes read and written, calls of storage methods, and the slowest files.
+    # They are sent with the "post_process_stats" signal of
+    # "django_smartstaticfiles.stats" at the end of post-processing.
+    'STATS_ENABLED': False,
+
+    # Number of the slowest files in statistics.
+    'STATS_TOP_FILES': 10,
+
+    # Name of a JSON report of statistics which is written next to the manifest
+    # (e.g. "staticfiles.stats.json"), or None for no report. This is
+    # effective only if "STATS_ENABLED" is set to True.
+    'STATS_REPORT_NAME': None,
+
+    # Formats of precompressed files which are created alongside each saved
+    # hashed file, for serving by web servers (e.g. gzip_static and
+    # brotli_static of nginx). Possible formats are "gzip" (".gz" files) and
+    # "brotli" (".br" files, requires the "brotli" package). A precompressed
+    # file is skipped if it isn't smaller than the original, which is recorded
+    # in the manifest, so it isn't tried again until the file changes. Set it
+    # to an empty list or None to disable precompression.
+    'PRECOMPRESS_FORMATS': [],
+
+    # File patterns for matching assets to be precompressed (in relative URL
+    # without STATIC_URL prefix)
+    'PRECOMPRESS_FILE_PATTERNS': [
+        '*.css', '*.js', '*.map', '*.json', '*.svg', '*.html', '*.xml', '*.txt',
+        '*.ico', '*.eot', '*.ttf', '*.otf',
+    ],
+
+    # Number of threads used for precompression. Set it to None or 0 to
+    # compress files one by one.
+    'PRECOMPRESS_WORKERS': None,
+
     # Whether to enable JavaScript asset URLs replacement.
     'JS_ASSETS_REPL_ENABLED': False,
 
@@ -88,11 +293,65 @@ settings_defaults = {
     'JS_ASSETS_REPL_TRAILING_FIX': False,
 }
 
+# Patterns and templates of "sourceMappingURL" comments in JavaScript and CSS,
+# which are substituted if "SOURCE_MAPS_ENABLED" is True
+source_map_patterns = (
+    ("*.js", (
+        (r"""(//# sourceMappingURL=([^\s'"]+))""",
+         """//# sourceMappingURL=%s"""),
+    )),
+    ("*.css", (
+        (r"""(/\*# sourceMappingURL=([^\s*]+)\s*\*/)""",
+         """/*# sourceMappingURL=%s */"""),
+    )),
+)
+
 settings_cache = None
+settings_config = None
+
+
+def compile_file_patterns(patterns):
+    # Compile glob-style file patterns into a single regular expression, and
+    # return its match method. The result is the same as matches_patterns()
+    # of django.contrib.staticfiles.utils, without a pass per pattern.
+    patterns = list(patterns or ())
+    if not patterns:
+        return lambda path: None
+    return re.compile('|'.join('(?:%s)' % fnmatch.translate(pattern)
+                               for pattern in patterns)).match
+
+
+# Attributes of matchers in SettingsConfig, and keys of file patterns which
+# they are compiled from
+file_matcher_keys = {
+    'js_file_matcher': 'JS_FILE_PATTERNS',
+    'css_file_matcher': 'CSS_FILE_PATTERNS',
+    'precompress_file_matcher': 'PRECOMPRESS_FILE_PATTERNS',
+}
+
+
+class SettingsConfig(object):
+    # A read-only snapshot of the settings, with an attribute per lower-cased
+    # key of settings_defaults, plus matchers compiled from file patterns
+    __slots__ = tuple(str(key.lower()) for key in settings_defaults) + \
+        tuple(str(attr) for attr in file_matcher_keys)
+
+    def __init__(self, settings_dict):
+        for key in settings_defaults:
+            object.__setattr__(self, key.lower(), settings_dict[key])
+        for attr, key in iteritems(file_matcher_keys):
+            object.__setattr__(self, attr,
+                               compile_file_patterns(settings_dict[key]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("can't set attribute '%s' of settings" % name)
+
+    def __delattr__(self, name):
+        raise AttributeError("can't delete attribute '%s' of settings" % name)
 
 
 def setup_settings_cache():
-    global settings_cache
+    global settings_cache, settings_config
     if settings_cache is None:
         try:
             _settings = getattr(settings, settings_attr)
@@ -115,6 +374,99 @@ def setup_settings_cache():
         if settings_cache['CSS_MIN_ENABLED']:
             settings_cache['CSS_MIN_FUNC'] = \
                 import_string(settings_cache['CSS_MIN_FUNC'])
+        # Validate numbers of workers
+        for key in ('MIN_WORKERS', 'SAVE_WORKERS', 'PRECOMPRESS_WORKERS'):
+            workers = settings_cache[key]
+            if workers is not None and (
+                    isinstance(workers, bool) or
+                    not isinstance(workers, six.integer_types) or
+                    workers < 0):
+                raise ImproperlyConfigured(
+                    'key "%s" in setting "%s" must be None or a '
+                    'non-negative integer' % (key, settings_attr)
+                )
+        # Validate the async I/O engine
+        concurrency = settings_cache['ASYNC_IO_CONCURRENCY']
+        if isinstance(concurrency, bool) or \
+                not isinstance(concurrency, six.integer_types) or \
+                concurrency < 1:
+            raise ImproperlyConfigured(
+                'key "ASYNC_IO_CONCURRENCY" in setting "%s" must be a '
+                'positive integer' % settings_attr
+            )
+        if settings_cache['ASYNC_IO_ENABLED'] and not async_io_available:
+            raise ImproperlyConfigured(
+                'key "ASYNC_IO_ENABLED" in setting "%s" requires Python 3.4.4 '
+                'or later' % settings_attr
+            )
+        # Validate sharding
+        shard_count = settings_cache['SHARD_COUNT']
+        shard_index = settings_cache['SHARD_INDEX']
+        if shard_count is not None and (
+                isinstance(shard_count, bool) or
+                not isinstance(shard_count, six.integer_types) or
+                shard_count < 1):
+            raise ImproperlyConfigured(
+                'key "SHARD_COUNT" in setting "%s" must be None or a '
+                'positive integer' % settings_attr
+            )
+        if shard_index is not None and (
+                shard_count is None or
+                isinstance(shard_index, bool) or
+                not isinstance(shard_index, six.integer_types) or
+                not 0 <= shard_index < shard_count):
+            raise ImproperlyConfigured(
+                'key "SHARD_INDEX" in setting "%s" must be None, or an '
+                'integer from 0 to "SHARD_COUNT" - 1' % settings_attr
+            )
+        # Validate intervals
+        for key in ('MANIFEST_RELOAD_INTERVAL', 'CHECKPOINT_INTERVAL'):
+            interval = settings_cache[key]
+            if interval is not None and (
+                    isinstance(interval, bool) or
+                    not isinstance(interval, six.integer_types + (float,)) or
+                    interval < 0):
+                raise ImproperlyConfigured(
+                    'key "%s" in setting "%s" must be None or a non-negative '
+                    'number' % (key, settings_attr)
+                )
+        if settings_cache['LOCAL_COPY_METHOD'] not in (None, 'copy',
+                                                       'hardlink'):
+            raise ImproperlyConfigured(
+                'key "LOCAL_COPY_METHOD" in setting "%s" must be None, '
+                '"copy" or "hardlink"' % settings_attr
+            )
+        if settings_cache['DEDUP_LINK_METHOD'] not in ('hardlink', 'reflink',
+                                                       'symlink'):
+            raise ImproperlyConfigured(
+                'key "DEDUP_LINK_METHOD" in setting "%s" must be "hardlink", '
+                '"reflink" or "symlink"' % settings_attr
+            )
+        # Validate formats of precompressed files
+        for compress_format in settings_cache['PRECOMPRESS_FORMATS'] or ():
+            if compress_format not in compressors:
+                raise ImproperlyConfigured(
+                    'key "PRECOMPRESS_FORMATS" in setting "%s" contains an '
+                    'unknown format "%s"' % (settings_attr, compress_format)
+                )
+            if compress_format == 'brotli':
+                try:
+                    import_module('brotli')
+                except ImportError:
+                    raise ImproperlyConfigured(
+                        'the "brotli" package is required by "brotli" format '
+                        'in key "PRECOMPRESS_FORMATS" of setting "%s"'
+                        % settings_attr
+                    )
+        # Import hash algorithm from dotted string if it isn't provided by
+        # hashlib
+        hash_algorithm = settings_cache['HASH_ALGORITHM']
+        if isinstance(hash_algorithm, six.string_types):
+            try:
+                hashlib.new(hash_algorithm)
+            except ValueError:
+                settings_cache['HASH_ALGORITHM'] = \
+                    import_string(hash_algorithm)
         # Compile possible regular expressions
         regex_keys_to_cache = ['RE_IGNORE_HASHING']
         if settings_cache['JS_MIN_ENABLED'] or settings_cache['CSS_MIN_ENABLED']:
@@ -131,11 +483,13 @@ def setup_settings_cache():
                     )
             elif regex is not None:
                 settings_cache[key] = None
+        settings_config = SettingsConfig(settings_cache)
 
 
 def clear_settings_cache():
-    global settings_cache
+    global settings_cache, settings_config
     settings_cache = None
+    settings_config = None
 
 
 def get_cached_setting_key(key):
@@ -143,6 +497,11 @@ def get_cached_setting_key(key):
     return settings_cache[key]
 
 
+def get_settings_config():
+    setup_settings_cache()
+    return settings_config
+
+
 def settings_changed_handler(setting, **kwargs):
     if setting == settings_attr:
         clear_settings_cache()
@@ -153,10 +512,24 @@ setting_changed.connect(settings_changed_handler)
 
 class CachedSettingsMixin(object):
     def __init__(self, *args, **kwargs):
+        setting_changed.connect(self._clear_settings_config)
         self.update_patterns()
         super(CachedSettingsMixin, self).__init__(*args, **kwargs)
 
+    @cached_property
+    def config(self):
+        # The settings materialized once for this instance. Read it into a
+        # local variable in loops instead of accessing properties below.
+        return get_settings_config()
+
+    def _clear_settings_config(self, setting, **kwargs):
+        if setting == settings_attr:
+            self.__dict__.pop('config', None)
+
     def update_patterns(self):
+        if self.source_maps_enabled:
+            self.patterns += source_map_patterns
+
         if not self.js_assets_repl_enabled:
             return
 
@@ -173,9 +546,10 @@ class CachedSettingsMixin(object):
 class SettingProxy(object):
     def __init__(self, key):
         self.key = key
+        self.attr = key.lower()
 
     def __call__(self, instance):
-        return get_cached_setting_key(self.key)
+        return getattr(instance.config, self.attr)
 
 
 # Dynamically create properties, whose names are lower-cased keys of
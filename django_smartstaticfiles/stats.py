@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import heapq
+import threading
+from operator import itemgetter
+from timeit import default_timer
+
+from django.dispatch import Signal
+from django.utils.six import iteritems
+
+# Sent at the end of post-processing if "STATS_ENABLED" is True. "stats" is
+# the dict returned by PostProcessStats.as_dict().
+post_process_stats = Signal(providing_args=['storage', 'stats'])
+
+
+class NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullStats(object):
+    # Collects nothing, so that instrumentation costs next to nothing when
+    # statistics are disabled
+    enabled = False
+
+    _null_stage = NullStage()
+
+    def stage(self, name):
+        return self._null_stage
+
+    def count_call(self, name):
+        pass
+
+    def add_read(self, size):
+        pass
+
+    def add_written(self, size):
+        pass
+
+    def add_deduplicated(self, size):
+        pass
+
+    def add_file_time(self, name, seconds):
+        pass
+
+
+null_stats = NullStats()
+
+
+class Stage(object):
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_stage_time(self.name, default_timer() - self.start)
+        return False
+
+
+class PostProcessStats(object):
+    # Wall time per stage, bytes read and written, calls of storage methods
+    # and the slowest files of a run of post-processing. Stages may be nested
+    # (e.g. "exists" checks while saving), and their times are summed over
+    # threads. Safe to be updated from writer threads.
+    enabled = True
+
+    def __init__(self, top_files=10):
+        self.top_files = top_files
+        self.started = default_timer()
+        self.finished = None
+        self.stages = {}
+        self.calls = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.deduplicated_files = 0
+        self.deduplicated_bytes = 0
+        self.file_times = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def add_stage_time(self, name, seconds):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [seconds, 1]
+            else:
+                stage[0] += seconds
+                stage[1] += 1
+
+    def count_call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add_read(self, size):
+        with self._lock:
+            self.bytes_read += size
+
+    def add_written(self, size):
+        with self._lock:
+            self.bytes_written += size
+
+    def add_deduplicated(self, size):
+        # A file stored by linking or copying a file with the same content
+        with self._lock:
+            self.deduplicated_files += 1
+            self.deduplicated_bytes += size
+
+    def add_file_time(self, name, seconds):
+        # Times of the same file in multiple passes are summed
+        with self._lock:
+            self.file_times[name] = self.file_times.get(name, 0) + seconds
+
+    def finish(self):
+        self.finished = default_timer()
+
+    def as_dict(self):
+        finished = self.finished if self.finished is not None \
+            else default_timer()
+        slowest_files = heapq.nlargest(self.top_files,
+                                       iteritems(self.file_times),
+                                       key=itemgetter(1))
+        return {
+            'seconds': finished - self.started,
+            'stages': dict(
+                (name, {'seconds': seconds, 'count': count})
+                for name, (seconds, count) in iteritems(self.stages)
+            ),
+            'storage_calls': dict(self.calls),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'deduplicated_files': self.deduplicated_files,
+            'deduplicated_bytes': self.deduplicated_bytes,
+            'slowest_files': [{'name': name, 'seconds': seconds}
+                              for name, seconds in slowest_files],
+        }
@@ -1,28 +1,62 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, absolute_import
 
+import atexit
 import os
+import errno
+import hashlib
+import json
 import logging
 import posixpath
 import re
-from tempfile import NamedTemporaryFile
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict, deque
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.core.files import File
 from django.core.files.base import ContentFile
 from django.core.files.storage import FileSystemStorage
 from django.utils.encoding import force_bytes, force_text
-from django.utils.six import iteritems, itervalues, iterkeys
-from django.contrib.staticfiles.utils import matches_patterns
+from django.utils.six import iteritems, iterkeys, itervalues
+from django.utils.six.moves.urllib.parse import urlsplit
 from django.contrib.staticfiles.storage import (
     HashedFilesMixin, ManifestFilesMixin, StaticFilesStorage,
 )
 
-from .settings import CachedSettingsMixin
+from . import __version__
+from .cache import MinifiedContentBuffer, MinifiedContentCache
+from .compressors import compressors
+from .engine import AsyncIOEngine
+from .files import (
+    STREAM_BUFFER_SIZE, clone_file, copy_file, default_file_mode,
+    hash_copy_file, hash_file,
+)
+from .manifest import CompactManifest, write_compact_manifest
+from .scanner import CombinedPattern
+from .stats import PostProcessStats, null_stats, post_process_stats
+from .settings import (
+    CachedSettingsMixin, compile_file_patterns, settings_attr,
+    source_map_patterns,
+)
 
 logger = logging.getLogger(__name__)
 
+# Templates of substituted "sourceMappingURL" comments
+source_map_templates = frozenset(
+    template for extension, patterns in source_map_patterns
+    for pattern, template in patterns
+)
+
+# A "sourceMappingURL" comment at the end of minified content
+re_trailing_source_map_url = re.compile(
+    br'(?://[#@] sourceMappingURL=\S*|/\*[#@] sourceMappingURL=[^*]*\*/)\s*$'
+)
+
 
 class DuckTypedMatchObj(object):
     def __init__(self, matched, url):
@@ -33,20 +67,398 @@ class DuckTypedMatchObj(object):
         return self.matched, self.url
 
 
+def split_minified(result, source_maps_enabled=False):
+    # Split the result of a minifier into minified content and its source map
+    # (None unless source maps are enabled). Minifiers return either the
+    # content, or a tuple of the content and a source map (a string or a
+    # dict).
+    if isinstance(result, tuple):
+        content, source_map = result
+    else:
+        content, source_map = result, None
+    if source_map is None or not source_maps_enabled:
+        return force_bytes(content), None
+    if isinstance(source_map, dict):
+        source_map = json.dumps(source_map, separators=(',', ':'))
+    return force_bytes(content), force_bytes(source_map)
+
+
+def _minify_job(job):
+    # Run in a worker process of SmartManifestFilesMixin.minify_paths() or
+    # SmartManifestFilesMixin.submit_minified_copy()
+    min_func, min_func_kwargs, content, source_maps_enabled = job
+    return split_minified(min_func(content, **min_func_kwargs),
+                          source_maps_enabled)
+
+
+def sort_by_path_level(names):
+    # Sort the files by directory level, deepest first
+    def path_level(name):
+        return len(name.split(os.sep))
+
+    return sorted(names, key=path_level, reverse=True)
+
+
+def sort_topologically(graph):
+    # Sort nodes of a graph (an ordered dict which maps a node to nodes it
+    # depends on) so that every node comes after its dependencies. Edges to
+    # nodes not in the graph are ignored. Raises ValueError on cycles.
+    order = []
+    visiting = set()
+    visited = set()
+    for root in graph:
+        if root in visited:
+            continue
+        path = [root]
+        stack = [iter(sorted(graph[root]))]
+        visiting.add(root)
+        while stack:
+            for node in stack[-1]:
+                if node not in graph or node in visited:
+                    continue
+                if node in visiting:
+                    cycle = path[path.index(node):] + [node]
+                    raise ValueError('Circular references between files: %s'
+                                     % ' -> '.join(cycle))
+                visiting.add(node)
+                path.append(node)
+                stack.append(iter(sorted(graph[node])))
+                break
+            else:
+                stack.pop()
+                node = path.pop()
+                visiting.discard(node)
+                visited.add(node)
+                order.append(node)
+    return order
+
+
+def get_content_bytes(content):
+    # Return the bytes of content in memory without moving its position, or
+    # None if it isn't in memory
+    if not isinstance(content, ContentFile):
+        return None
+    return force_bytes(content.file.getvalue())
+
+
+class DigestedContentFile(ContentFile):
+    # In-memory content of a file which remembers the key of its digest in
+    # the digest cache
+    def __init__(self, content, digest_key=None, name=None):
+        super(DigestedContentFile, self).__init__(content, name)
+        self.digest_key = digest_key
+
+
 class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
+    # Files not larger than this are read only once into memory for hashing,
+    # substitution and saving
+    max_in_memory_size = 2621440  # 2.5 MB
+
+    incremental_index_version = '1.0'
+    incremental_index_name = 'staticfiles.index.json'
+    preload_manifest_version = '1.0'
+    checkpoint_version = '1.0'
+    checkpoint_name = 'staticfiles.checkpoint.json'
+    shard_checkpoint_name = 'staticfiles.checkpoint.shard-%d-of-%d.json'
+    compact_manifest_name = 'staticfiles.json.idx'
+    shard_manifest_name = 'staticfiles.shard-%d-of-%d.json'
+
+    # Statistics of the running post_process(), and the dict of those of the
+    # last one. Defined here since the manifest is loaded by __init__() of
+    # parent classes.
+    stats = null_stats
+    last_stats = None
+
+    # The manifest, which is loaded on first use, and the state of checking
+    # it for changes
+    _hashed_files = None
+    _deferring_manifest = False
+    _manifest_signature = None
+    _manifest_check_time = None
+    _post_processing = False
+
     def __init__(self, *args, **kwargs):
-        super(SmartManifestFilesMixin, self).__init__(*args, **kwargs)
+        # Don't let ManifestFilesMixin load the manifest
+        self._deferring_manifest = True
+        try:
+            super(SmartManifestFilesMixin, self).__init__(*args, **kwargs)
+        finally:
+            self._deferring_manifest = False
+        # Matchers compiled from file patterns of adjustable files
+        self._adjustable_matcher = compile_file_patterns(self._patterns)
+        self._extension_matchers = [
+            (extension, compile_file_patterns((extension,)))
+            for extension in self._patterns
+        ]
+        self.intermediate_files = set()
+        self.hashing_ignored_files = set()
+        self.minified_files = MinifiedContentBuffer()
+        self._min_cache = None
+        # Pool of minification processes for files being copied, and files
+        # waiting for their minified content to be saved, keyed by cleaned
+        # names
+        self._min_pool = None
+        self._pending_minified_copies = OrderedDict()
+        self._min_pool_exit_registered = False
+        # Source maps generated by minification, keyed by cleaned names of
+        # minified files, and cleaned names of those saved while
+        # post-processing
+        self.minified_source_maps = MinifiedContentBuffer()
+        self.source_map_names = set()
+        # Hashed names of source maps of files skipped by incremental
+        # post-processing, keyed by cleaned names of the files
+        self.incremental_source_maps = {}
+        # Names referenced by each adjustable file, recorded during
+        # substitution
+        self.file_references = {}
+        self._current_references = None
+        self._scanning_references = False
+        # Order of files in which post-processing settles every adjustable
+        # file in a single pass, and the adjustable files already settled
+        self.processing_order = None
+        self.finalized_files = set()
+        self.incremental_index = {}
+        self.incremental_skipped_files = {}
+        # Hashed names of files completed while checkpoints are enabled, and
+        # the digest of source files which a checkpoint is valid for
+        self.checkpoint_files = None
+        self.checkpoint_sources = None
+        self.checkpoint_due_time = None
+        self._combined_patterns = {}
+        # Memoized results of URL conversion while post-processing
+        self._url_memo = {}
+        self._url_memo_hashed_files = None
+        self._url_lookups = None
+        # Digests of local files, keyed by path, size and modification time
+        self.digest_cache = {}
+        # Hashed names of the previous manifest while post-processing, if
+        # large local files are copied while being hashed, and paths of
+        # temporary files they are copied to
+        self.previous_hashed_files = {}
+        self.staged_files = set()
+        # Names of hashed files saved while post-processing, keyed by digests
+        # of their content, and numbers of files and bytes deduplicated
+        self.stored_digests = {}
+        self.deduplicated_files = 0
+        self.deduplicated_bytes = 0
+        # Names of all files in the storage while post-processing, if
+        # existence checks are answered from a list of files
+        self.existing_files = None
+        # Pool of writer threads, and files being saved by them
+        self._save_pool = None
+        self._pending_saves = OrderedDict()
+        # Names of precompressed variants saved while post-processing, keyed
+        # by cleaned names of files, and names of variants which aren't saved
+        # since they aren't smaller than the files, in this and the previous
+        # run
+        self.precompressed_variants = {}
+        self.skipped_variants = {}
+        self.previous_skipped_variants = set()
+        # Pool of precompression threads, and files being compressed by them
+        self._precompress_pool = None
+        self._pending_precompressions = deque()
+        # Resolved URLs of names, valid for the current manifest
+        self._url_cache = OrderedDict()
+        self._url_cache_hashed_files = None
+        # The preload manifest, valid for the current manifest
+        self._preload_manifest = None
+        self._preload_manifest_hashed_files = None
+        # Buffers for hashing large files, one per thread
+        self._stream_buffers = threading.local()
+        # Async I/O engine of post-processing, if "ASYNC_IO_ENABLED" is True
+        self._io_engine = None
+        # Whether post_process() is running, as opposed to copying files
+        self._post_processing = False
+
+    @property
+    def hashed_files(self):
+        # Load the manifest on first use, and reload it if it has changed
+        # when "MANIFEST_RELOAD_INTERVAL" is set
+        if self._hashed_files is None:
+            self.reload_manifest()
+        elif self._manifest_check_time is not None and \
+                not self._post_processing and \
+                default_timer() >= self._manifest_check_time:
+            self.check_manifest()
+        return self._hashed_files
+
+    @hashed_files.setter
+    def hashed_files(self, hashed_files):
+        self._hashed_files = hashed_files
+
+    def get_manifest_signature(self):
+        # Return the modification time and size of the manifest, or None if
+        # it's missing
+        try:
+            stat = os.stat(self.path(self.manifest_name))
+        except NotImplementedError:
+            pass
+        except OSError:
+            return None
+        else:
+            return stat.st_mtime, stat.st_size
+        try:
+            return (self.get_modified_time(self.manifest_name),
+                    self.size(self.manifest_name))
+        except (IOError, OSError, NotImplementedError):
+            return None
+
+    def schedule_manifest_check(self):
+        interval = self.config.manifest_reload_interval
+        if interval is None:
+            self._manifest_check_time = None
+        else:
+            self._manifest_check_time = default_timer() + interval
+
+    def reload_manifest(self):
+        if self.config.manifest_reload_interval is not None:
+            # Taken before loading, so that a change while loading is caught
+            # by the next check
+            self._manifest_signature = self.get_manifest_signature()
+        self.schedule_manifest_check()
+        hashed_files = self.load_manifest()
+        previous_hashed_files = self._hashed_files
+        self._hashed_files = hashed_files
+        if isinstance(previous_hashed_files, CompactManifest) and \
+                previous_hashed_files is not hashed_files:
+            # Unmap the replaced compact manifest now instead of leaving it
+            # to the garbage collector
+            previous_hashed_files.close()
         if not settings.DEBUG:
-            logger.info('Manifest file: %s',
-                        self.path(self.manifest_name))
-            if self.hashed_files:
+            try:
+                manifest_path = self.path(self.manifest_name)
+            except NotImplementedError:
+                manifest_path = self.manifest_name
+            logger.info('Manifest file: %s', manifest_path)
+            if hashed_files:
                 logger.info('Manifest loaded, number of files: %s',
-                            len(self.hashed_files))
+                            len(hashed_files))
             else:
                 logger.warning('Manifest contains no files.')
-        self.intermediate_files = set()
-        self.hashing_ignored_files = set()
-        self.minified_files = {}
+
+    def check_manifest(self):
+        # Reload the manifest if its modification time or size has changed
+        signature = self.get_manifest_signature()
+        if signature is None or signature == self._manifest_signature:
+            # Keep the current manifest while a new one is being written
+            self.schedule_manifest_check()
+            return
+        try:
+            self.reload_manifest()
+        except ValueError:
+            # Probably written partially. Try again later.
+            logger.warning("Couldn't reload manifest '%s'", self.manifest_name)
+            self._manifest_signature = None
+            self.schedule_manifest_check()
+
+    def url(self, name, force=False):
+        # Cache resolved URLs, so that resolving a name again (e.g. by the
+        # "static" template tag) is a dict lookup
+        if settings.DEBUG and not force:
+            return super(SmartManifestFilesMixin, self).url(name, force)
+        hashed_files = self._hashed_files
+        if hashed_files is None or self._manifest_check_time is not None:
+            # The manifest should be loaded or checked
+            hashed_files = self.hashed_files
+        if self._url_cache_hashed_files is not hashed_files:
+            # The manifest is reloaded or being rebuilt
+            self._url_cache = OrderedDict()
+            self._url_cache_hashed_files = hashed_files
+        url_cache = self._url_cache
+        try:
+            # Move the URL to the end as the most recently used one
+            url = url_cache.pop(name)
+        except KeyError:
+            pass
+        else:
+            url_cache[name] = url
+            return url
+        url = super(SmartManifestFilesMixin, self).url(name, force)
+        max_size = self.config.url_cache_max_size
+        if max_size != 0:
+            if max_size is not None:
+                # Evict the least recently used URLs
+                while len(url_cache) >= max_size:
+                    try:
+                        url_cache.popitem(last=False)
+                    except KeyError:
+                        # Emptied by another thread
+                        break
+            url_cache[name] = url
+        return url
+
+    def preload_urls(self, name):
+        # Return URLs of files which a file references transitively (e.g.
+        # imported stylesheets, images and fonts of a stylesheet), nearest
+        # first, according to the preload manifest
+        preload_manifest = self.preload_manifest
+        if not preload_manifest:
+            return []
+        dependencies = preload_manifest.get(self.stored_name(name), ())
+        base_url = super(HashedFilesMixin, self).url
+        return [base_url(dependency) for dependency in dependencies]
+
+    @property
+    def preload_manifest(self):
+        hashed_files = self.hashed_files
+        if self._preload_manifest_hashed_files is not hashed_files:
+            # The manifest is reloaded or being rebuilt
+            self._preload_manifest = self.load_preload_manifest()
+            self._preload_manifest_hashed_files = hashed_files
+        return self._preload_manifest
+
+    def load_preload_manifest(self):
+        name = self.preload_manifest_name
+        if name is None:
+            return {}
+        try:
+            with self.open(name) as preload_manifest:
+                stored = json.loads(preload_manifest.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return {}
+        if stored.get('version') != self.preload_manifest_version:
+            return {}
+        return stored.get('paths', {})
+
+    def get_preload_paths(self):
+        # Map hashed names of adjustable files to hashed names of files they
+        # reference transitively, in breadth-first order. References to
+        # files which aren't in the manifest (e.g. missing files) and to
+        # generated source maps are left out.
+        hashed_files = self.hashed_files
+        file_references = self.file_references
+        preload_paths = {}
+        for cleaned_name in sorted(file_references):
+            hashed_name = hashed_files.get(self.hash_key(cleaned_name))
+            if hashed_name is None:
+                continue
+            dependencies = []
+            visited = set([cleaned_name])
+            queue = deque([cleaned_name])
+            while queue:
+                for ref in sorted(file_references.get(queue.popleft(), ())):
+                    if ref in visited or ref in self.source_map_names:
+                        continue
+                    visited.add(ref)
+                    hashed_ref = hashed_files.get(self.hash_key(ref))
+                    if hashed_ref is not None:
+                        dependencies.append(hashed_ref)
+                        queue.append(ref)
+            if dependencies:
+                preload_paths[hashed_name] = dependencies
+        return preload_paths
+
+    def save_preload_manifest(self):
+        name = self.preload_manifest_name
+        payload = {
+            'version': self.preload_manifest_version,
+            'paths': self.get_preload_paths(),
+        }
+        if self.exists(name):
+            self.delete(name)
+        contents = json.dumps(payload, separators=(',', ':'),
+                              sort_keys=True).encode('utf-8')
+        self._save(name, ContentFile(contents), disable_minified_cache=True)
 
     def url_converter(self, name, hashed_files, template=None):
         # Overrides original verision from HashedFilesMixin of Django 1.11.
@@ -56,14 +468,31 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
         if template is None:
             template = self.default_template
 
-        def converter(matchobj):
-            groups = matchobj.groups()
+        source_name = name if os.sep == '/' else name.replace(os.sep, '/')
+        source_dir = posixpath.dirname(source_name)
+        config = self.config
+        # For "classic" pattern, use the original converter maker only once
+        classic_converter = super(SmartManifestFilesMixin, self).url_converter(
+            name, hashed_files, template
+        )
+        # Original converters for "new-style" pattern, keyed by virtual name
+        # and template
+        new_style_converters = {}
+
+        def convert(matchobj, groups):
             if len(groups) == 2:
-                # For "classic" pattern, use the original converter maker.
-                # Then feed the converter with the original match object.
-                return super(SmartManifestFilesMixin, self).url_converter(
-                    name, hashed_files, template
-                )(matchobj)
+                # For "classic" pattern, feed the original converter with the
+                # original match object.
+                try:
+                    return classic_converter(matchobj)
+                except ValueError:
+                    if template not in source_map_templates:
+                        raise
+                    # Third-party files often reference source maps which
+                    # aren't shipped. Keep the comment as is.
+                    logger.debug("Source map '%s' referenced by '%s' isn't "
+                                 "found", groups[1], name)
+                    return groups[0]
 
             # Add support for prefix path of "new-style" pattern
             matched = groups[0]
@@ -80,9 +509,8 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
                         or vp_dir.startswith('./') \
                         or vp_dir.startswith('../'):
                     # The parent directory is relative to the source name
-                    source_name = name if os.sep == '/' else name.replace(os.sep, '/')
                     vp_dir = posixpath.normpath(
-                        posixpath.join(posixpath.dirname(source_name), vp_dir)
+                        posixpath.join(source_dir, vp_dir)
                     )
                 else:
                     # The parent directory is relative to root of static files
@@ -94,25 +522,293 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
                 vname = name
 
             if not trailing_chars or \
-                    self.js_min_enabled and self.js_assets_repl_trailing_fix:
+                    config.js_min_enabled and \
+                    config.js_assets_repl_trailing_fix:
                 new_template = template
             else:
                 new_template = '%s%s' % (template,
                                          trailing_chars.replace('%', '%%'))
 
+            key = (vname, new_template)
+            if key not in new_style_converters:
+                new_style_converters[key] = super(
+                    SmartManifestFilesMixin, self
+                ).url_converter(vname, hashed_files, new_template)
             # Create a duck-typed match object for the convertor, of which
             # groups() method returns a tuple of two values.
-            return super(SmartManifestFilesMixin, self).url_converter(
-                vname, hashed_files, new_template
-            )(DuckTypedMatchObj(matched, url))
+            return new_style_converters[key](DuckTypedMatchObj(matched, url))
+
+        if hashed_files is not self._url_memo_hashed_files:
+            # Only memoize while post-processing
+            def converter(matchobj):
+                return convert(matchobj, matchobj.groups())
+
+            return converter
+
+        memo = self._url_memo
+
+        def converter(matchobj):
+            groups = matchobj.groups()
+            if self._scanning_references:
+                return convert(matchobj, groups)
+
+            # The result only depends on the source directory, the template,
+            # the matched text and entries of the looked up files in
+            # hashed_files
+            key = (source_dir, template, groups)
+            entry = memo.get(key)
+            if entry is not None:
+                result, lookups = entry
+                if all(hashed_files.get(hash_key) == hashed_name
+                       for ref_name, hash_key, hashed_name in lookups):
+                    if self._current_references is not None:
+                        self._current_references.update(
+                            ref_name for ref_name, _, _ in lookups
+                        )
+                    return result
+
+            self._url_lookups = lookups = []
+            try:
+                result = convert(matchobj, groups)
+            finally:
+                self._url_lookups = None
+            memo[key] = (result, [
+                (ref_name, hash_key, hashed_files.get(hash_key))
+                for ref_name, hash_key in lookups
+            ])
+            return result
 
         return converter
 
+    def _stored_name(self, name, hashed_files):
+        # Record the referenced name for the file being substituted
+        ref_name = self.clean_name(posixpath.normpath(urlsplit(name).path))
+        if self._url_lookups is not None:
+            # Remember the looked up entry for the memoized URL
+            self._url_lookups.append((ref_name, self.hash_key(
+                self.clean_name(posixpath.normpath(name))
+            )))
+        if self._current_references is not None:
+            self._current_references.add(ref_name)
+            if self._scanning_references:
+                # Only references are wanted. Skip the lookup.
+                return name
+        return super(SmartManifestFilesMixin, self)._stored_name(
+            name, hashed_files
+        )
+
+    def new_hasher(self):
+        hash_algorithm = self.config.hash_algorithm
+        if callable(hash_algorithm):
+            return hash_algorithm()
+        return hashlib.new(hash_algorithm)
+
+    def get_digest_key(self, content):
+        # Return the key of the digest cache for the content, or None if it
+        # isn't a local file
+        if hasattr(content, 'digest_key'):
+            return content.digest_key
+        try:
+            stat = os.fstat(content.fileno())
+            path = os.path.abspath(content.name)
+        except (AttributeError, TypeError, ValueError,
+                IOError, OSError):
+            return None
+        return path, stat.st_size, stat.st_mtime
+
+    def file_hash(self, name, content=None):
+        # Overrides original version from HashedFilesMixin of Django 1.11.
+        # Use the configured hash algorithm, and never hash the same local
+        # file twice.
+        if content is None:
+            return None
+        digest_key = self.get_digest_key(content)
+        if digest_key is not None:
+            digest_key += (self.config.hash_algorithm,)
+            if digest_key in self.digest_cache:
+                return self.digest_cache[digest_key][:12]
+        stats = self.stats
+        if stats.enabled and not isinstance(content, ContentFile):
+            stats.add_read(content.size)
+        with stats.stage('hash'):
+            hasher = self.new_hasher()
+            raw_file = getattr(content, 'file', None)
+            if digest_key is not None and hasattr(raw_file, 'readinto'):
+                # Stream a local file through a reusable buffer
+                hash_file(hasher, raw_file, self.get_stream_buffer())
+            else:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+        if digest_key is not None:
+            self.digest_cache[digest_key] = digest
+        else:
+            # Remember the full digest for deduplication
+            try:
+                content.content_digest = digest
+            except AttributeError:
+                pass
+        return digest[:12]
+
+    def get_stream_buffer(self):
+        # Return the reusable buffer for streaming files of this thread
+        stream_buffer = getattr(self._stream_buffers, 'buffer', None)
+        if stream_buffer is None:
+            stream_buffer = bytearray(STREAM_BUFFER_SIZE)
+            self._stream_buffers.buffer = stream_buffer
+        return stream_buffer
+
+    def get_content_digest(self, content):
+        # Return the full digest of content hashed by file_hash(), or None if
+        # it isn't known
+        digest = getattr(content, 'content_digest', None)
+        if digest is None:
+            digest_key = self.get_digest_key(content)
+            if digest_key is not None:
+                digest = self.digest_cache.get(
+                    digest_key + (self.config.hash_algorithm,))
+        return digest
+
+    def read_into_memory(self, content):
+        # Read a small local file into memory, so that it's read only once
+        # for hashing, substitution and saving
+        if isinstance(content, ContentFile):
+            return content
+        digest_key = self.get_digest_key(content)
+        if digest_key is None or digest_key[1] > self.max_in_memory_size:
+            return content
+        self.stats.add_read(digest_key[1])
+        return DigestedContentFile(content.read(), digest_key, content.name)
+
     def get_pre_minified_name(self, path):
         fn, ext = os.path.splitext(path)
         if not fn.endswith('.min'):
             return '%s.min%s' % (fn, ext)
 
+    def get_minifier(self, cleaned_name):
+        # Return a tuple of the minification callable and its keyword
+        # arguments if the file should be minified, otherwise None.
+        if self.get_pre_minified_name(cleaned_name) is None:
+            # File already minified
+            return
+
+        config = self.config
+        if (config.css_min_enabled or config.js_min_enabled) and \
+                not (config.re_ignore_min and
+                     config.re_ignore_min.search(cleaned_name)):
+            # Minification mode is on and file isn't ignored
+            if config.css_min_enabled and \
+                    config.css_file_matcher(cleaned_name):
+                # Minify CSS
+                return config.css_min_func, config.css_min_func_kwargs or {}
+            elif config.js_min_enabled and \
+                    config.js_file_matcher(cleaned_name):
+                # Minify JavaScript
+                return config.js_min_func, config.js_min_func_kwargs or {}
+
+    @property
+    def min_cache(self):
+        # The persistent minification cache, or None if it's disabled
+        if not self.min_cache_dir:
+            return None
+        if self._min_cache is None or \
+                self._min_cache.location != os.path.abspath(self.min_cache_dir):
+            self._min_cache = MinifiedContentCache(self.min_cache_dir)
+        self._min_cache.max_size = self.min_cache_max_size
+        return self._min_cache
+
+    def minify_content(self, content_text, minifier):
+        # Minify the content, reusing the persistent cache when possible.
+        # Returns a tuple of the minified content and its source map (None if
+        # source maps are disabled or not generated).
+        min_func, min_func_kwargs = minifier
+        source_maps_enabled = self.config.source_maps_enabled
+        min_cache = self.min_cache
+        if min_cache is None:
+            return split_minified(min_func(content_text, **min_func_kwargs),
+                                  source_maps_enabled)
+        key = min_cache.make_key(content_text, min_func, min_func_kwargs)
+        result = min_cache.get_minified(key, source_maps_enabled)
+        if result is None:
+            result = split_minified(min_func(content_text, **min_func_kwargs),
+                                    source_maps_enabled)
+            min_cache.set_minified(key, result[0], result[1],
+                                   source_maps_enabled)
+        return result
+
+    def cache_minified_content(self, cleaned_name, content_text,
+                               source_map=None):
+        # Keep the content in memory, or in a temporary file if the memory
+        # limit is exceeded
+        max_size = self.min_buffer_max_size
+        if source_map is not None:
+            content_text = self.add_source_map_url(cleaned_name,
+                                                   force_bytes(content_text))
+            self.minified_source_maps.max_size = max_size
+            self.minified_source_maps.set(cleaned_name, source_map)
+        self.minified_files.max_size = max_size
+        self.minified_files.set(cleaned_name, content_text)
+
+    def get_source_map_name(self, name):
+        return '%s.map' % name
+
+    def add_source_map_url(self, cleaned_name, content):
+        # Replace a "sourceMappingURL" comment at the end of minified content
+        # (if any) with one referencing the generated source map, which is
+        # substituted with the hashed name while post-processing
+        map_url = posixpath.basename(self.get_source_map_name(cleaned_name))
+        if self.config.css_file_matcher(cleaned_name):
+            comment = '/*# sourceMappingURL=%s */' % map_url
+        else:
+            comment = '//# sourceMappingURL=%s' % map_url
+        content = re_trailing_source_map_url.sub(b'', content).rstrip()
+        return content + b'\n' + force_bytes(comment)
+
+    def save_source_map(self, cleaned_name, hashed_files):
+        # Hash and save the source map generated by minifying a file, before
+        # the file is substituted. Returns the hashed name of the source map,
+        # or None if there isn't one.
+        if cleaned_name not in self.minified_source_maps:
+            return None
+        map_name = self.get_source_map_name(cleaned_name)
+        map_key = self.hash_key(map_name)
+        if map_key in hashed_files:
+            # Saved in a previous pass
+            return hashed_files[map_key]
+
+        source_map = self.minified_source_maps.open(cleaned_name)
+        reopen = lambda: self.minified_source_maps.open(cleaned_name)
+        try:
+            hashed_name = self.hashed_name(map_name, source_map)
+            if not self.exists(hashed_name):
+                source_map.seek(0)
+                hashed_name = force_text(self.clean_name(
+                    self.save_hashed_file(map_name, hashed_name, source_map,
+                                          reopen)
+                ))
+            else:
+                self.precompress_content(hashed_name, source_map, reopen)
+        finally:
+            source_map.close()
+        hashed_files[map_key] = hashed_name
+        self.source_map_names.add(map_name)
+        return hashed_name
+
+    def save_unhashed_source_map(self, cleaned_name):
+        # Save the source map of a minified file which is kept under its
+        # unhashed name after post-processing
+        if cleaned_name not in self.minified_source_maps or \
+                not self.get_unhashed_survivors([cleaned_name]):
+            return
+        map_name = self.get_source_map_name(cleaned_name)
+        if self.exists(map_name):
+            self.delete(map_name)
+        source_map = self.minified_source_maps.open(cleaned_name)
+        try:
+            self._save(map_name, source_map, disable_minified_cache=True)
+        finally:
+            source_map.close()
+
     def get_minified_content_file(self, name, content=None, paths=None):
         if settings.DEBUG:
             # Return no cached minifiable file when debug mode is on
@@ -121,33 +817,12 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
         cleaned_name = self.clean_name(name)
         if cleaned_name in self.minified_files:
             # There is cached minified file. Return it
-            return File(open(self.minified_files[cleaned_name], 'rb'))
+            return self.minified_files.open(cleaned_name)
         else:
             # No cached minified content. Check whether we should minify the
             # file content.
-            pm_name = self.get_pre_minified_name(cleaned_name)
-            if pm_name is None:
-                # File already minified
-                return
-
-            min_func = None
-            min_func_kwargs = None
-            if (self.css_min_enabled or self.js_min_enabled) and \
-                    not (self.re_ignore_min and
-                         self.re_ignore_min.search(cleaned_name)):
-                # Minification mode is on and file isn't ignored
-                if self.css_min_enabled and \
-                        matches_patterns(cleaned_name, self.css_file_patterns):
-                    # Minify CSS
-                    min_func = self.css_min_func
-                    min_func_kwargs = self.css_min_func_kwargs
-                elif self.js_min_enabled and \
-                        matches_patterns(cleaned_name, self.js_file_patterns):
-                    # Minify JavaScript
-                    min_func = self.js_min_func
-                    min_func_kwargs = self.js_min_func_kwargs
-
-            if min_func:
+            minifier = self.get_minifier(cleaned_name)
+            if minifier is not None:
                 # File content needs to be minified
                 assert content is not None or paths is not None, \
                     '"content" and "paths" argument can\'t be both None'
@@ -163,51 +838,366 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
                     if opened:
                         content.close()
                 # Minify the content
-                if min_func_kwargs is None:
-                    min_func_kwargs = {}
-                content_text = min_func(content_text, **min_func_kwargs)
-                # Convert to bytes and save it to a temporary file
-                with NamedTemporaryFile(delete=False) as temp_file:
-                    temp_file.write(force_bytes(content_text))
-                # Cache the temp file path
-                temp_file_path = temp_file.name
-                self.minified_files[cleaned_name] = temp_file_path
+                self.stats.add_read(len(content_text))
+                with self.stats.stage('minify'):
+                    content_text, source_map = self.minify_content(
+                        content_text, minifier)
+                self.cache_minified_content(cleaned_name, content_text,
+                                            source_map)
                 # Return minified file
-                return File(open(temp_file_path, 'rb'))
+                return self.minified_files.open(cleaned_name)
+
+    def minify_paths(self, paths):
+        # Minify all minifiable files in a pool of worker processes before
+        # hashing starts, so that _post_process() only picks up the cached
+        # results. Files which _post_process() skips (unchanged, resumed from
+        # a checkpoint or processed by shard runs) aren't minified. Returns
+        # cleaned names of the newly minified files.
+        tasks = []
+        for name in paths:
+            cleaned_name = self.clean_name(name)
+            if cleaned_name in self.minified_files or \
+                    cleaned_name in self.incremental_skipped_files:
+                continue
+            minifier = self.get_minifier(cleaned_name)
+            if minifier is not None:
+                tasks.append((name, cleaned_name, minifier))
+
+        if not tasks:
+            return []
+
+        # Look up the persistent cache first, and only send cache misses to
+        # the worker pool
+        min_cache = self.min_cache
+        source_maps_enabled = self.config.source_maps_enabled
+        jobs = []
+        for name, cleaned_name, minifier in tasks:
+            storage, path = paths[name]
+            with storage.open(path) as content:
+                content_text = content.read()
+            key = None
+            if min_cache is not None:
+                key = min_cache.make_key(content_text, *minifier)
+                result = min_cache.get_minified(key, source_maps_enabled)
+                if result is not None:
+                    self.cache_minified_content(cleaned_name, *result)
+                    continue
+            jobs.append((cleaned_name, key,
+                         (minifier[0], minifier[1], content_text,
+                          source_maps_enabled)))
+
+        if jobs:
+            workers = min(self.min_workers, len(jobs))
+            chunksize = max(1, len(jobs) // (workers * 4))
+            pool = Pool(workers)
+            try:
+                results = pool.imap(_minify_job,
+                                    [job for _, _, job in jobs], chunksize)
+                for (cleaned_name, key, _), (content_bytes, source_map) in \
+                        zip(jobs, results):
+                    if key is not None:
+                        min_cache.set_minified(key, content_bytes, source_map,
+                                               source_maps_enabled)
+                    self.cache_minified_content(cleaned_name, content_bytes,
+                                                source_map)
+                pool.close()
+            except BaseException:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        return [cleaned_name for _, cleaned_name, _ in tasks]
+
+    def get_unhashed_survivors(self, cleaned_names):
+        # Return unhashed files which won't be deleted after post-processing
+        config = self.config
+        if not config.delete_unhashed_enabled:
+            return list(cleaned_names)
+        if config.re_ignore_hashing is None:
+            return []
+        return [cleaned_name for cleaned_name in cleaned_names
+                if config.re_ignore_hashing.search(cleaned_name)]
 
     def _save(self, name, content, disable_minified_cache=False):
+        # Files being copied are minified here even if post_process() doesn't
+        # follow (e.g. "collectstatic --no-post-process"), in a process pool
+        # if "MIN_WORKERS" is set. Their minified content is reused by
+        # post_process().
         if not disable_minified_cache and name != self.manifest_name:
             # Explicitly exclude manifest file caching
+            if self.parallel_min_enabled and not self._post_processing and \
+                    not settings.DEBUG and \
+                    self.submit_minified_copy(name, content):
+                return name
             cached_content = self.get_minified_content_file(name, content)
             if cached_content is not None:
                 # Save the cached or newly processed minfiable content
-                try:
-                    return super(SmartManifestFilesMixin,
-                                 self)._save(name, cached_content)
-                finally:
-                    cached_content.close()
-        return super(SmartManifestFilesMixin, self)._save(name, content)
+                return self.save_minified_content(name, cached_content)
+        return self._save_content(name, content)
+
+    def save_minified_content(self, name, cached_content):
+        # Save minified content, and its source map if the file is kept under
+        # its unhashed name
+        try:
+            saved_name = self._save_content(name, cached_content)
+        finally:
+            cached_content.close()
+        self.save_unhashed_source_map(self.clean_name(name))
+        return saved_name
+
+    def submit_minified_copy(self, name, content):
+        # Minify a file being copied in the process pool, and save it once
+        # its minified content is collected. Returns False if the file isn't
+        # to be minified there (not minifiable, or already minified).
+        cleaned_name = self.clean_name(name)
+        if cleaned_name in self.minified_files or \
+                cleaned_name in self._pending_minified_copies:
+            return False
+        minifier = self.get_minifier(cleaned_name)
+        if minifier is None:
+            return False
+        content_text = content.read()
+        source_maps_enabled = self.config.source_maps_enabled
+        min_cache = self.min_cache
+        key = None
+        if min_cache is not None:
+            key = min_cache.make_key(content_text, *minifier)
+            result = min_cache.get_minified(key, source_maps_enabled)
+            if result is not None:
+                # Saved right away by _save()
+                self.cache_minified_content(cleaned_name, *result)
+                return False
+
+        if self._min_pool is None:
+            self._min_pool = Pool(self.min_workers)
+            if not self._min_pool_exit_registered:
+                # collectstatic may not call post_process(), which collects
+                # the rest of the files otherwise
+                atexit.register(self.collect_minified_copies, True)
+                self._min_pool_exit_registered = True
+        job = (minifier[0], minifier[1], content_text, source_maps_enabled)
+        self._pending_minified_copies[cleaned_name] = (
+            name, key, self._min_pool.apply_async(_minify_job, (job,))
+        )
+        self.collect_minified_copies()
+        return True
+
+    def collect_minified_copies(self, wait=False):
+        # Save files whose minified content is ready in order of submission,
+        # waiting for the oldest one if too many are pending. If "wait" is
+        # True, wait for all of them and close the process pool.
+        pending = self._pending_minified_copies
+        max_pending = (self.min_workers or 1) * 4
+        source_maps_enabled = self.config.source_maps_enabled
+        try:
+            while pending:
+                cleaned_name, (name, key, result) = next(iteritems(pending))
+                if not (wait or len(pending) > max_pending or
+                        result.ready()):
+                    break
+                del pending[cleaned_name]
+                content_bytes, source_map = result.get()
+                if key is not None:
+                    self.min_cache.set_minified(key, content_bytes, source_map,
+                                                source_maps_enabled)
+                self.cache_minified_content(cleaned_name, content_bytes,
+                                            source_map)
+                self.save_minified_content(
+                    name, self.minified_files.open(cleaned_name))
+        except BaseException:
+            if self._min_pool is not None:
+                self._min_pool.terminate()
+                self._min_pool.join()
+                self._min_pool = None
+            pending.clear()
+            raise
+        if wait and self._min_pool is not None:
+            self._min_pool.close()
+            self._min_pool.join()
+            self._min_pool = None
+
+    def _save_content(self, name, content):
+        # Save the content through the storage backend
+        stats = self.stats
+        if stats.enabled:
+            stats.count_call('_save')
+            stats.add_written(content.size)
+        with stats.stage('save'):
+            async_save = self.get_async_method('save')
+            if async_save is not None:
+                saved_name = self._io_engine.run(async_save, name, content)
+            else:
+                saved_name = super(SmartManifestFilesMixin, self)._save(
+                    name, content)
+            return self.add_existing_file(saved_name)
+
+    def _open(self, name, mode='rb'):
+        self.stats.count_call('_open')
+        return super(SmartManifestFilesMixin, self)._open(name, mode)
+
+    def list_existing_files(self):
+        # Return names of all files in the storage. Storage backends which
+        # can list files of all directories at once (e.g. by a prefix in S3)
+        # should override this.
+        names = []
+        directories = ['']
+        while directories:
+            directory = directories.pop()
+            self.stats.count_call('listdir')
+            subdirectories, filenames = self.listdir(directory)
+            for subdirectory in subdirectories:
+                directories.append(posixpath.join(directory, subdirectory))
+            for filename in filenames:
+                names.append(posixpath.join(directory, filename))
+        return names
+
+    def add_existing_file(self, name):
+        if self.existing_files is not None:
+            self.existing_files.add(self.clean_name(name))
+        return name
+
+    def exists(self, name):
+        if self._pending_saves and self.clean_name(name) in self._pending_saves:
+            # The file is being saved by a writer thread
+            return True
+        if self._pending_minified_copies and \
+                self.clean_name(name) in self._pending_minified_copies:
+            # The file is being minified before it's saved
+            return True
+        if self.existing_files is not None:
+            # Answer from the list of files instead of querying the storage
+            return self.clean_name(name) in self.existing_files
+        self.stats.count_call('exists')
+        with self.stats.stage('exists'):
+            async_exists = self.get_async_method('exists')
+            if async_exists is not None:
+                return self._io_engine.run(async_exists, name)
+            return super(SmartManifestFilesMixin, self).exists(name)
+
+    def save(self, name, content, max_length=None):
+        # A shard run copies files of its shard only
+        if self.shard_index is not None and not self.in_shard(name):
+            return name
+        return super(SmartManifestFilesMixin, self).save(
+            name, content, max_length=max_length
+        )
+
+    def delete(self, name):
+        # Neither does a shard run delete other files while copying
+        if self.shard_index is not None and not self._post_processing and \
+                not self.in_shard(name):
+            return
+        self.stats.count_call('delete')
+        with self.stats.stage('delete'):
+            async_delete = self.get_async_method('delete')
+            if async_delete is not None:
+                self._io_engine.run(async_delete, name)
+            else:
+                super(SmartManifestFilesMixin, self).delete(name)
+        if self.existing_files is not None:
+            self.existing_files.discard(self.clean_name(name))
+
+    def get_async_method(self, name):
+        # Return the native coroutine method "async_<name>" of the storage
+        # backend if it provides one and the async I/O engine is running,
+        # otherwise None
+        if self._io_engine is None:
+            return None
+        return getattr(self, 'async_' + name, None)
+
+    def delete_files(self, names):
+        # Delete files in a single request if the storage backend provides a
+        # bulk_delete() method, otherwise one by one (concurrently in the
+        # async I/O engine if it's running)
+        names = list(names)
+        if not names:
+            return names
+        bulk_delete = getattr(self, 'bulk_delete', None)
+        if bulk_delete is None and self._io_engine is not None:
+            results = [self._io_engine.apply_async(self.delete, (name,))
+                       for name in names]
+            for result in results:
+                result.get()
+        elif bulk_delete is None:
+            for name in names:
+                self.delete(name)
+        else:
+            self.stats.count_call('bulk_delete')
+            with self.stats.stage('delete'):
+                bulk_delete(names)
+            if self.existing_files is not None:
+                self.existing_files.difference_update(
+                    self.clean_name(name) for name in names
+                )
+        return names
 
     # Comment by Rockallite: below is a modified copy of _post_process() of
     # HashedFilesMixin in Django 1.11. Changes are noted with "by Rockallite".
     def _post_process(self, paths, adjustable_paths, hashed_files):
-        # Sort the files by directory level
-        def path_level(name):
-            return len(name.split(os.sep))
+        # Modified by Rockallite: use the order of the reference graph if
+        # possible
+        # # Sort the files by directory level
+        # def path_level(name):
+        #     return len(name.split(os.sep))
+        #
+        # for name in sorted(paths.keys(), key=path_level, reverse=True):
+        if self.processing_order is not None:
+            names = [name for name in self.processing_order if name in paths]
+        else:
+            names = sort_by_path_level(paths.keys())
+
+        # Added by Rockallite: memoize URL conversion for this hashed_files
+        if self._url_memo_hashed_files is not hashed_files:
+            self._url_memo = {}
+            self._url_memo_hashed_files = hashed_files
 
-        for name in sorted(paths.keys(), key=path_level, reverse=True):
+        re_ignore_hashing = self.config.re_ignore_hashing
+        stats = self.stats
+        # Added by Rockallite: files read and checked ahead by the async I/O
+        # engine
+        prefetched_files = self.prefetch_files(names, paths)
+        for name in names:
+            prefetched = next(prefetched_files)
+            file_started = default_timer()
             # Added by Rockallite: check whether hashing should be ignored
             cleaned_name = self.clean_name(name)
+            # Added by Rockallite: an adjustable file which has been processed
+            # after all files it references needs no more passes
+            if cleaned_name in self.finalized_files:
+                continue
             # Ignore hashing by short-circuited the logic
             if cleaned_name in self.hashing_ignored_files:
+                # Added by Rockallite: it isn't in the manifest yet if it's
+                # restored from a checkpoint
+                hashed_files.setdefault(self.hash_key(cleaned_name),
+                                        cleaned_name)
+                self.precompress_ignored_file(name, paths)
                 yield name, cleaned_name, False, False
                 continue
             hash_key = self.hash_key(cleaned_name)            
-            if self.re_ignore_hashing is not None and self.re_ignore_hashing.search(cleaned_name):
+            if re_ignore_hashing is not None and re_ignore_hashing.search(cleaned_name):
                 hashed_files[hash_key] = cleaned_name
                 self.hashing_ignored_files.add(cleaned_name)
+                self.precompress_ignored_file(name, paths)
                 yield name, cleaned_name, False, False
                 continue
+            # Added by Rockallite: reuse the result of the previous run if
+            # neither the file nor its references have changed
+            if cleaned_name in self.incremental_skipped_files:
+                hashed_name = self.incremental_skipped_files[cleaned_name]
+                if cleaned_name in self.incremental_source_maps:
+                    map_name = self.get_source_map_name(cleaned_name)
+                    hashed_files[self.hash_key(map_name)] = \
+                        self.incremental_source_maps[cleaned_name]
+                    self.source_map_names.add(map_name)
+                    self.precompress_stored_file(
+                        self.incremental_source_maps[cleaned_name])
+                hashed_files[hash_key] = hashed_name
+                self.precompress_stored_file(hashed_name)
+                if self.checkpoint_files is not None:
+                    self.checkpoint_files[cleaned_name] = hashed_name
+                yield name, hashed_name, False, False
+                continue
 
             substitutions = True
 
@@ -222,14 +1212,37 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
             storage, path = paths[name]
             cached_content = self.get_minified_content_file(name, paths=paths)
             if cached_content is None:
-                # use the original, local file, not the copied-but-unprocessed
-                # file, which might be somewhere far away, like S3
-                open_original_file = lambda: storage.open(path)
+                # Returns the content again for saving or precompressing it
+                # later
+                reopen = lambda storage=storage, path=path: storage.open(path)
+                if prefetched is not None and prefetched[0] is not None:
+                    # Added by Rockallite: use the content read ahead
+                    open_original_file = lambda: prefetched[0]
+                else:
+                    # use the original, local file, not the
+                    # copied-but-unprocessed file, which might be somewhere
+                    # far away, like S3
+                    open_original_file = lambda: storage.open(path)
             else:
                 # Use the cached and minified content
                 open_original_file = lambda: cached_content
+                reopen = lambda cleaned_name=cleaned_name: \
+                    self.minified_files.open(cleaned_name)
+                # Added by Rockallite: the generated source map must be
+                # hashed before the content references it
+                self.save_source_map(cleaned_name, hashed_files)
 
             with open_original_file() as original_file:
+                original_file = self.read_into_memory(original_file)
+                # Added by Rockallite: copy a large local file while hashing
+                # it, so that it's read only once
+                staged_path = None
+                if hash_key not in hashed_files and \
+                        cached_content is None and \
+                        name not in adjustable_paths and \
+                        not isinstance(original_file, ContentFile):
+                    staged_path = self.stage_local_copy(
+                        cleaned_name, storage, path, original_file)
             # Added by Rockallite: end of new code
 
                 # Commited out by Rockallite: cleaned name and hash key already
@@ -251,29 +1264,57 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
                 if hasattr(original_file, 'seek'):
                     original_file.seek(0)
 
-                hashed_file_exists = self.exists(hashed_name)
+                # Modified by Rockallite: use the existence checked ahead
+                # hashed_file_exists = self.exists(hashed_name)
+                if prefetched is not None and prefetched[1] == hashed_name:
+                    hashed_file_exists = prefetched[2]
+                else:
+                    hashed_file_exists = self.exists(hashed_name)
                 processed = False
 
                 # ..to apply each replacement pattern to the content
                 if name in adjustable_paths:
                     old_hashed_name = hashed_name
-                    content = original_file.read().decode(settings.FILE_CHARSET)
+                    # Modified by Rockallite: decode the content only if it
+                    # may contain a match
+                    # content = original_file.read().decode(settings.FILE_CHARSET)
+                    raw_content = original_file.read()
+                    if not isinstance(original_file, ContentFile):
+                        stats.add_read(len(raw_content))
                     # Added by Rockallite: flag indicating content substitution
                     content_sub = False
-                    for extension, patterns in iteritems(self._patterns):
-                        if matches_patterns(path, (extension,)):
-                            for pattern, template in patterns:
-                                converter = self.url_converter(name, hashed_files, template)
-                                try:
-                                    # Modified by Rockallite: get number of sub
-                                    # content = pattern.sub(converter, content)
-                                    content, num_sub = pattern.subn(converter, content)
-                                except ValueError as exc:
-                                    yield name, None, exc, False
-                                # Added by Rockallite: check content subsitution
-                                else:
-                                    if num_sub > 0:
-                                        content_sub = True
+                    # Modified by Rockallite: apply all patterns in a single
+                    # pass over the content
+                    # for extension, patterns in iteritems(self._patterns):
+                    #     if matches_patterns(path, (extension,)):
+                    #         for pattern, template in patterns:
+                    #             converter = self.url_converter(name, hashed_files, template)
+                    #             try:
+                    #                 content = pattern.sub(converter, content)
+                    #             except ValueError as exc:
+                    #                 yield name, None, exc, False
+                    combined_pattern = self.get_combined_pattern(path)
+                    if combined_pattern.may_match(raw_content):
+                        content = raw_content.decode(settings.FILE_CHARSET)
+                        # Added by Rockallite: record referenced names
+                        self._current_references = \
+                            self.file_references.setdefault(cleaned_name,
+                                                            set())
+                        try:
+                            with stats.stage('substitute'):
+                                content, num_sub = combined_pattern.subn(
+                                    lambda template: self.url_converter(
+                                        name, hashed_files, template),
+                                    content
+                                )
+                        except ValueError as exc:
+                            yield name, None, exc, False
+                        # Added by Rockallite: check content subsitution
+                        else:
+                            if num_sub > 0:
+                                content_sub = True
+                        finally:
+                            self._current_references = None
                     # Commented out by Rockallite: original code is a bit messy
                     # if hashed_file_exists:
                     #     self.delete(hashed_name)
@@ -306,9 +1347,12 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
                             # The file changed
                             if not self.exists(hashed_name):
                                 # Save the file only if it doesn't exist
-                                saved_name = self._save(hashed_name, content_file,
-                                                        disable_minified_cache=True)
+                                saved_name = self.save_hashed_file(
+                                    name, hashed_name, content_file)
                                 hashed_name = force_text(self.clean_name(saved_name))
+                            else:
+                                self.precompress_content(hashed_name,
+                                                         content_file)
                             processed = True
                     else:
                         # The file didn't get substituted, thus didn't change.
@@ -321,9 +1365,26 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
                     # a change to the original file happened
                     if not hashed_file_exists:
                         processed = True
-                        saved_name = self._save(hashed_name, original_file,
-                                                disable_minified_cache=True)
+                        # Modified by Rockallite: possibly save the file in
+                        # a writer thread, or copy a large local file
+                        # directly
+                        # saved_name = self._save(hashed_name, original_file)
+                        if cached_content is None and \
+                                not isinstance(original_file, ContentFile):
+                            source_path = self.get_local_source_path(
+                                storage, path)
+                        else:
+                            source_path = None
+                        saved_name = self.save_hashed_file(
+                            name, hashed_name, original_file, reopen,
+                            source_path, staged_path
+                        )
                         hashed_name = force_text(self.clean_name(saved_name))
+                    else:
+                        if staged_path is not None:
+                            self.discard_staged_file(staged_path)
+                        self.precompress_content(hashed_name, original_file,
+                                                 reopen)
 
                 # Added by Rockallite: remember intermediate file
                 if hash_key in hashed_files:
@@ -334,43 +1395,1259 @@ class SmartManifestFilesMixin(CachedSettingsMixin, ManifestFilesMixin):
                 # and then set the cache accordingly
                 hashed_files[hash_key] = hashed_name
 
+                # Added by Rockallite: references of an adjustable file are
+                # all settled when following the order of the reference graph
+                if self.processing_order is not None and \
+                        name in adjustable_paths:
+                    self.finalized_files.add(cleaned_name)
+                    substitutions = False
+
+                stats.add_file_time(name, default_timer() - file_started)
                 yield name, hashed_name, processed, substitutions
 
+                # Added by Rockallite: an adjustable file is completed once
+                # it's settled
+                if self.checkpoint_files is not None and (
+                        name not in adjustable_paths or
+                        cleaned_name in self.finalized_files):
+                    self.checkpoint_files[cleaned_name] = hashed_name
+
+            # Added by Rockallite: report failed saves of writer threads
+            for failed in self.collect_saved_files():
+                yield failed
+
+            # Added by Rockallite: save a checkpoint once all completed files
+            # are saved
+            if self.checkpoint_files is not None and \
+                    default_timer() >= self.checkpoint_due_time:
+                for failed in self.collect_saved_files(wait=True):
+                    yield failed
+                with stats.stage('checkpoint'):
+                    self.save_checkpoint(hashed_files)
+
+        # Added by Rockallite: wait for all writer threads
+        for failed in self.collect_saved_files(wait=True):
+            yield failed
+        self.collect_precompressed_files(wait=True)
+
+    def prefetch_files(self, names, paths):
+        # Yield the result of prefetch_file() of each of the names in order,
+        # or None if the file isn't prefetched. Files are prefetched by the
+        # async I/O engine up to twice its concurrency ahead of the one being
+        # yielded.
+        engine = self._io_engine
+        if engine is None:
+            for name in names:
+                yield None
+            return
+
+        re_ignore_hashing = self.config.re_ignore_hashing
+        debug = settings.DEBUG
+        max_ahead = engine.concurrency * 2
+        pending = deque()
+        for name in names:
+            # Files which are skipped, ignored or minified by _post_process()
+            # aren't prefetched
+            cleaned_name = self.clean_name(name)
+            if cleaned_name in self.finalized_files or \
+                    cleaned_name in self.hashing_ignored_files or \
+                    cleaned_name in self.incremental_skipped_files or \
+                    (re_ignore_hashing is not None and
+                     re_ignore_hashing.search(cleaned_name)) or \
+                    (not debug and
+                     (cleaned_name in self.minified_files or
+                      self.get_minifier(cleaned_name) is not None)):
+                pending.append(None)
+            else:
+                storage, path = paths[name]
+                pending.append(engine.apply_async(
+                    self.prefetch_file, (storage, path, cleaned_name)
+                ))
+            if len(pending) > max_ahead:
+                yield self.get_prefetched_file(pending.popleft())
+        while pending:
+            yield self.get_prefetched_file(pending.popleft())
+
+    def prefetch_file(self, storage, path, cleaned_name):
+        # Read a source file into memory if it's small, hash it, and check
+        # whether its hashed name exists. Returns a tuple of the content (or
+        # None if it isn't in memory), the hashed name and whether it exists.
+        with storage.open(path) as original_file:
+            content = self.read_into_memory(original_file)
+            hashed_name = self.hashed_name(cleaned_name, content)
+            hashed_file_exists = self.exists(hashed_name)
+        if not isinstance(content, ContentFile):
+            content = None
+        return content, hashed_name, hashed_file_exists
+
+    def get_prefetched_file(self, result):
+        # Failures are left to _post_process() to run into again and report
+        if result is None:
+            return None
+        try:
+            return result.get()
+        except Exception:
+            return None
+
+    def save_hashed_file(self, name, hashed_name, content, reopen=None,
+                         source_path=None, staged_path=None):
+        # Save a hashed file immediately, or submit it to the pool of writer
+        # threads. Returns the saved name. "reopen" is a callable returning
+        # the content again, which is used if the content isn't in memory
+        # (it will be closed before the writer thread gets to it). If
+        # "source_path" is given, the local file is copied instead, and if
+        # "staged_path" is given, the copy made by stage_local_copy() is moved
+        # into place.
+        self.precompress_content(hashed_name, content, reopen)
+        if self.config.dedup_enabled:
+            saved_name = self.dedup_file(name, hashed_name, content)
+            if saved_name is not None:
+                if staged_path is not None:
+                    self.discard_staged_file(staged_path)
+                return saved_name
+
+        if staged_path is not None:
+            def save():
+                return self.move_staged_file(staged_path, hashed_name)
+        elif source_path is not None:
+            def save():
+                return self.copy_local_file(source_path, hashed_name)
+        elif self._save_pool is None:
+            return self._save(hashed_name, content,
+                              disable_minified_cache=True)
+        elif not isinstance(content, ContentFile) and reopen is not None:
+            def save():
+                reopened_content = reopen()
+                try:
+                    return self._save(hashed_name, reopened_content,
+                                      disable_minified_cache=True)
+                finally:
+                    reopened_content.close()
+        else:
+            def save():
+                return self._save(hashed_name, content,
+                                  disable_minified_cache=True)
+
+        return self.submit_save(name, hashed_name, save)
+
+    def submit_save(self, name, hashed_name, save):
+        # Call "save" immediately, or in a writer thread
+        if self._save_pool is None:
+            return save()
+        cleaned_name = self.clean_name(hashed_name)
+        self._pending_saves[cleaned_name] = (
+            name, self._save_pool.apply_async(save)
+        )
+        return hashed_name
+
+    @property
+    def dedup_available(self):
+        return isinstance(self, FileSystemStorage) or \
+            callable(getattr(self, 'copy', None))
+
+    def dedup_file(self, name, hashed_name, content):
+        # Store a hashed file by linking or copying a file with the same
+        # content saved earlier in the run. Returns the name of the file, or
+        # None if the content should be saved.
+        if not self.dedup_available:
+            return None
+        digest = self.get_content_digest(content)
+        if digest is None:
+            return None
+        stored_name = self.stored_digests.get(digest)
+        if stored_name is None:
+            if not (self.config.dedup_link_method == 'symlink' and
+                    self._adjustable_matcher(name)):
+                # Adjustable files may become intermediate files which are
+                # deleted, thus can't be targets of symbolic links
+                self.stored_digests[digest] = hashed_name
+            return None
+
+        # Wait for the stored file if it's being saved by a writer thread
+        pending = self._pending_saves.get(self.clean_name(stored_name))
+
+        def save():
+            if pending is not None:
+                pending[1].wait()
+            return self.link_stored_file(stored_name, hashed_name)
+
+        size = content.size
+        self.deduplicated_files += 1
+        self.deduplicated_bytes += size
+        self.stats.add_deduplicated(size)
+        return self.submit_save(name, hashed_name, save)
+
+    def link_stored_file(self, stored_name, name):
+        # Store a file with the same content as a stored file without writing
+        # the content again: by linking it in the local file system as
+        # specified by "DEDUP_LINK_METHOD", otherwise with the "copy" method
+        # of the storage backend. Returns the name of the new file.
+        stats = self.stats
+        if not isinstance(self, FileSystemStorage):
+            stats.count_call('copy')
+            with stats.stage('copy'):
+                self.copy(stored_name, name)
+            return self.add_existing_file(name)
+
+        source_path = self.path(stored_name)
+        full_path = self.path(name)
+        self.make_directory(os.path.dirname(full_path))
+        link_method = self.config.dedup_link_method
+        stats.count_call('link')
+        with stats.stage('link'):
+            try:
+                if link_method == 'hardlink':
+                    os.link(source_path, full_path)
+                elif link_method == 'symlink':
+                    os.symlink(os.path.relpath(source_path,
+                                               os.path.dirname(full_path)),
+                               full_path)
+                else:
+                    self.clone_local_file(source_path, full_path)
+            except (IOError, OSError):
+                # E.g. across file systems, or unsupported by the file system.
+                # Copy it instead.
+                return self.copy_local_file(source_path, name)
+        return self.add_existing_file(name)
+
+    def clone_local_file(self, source_path, full_path):
+        fd = os.open(full_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                     getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                with open(source_path, 'rb') as source:
+                    clone_file(source, target)
+        except BaseException:
+            os.remove(full_path)
+            raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+    @property
+    def local_write_available(self):
+        # Whether files can be written to the local file system without going
+        # through _save(), which is only if no class but this mixin overrides
+        # _save() of FileSystemStorage
+        if not isinstance(self, FileSystemStorage):
+            return False
+        for cls in type(self).__mro__:
+            if cls is not SmartManifestFilesMixin and '_save' in vars(cls):
+                return cls is FileSystemStorage
+        return False
+
+    def get_local_source_path(self, storage, path):
+        # Return the path of a source file if it can be copied to this
+        # storage in the local file system without going through _save(),
+        # otherwise None
+        if self.config.local_copy_method is None or \
+                not self.local_write_available:
+            return None
+        try:
+            return storage.path(path)
+        except NotImplementedError:
+            return None
+
+    def stage_local_copy(self, cleaned_name, storage, path, content):
+        # Hash a large local file while copying it to a temporary file next
+        # to its hashed name, so that it isn't read again for copying.
+        # Returns the path of the temporary file, or None if the file isn't
+        # copied, e.g. if it's hashed already, or its hashed file of the
+        # previous run still exists, thus it's probably unchanged.
+        if self.config.local_copy_method != 'copy' or \
+                self.get_local_source_path(storage, path) is None:
+            return None
+        raw_file = getattr(content, 'file', None)
+        digest_key = self.get_digest_key(content)
+        if digest_key is None or not hasattr(raw_file, 'readinto'):
+            return None
+        digest_key += (self.config.hash_algorithm,)
+        if digest_key in self.digest_cache:
+            return None
+        previous_name = self.previous_hashed_files.get(
+            self.hash_key(cleaned_name))
+        if previous_name is not None and self.exists(previous_name):
+            return None
+
+        directory = os.path.dirname(self.path(cleaned_name))
+        self.make_directory(directory)
+        fd, staged_path = tempfile.mkstemp(
+            dir=directory, prefix='.smartstaticfiles-', suffix='.tmp')
+        self.staged_files.add(staged_path)
+        stats = self.stats
+        if stats.enabled:
+            stats.add_read(content.size)
+        try:
+            with stats.stage('hash'):
+                hasher = self.new_hasher()
+                with os.fdopen(fd, 'wb') as target:
+                    stats.add_written(hash_copy_file(
+                        hasher, raw_file, target, self.get_stream_buffer()))
+        except BaseException:
+            self.discard_staged_file(staged_path)
+            raise
+        # Found by file_hash()
+        self.digest_cache[digest_key] = hasher.hexdigest()
+        return staged_path
+
+    def move_staged_file(self, staged_path, name):
+        # Move a copy made by stage_local_copy() to the name. Returns the
+        # name.
+        full_path = self.path(name)
+        self.stats.count_call('copy')
+        if self.file_permissions_mode is not None:
+            os.chmod(staged_path, self.file_permissions_mode)
+        else:
+            os.chmod(staged_path, default_file_mode())
+        os.rename(staged_path, full_path)
+        self.staged_files.discard(staged_path)
+        return self.add_existing_file(name)
+
+    def discard_staged_file(self, staged_path):
+        self.staged_files.discard(staged_path)
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+
+    def copy_local_file(self, source_path, name):
+        # Copy a local file to the storage without reading it into memory,
+        # or hard-link it if "LOCAL_COPY_METHOD" is "hardlink". Returns the
+        # name of the copy.
+        full_path = self.path(name)
+        self.make_directory(os.path.dirname(full_path))
+
+        stats = self.stats
+        stats.count_call('copy')
+        with stats.stage('copy'):
+            if self.config.local_copy_method == 'hardlink':
+                try:
+                    os.link(source_path, full_path)
+                except OSError:
+                    # E.g. across file systems. Copy it instead.
+                    pass
+                else:
+                    return self.add_existing_file(name)
+
+            fd = os.open(full_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                         getattr(os, 'O_BINARY', 0), 0o666)
+            try:
+                with os.fdopen(fd, 'wb') as target:
+                    with open(source_path, 'rb') as source:
+                        stats.add_written(copy_file(source, target))
+            except Exception:
+                os.remove(full_path)
+                raise
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+            return self.add_existing_file(name)
+
+    def make_directory(self, directory):
+        # Create a directory of the local file system (with parents) if it
+        # doesn't exist
+        if os.path.exists(directory):
+            return
+        try:
+            if self.directory_permissions_mode is not None:
+                # Same as FileSystemStorage._save()
+                old_umask = os.umask(0)
+                try:
+                    os.makedirs(directory, self.directory_permissions_mode)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(directory)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+
+    def collect_saved_files(self, wait=False):
+        # Collect results of writer threads in order of submission, and yield
+        # failures in the form of results of _post_process(). Unless "wait" is
+        # True, only wait when too many files are pending.
+        if not self._pending_saves:
+            return
+        if self._io_engine is not None:
+            max_pending = self._io_engine.concurrency * 4
+        else:
+            max_pending = self.config.save_workers * 4
+        while self._pending_saves:
+            cleaned_name = next(iter(self._pending_saves))
+            name, result = self._pending_saves[cleaned_name]
+            if not wait and not result.ready() and \
+                    len(self._pending_saves) < max_pending:
+                break
+            del self._pending_saves[cleaned_name]
+            try:
+                saved_name = result.get()
+            except Exception as exc:
+                if self.checkpoint_files is not None:
+                    self.checkpoint_files.pop(self.clean_name(name), None)
+                yield name, None, exc, False
+                continue
+            if force_text(self.clean_name(saved_name)) != cleaned_name:
+                # Hashed names can't be changed once they are used
+                yield name, None, RuntimeError(
+                    "The file '%s' was saved as '%s'" % (cleaned_name,
+                                                        saved_name)
+                ), False
+
+    def get_combined_pattern(self, path):
+        # Return a combined pattern of all patterns for the file
+        extensions = tuple(extension for extension, matcher
+                           in self._extension_matchers if matcher(path))
+        combined_pattern = self._combined_patterns.get(extensions)
+        if combined_pattern is None:
+            combined_pattern = CombinedPattern(
+                [(pattern, template)
+                 for extension in extensions
+                 for pattern, template in self._patterns[extension]],
+                settings.FILE_CHARSET
+            )
+            self._combined_patterns[extensions] = combined_pattern
+        return combined_pattern
+
+    def scan_references(self, name, paths):
+        # Return names referenced by an adjustable file without substituting
+        # its content
+        storage, path = paths[name]
+        content_file = self.get_minified_content_file(name, paths=paths)
+        if content_file is None:
+            content_file = storage.open(path)
+        with content_file:
+            raw_content = content_file.read()
+
+        references = set()
+        combined_pattern = self.get_combined_pattern(path)
+        if not combined_pattern.may_match(raw_content):
+            return references
+        try:
+            content = raw_content.decode(settings.FILE_CHARSET)
+        except UnicodeDecodeError:
+            # Let _post_process() report it
+            return references
+
+        self._current_references = references
+        self._scanning_references = True
+        try:
+            combined_pattern.subn(
+                lambda template: self.url_converter(name, {}, template),
+                content
+            )
+        except ValueError:
+            pass
+        finally:
+            self._current_references = None
+            self._scanning_references = False
+        return references
+
+    def get_processing_order(self, paths):
+        # Build the reference graph of adjustable files, and return names of
+        # all files in which every adjustable file comes after the adjustable
+        # files it references. Raises ValueError on circular references.
+        names = sort_by_path_level(paths.keys())
+        adjustable_names = []
+        other_names = []
+        for name in names:
+            if self._adjustable_matcher(name):
+                adjustable_names.append(name)
+            else:
+                other_names.append(name)
+
+        re_ignore_hashing = self.config.re_ignore_hashing
+        graph = OrderedDict()
+        for name in adjustable_names:
+            cleaned_name = self.clean_name(name)
+            if cleaned_name in self.file_references:
+                # Already known, e.g. from the incremental index
+                references = self.file_references[cleaned_name]
+            elif re_ignore_hashing is not None and \
+                    re_ignore_hashing.search(cleaned_name):
+                references = set()
+            else:
+                references = self.scan_references(name, paths)
+                self.file_references[cleaned_name] = references
+            graph[cleaned_name] = references
+
+        names_by_cleaned = dict((self.clean_name(name), name)
+                                for name in adjustable_names)
+        return other_names + [names_by_cleaned[cleaned_name]
+                              for cleaned_name in sort_topologically(graph)]
+
+    def get_source_signature(self, storage, path):
+        # Return the modification time and size of a source file, or None if
+        # the source storage isn't on the local filesystem
+        try:
+            stat = os.stat(storage.path(path))
+        except (NotImplementedError, OSError):
+            return None
+        return [stat.st_mtime, stat.st_size]
+
+    def get_source_hash(self, storage, path):
+        md5 = hashlib.md5()
+        with storage.open(path) as content:
+            for chunk in content.chunks():
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    def get_incremental_fingerprint(self):
+        # Any change of these invalidates the whole incremental index
+        payload = [
+            __version__,
+            '%s.%s' % (type(self).__module__, type(self).__name__),
+            settings.STATIC_URL,
+            settings.FILE_CHARSET,
+            getattr(settings, settings_attr, None),
+        ]
+        return hashlib.md5(force_bytes(
+            json.dumps(payload, sort_keys=True, default=repr)
+        )).hexdigest()
+
+    def read_incremental_index(self):
+        try:
+            with self.open(self.incremental_index_name) as index:
+                stored = json.loads(index.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return None
+        if stored.get('version') != self.incremental_index_version or \
+                stored.get('fingerprint') != \
+                self.get_incremental_fingerprint():
+            return None
+        return stored.get('files')
+
+    def save_incremental_index(self):
+        payload = {
+            'version': self.incremental_index_version,
+            'fingerprint': self.get_incremental_fingerprint(),
+            'files': self.incremental_index,
+        }
+        if self.exists(self.incremental_index_name):
+            self.delete(self.incremental_index_name)
+        contents = json.dumps(payload).encode('utf-8')
+        self._save(self.incremental_index_name, ContentFile(contents),
+                   disable_minified_cache=True)
+
+    def plan_incremental(self, paths):
+        # Find files which are unchanged since the previous run, as well as
+        # all files they reference (transitively). Returns a dict mapping
+        # cleaned names of these files to their hashed names in the previous
+        # manifest.
+        self.incremental_index = {}
+        previous_index = self.read_incremental_index()
+        try:
+            previous_manifest = self.load_manifest()
+        except ValueError:
+            previous_manifest = None
+        if not previous_index or not previous_manifest:
+            return {}
+
+        names = dict((self.clean_name(name), name) for name in paths)
+        dirty = set()
+        for cleaned_name, name in iteritems(names):
+            entry = previous_index.get(cleaned_name)
+            storage, path = paths[name]
+            signature = self.get_source_signature(storage, path)
+            if entry is None or signature is None or \
+                    self.hash_key(cleaned_name) not in previous_manifest:
+                dirty.add(cleaned_name)
+                continue
+            if entry['stat'] != signature:
+                # Touched but maybe not modified. Compare the content hash.
+                if entry['hash'] != self.get_source_hash(storage, path):
+                    dirty.add(cleaned_name)
+                    continue
+                entry = dict(entry, stat=signature)
+            self.incremental_index[cleaned_name] = entry
+
+        # Propagate changes to files which reference changed files
+        referrers = {}
+        for cleaned_name, entry in iteritems(self.incremental_index):
+            for ref in entry['refs']:
+                if ref not in names:
+                    # The referenced file is gone
+                    dirty.add(cleaned_name)
+                referrers.setdefault(ref, []).append(cleaned_name)
+        stack = list(dirty)
+        while stack:
+            for cleaned_name in referrers.get(stack.pop(), ()):
+                if cleaned_name not in dirty:
+                    dirty.add(cleaned_name)
+                    stack.append(cleaned_name)
+
+        skipped_files = {}
+        for cleaned_name in names:
+            if cleaned_name in dirty:
+                self.incremental_index.pop(cleaned_name, None)
+                continue
+            hashed_name = previous_manifest[self.hash_key(cleaned_name)]
+            # Keep the source map generated by minifying the file as well
+            map_name = self.get_source_map_name(cleaned_name)
+            hashed_map_name = None
+            if map_name not in names:
+                hashed_map_name = previous_manifest.get(
+                    self.hash_key(map_name))
+            if self.exists(hashed_name) and (hashed_map_name is None or
+                                             self.exists(hashed_map_name)):
+                skipped_files[cleaned_name] = hashed_name
+                self.file_references[cleaned_name] = \
+                    set(self.incremental_index[cleaned_name]['refs'])
+                if hashed_map_name is not None:
+                    self.incremental_source_maps[cleaned_name] = \
+                        hashed_map_name
+            else:
+                self.incremental_index.pop(cleaned_name)
+        return skipped_files
+
+    def update_incremental_index(self, paths):
+        # Add entries of files processed in this run
+        for name in paths:
+            cleaned_name = self.clean_name(name)
+            if cleaned_name in self.incremental_index:
+                continue
+            storage, path = paths[name]
+            signature = self.get_source_signature(storage, path)
+            if signature is None:
+                continue
+            self.incremental_index[cleaned_name] = {
+                'stat': signature,
+                'hash': self.get_source_hash(storage, path),
+                # Generated source maps change along with the file
+                'refs': sorted(self.file_references.get(cleaned_name, set()) -
+                               self.source_map_names),
+            }
+
+    def get_checkpoint_name(self):
+        if self.shard_index is not None:
+            return self.shard_checkpoint_name % (self.shard_index,
+                                                 self.shard_count)
+        return self.checkpoint_name
+
+    def get_checkpoint_sources(self, paths):
+        # Return a digest of modification times and sizes of all source
+        # files, or None if any of them isn't in the local file system
+        signatures = []
+        for name in sorted(paths):
+            storage, path = paths[name]
+            signature = self.get_source_signature(storage, path)
+            if signature is None:
+                return None
+            signatures.append([self.clean_name(name), signature])
+        return hashlib.md5(force_bytes(json.dumps(signatures))).hexdigest()
+
+    def get_existing_names(self, names):
+        # Return a set of those of the names which exist in the storage,
+        # checked concurrently if the async I/O engine is running
+        names = list(names)
+        if self._io_engine is not None and self.existing_files is None:
+            results = [self._io_engine.apply_async(self.exists, (name,))
+                       for name in names]
+            return set(name for name, result in zip(names, results)
+                       if result.get())
+        return set(name for name in names if self.exists(name))
+
+    def resume_checkpoint(self, paths):
+        # Start saving checkpoints, and resume from the checkpoint of an
+        # interrupted run with the same source files and settings. Files it
+        # has completed are skipped as in incremental post-processing, if
+        # their hashed files (and generated source maps) still exist.
+        self.checkpoint_sources = self.get_checkpoint_sources(paths)
+        if self.checkpoint_sources is None:
+            logger.warning('Checkpoints are disabled, since not all source '
+                           'files are in the local file system')
+            return
+        self.checkpoint_files = {}
+        self.checkpoint_due_time = default_timer() + \
+            self.config.checkpoint_interval
+        stored = self.read_checkpoint()
+        if stored is None:
+            return
+
+        stored_hashed_files = stored['hashed_files']
+        source_maps = set(stored['source_maps'])
+        outputs = {}
+        for cleaned_name in stored['completed']:
+            hashed_name = stored_hashed_files[self.hash_key(cleaned_name)]
+            map_name = self.get_source_map_name(cleaned_name)
+            hashed_map_name = None
+            if map_name in source_maps:
+                hashed_map_name = stored_hashed_files[self.hash_key(map_name)]
+            outputs[cleaned_name] = (hashed_name, hashed_map_name)
+        existing_names = self.get_existing_names(
+            output for hashed_name, hashed_map_name in itervalues(outputs)
+            for output in (hashed_name, hashed_map_name) if output is not None
+        )
+
+        resumed_files = {}
+        for cleaned_name, (hashed_name, hashed_map_name) in \
+                iteritems(outputs):
+            if hashed_name not in existing_names or (
+                    hashed_map_name is not None and
+                    hashed_map_name not in existing_names):
+                continue
+            resumed_files[cleaned_name] = hashed_name
+            if hashed_map_name is not None:
+                self.incremental_source_maps[cleaned_name] = hashed_map_name
+        self.incremental_skipped_files.update(resumed_files)
+        # Known references spare scanning (and minifying) resumed files again
+        references = stored['references']
+        for cleaned_name in resumed_files:
+            if cleaned_name in references:
+                self.file_references[cleaned_name] = \
+                    set(references[cleaned_name])
+        self.hashing_ignored_files.update(stored['hashing_ignored_files'])
+        self.intermediate_files.update(stored['intermediate_files'])
+        logger.info('Resumed from checkpoint, files completed: %s of %s',
+                    len(resumed_files), len(outputs))
+
+    def read_checkpoint(self):
+        try:
+            with self.open(self.get_checkpoint_name()) as checkpoint:
+                stored = json.loads(checkpoint.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return None
+        if not isinstance(stored, dict) or \
+                stored.get('version') != self.checkpoint_version or \
+                stored.get('fingerprint') != \
+                self.get_incremental_fingerprint() or \
+                stored.get('sources') != self.checkpoint_sources:
+            logger.info("Checkpoint '%s' is outdated, starting over",
+                        self.get_checkpoint_name())
+            return None
+        return stored
+
+    def save_checkpoint(self, hashed_files):
+        # Save hashed names of completed files. All of them must have been
+        # saved.
+        checkpoint_hashed_files = {}
+        source_maps = []
+        references = {}
+        for cleaned_name, hashed_name in iteritems(self.checkpoint_files):
+            checkpoint_hashed_files[self.hash_key(cleaned_name)] = hashed_name
+            if cleaned_name in self.file_references:
+                references[cleaned_name] = \
+                    sorted(self.file_references[cleaned_name])
+            map_name = self.get_source_map_name(cleaned_name)
+            if map_name in self.source_map_names:
+                map_hash_key = self.hash_key(map_name)
+                if map_hash_key in hashed_files:
+                    checkpoint_hashed_files[map_hash_key] = \
+                        hashed_files[map_hash_key]
+                    source_maps.append(map_name)
+        payload = {
+            'version': self.checkpoint_version,
+            'fingerprint': self.get_incremental_fingerprint(),
+            'sources': self.checkpoint_sources,
+            'completed': sorted(self.checkpoint_files),
+            'hashed_files': checkpoint_hashed_files,
+            'source_maps': sorted(source_maps),
+            'references': references,
+            'hashing_ignored_files': sorted(self.hashing_ignored_files),
+            'intermediate_files': sorted(self.intermediate_files),
+        }
+        name = self.get_checkpoint_name()
+        if self.exists(name):
+            self.delete(name)
+        contents = json.dumps(payload).encode('utf-8')
+        self._save(name, ContentFile(contents), disable_minified_cache=True)
+        self.checkpoint_due_time = default_timer() + \
+            self.config.checkpoint_interval
+
+    def get_precompressed_names(self, name):
+        # Return names of precompressed variants of a file, with their
+        # compression callables
+        return [(name + extension, compress)
+                for extension, compress in (
+                    compressors[compress_format] for compress_format
+                    in self.config.precompress_formats)]
+
+    def precompress_content(self, name, content=None, reopen=None,
+                            refresh=False):
+        # Create precompressed variants of a file while post-processing, from
+        # its content if it's in memory, otherwise from the content returned
+        # by "reopen". Variants which exist, or which weren't smaller than the
+        # file in the previous run, are kept unless "refresh" is True, since
+        # content of a hashed file never changes.
+        if not self.precompress_formats or \
+                not self.config.precompress_file_matcher(name):
+            return
+        cleaned_name = force_text(self.clean_name(name))
+        if cleaned_name in self.precompressed_variants:
+            # Already done in this run
+            return
+        content_bytes = None
+        if content is not None:
+            content_bytes = get_content_bytes(content)
+        if content_bytes is None and reopen is None:
+            return
+
+        variants = []
+        for variant_name, compress in self.get_precompressed_names(
+                cleaned_name):
+            if not refresh:
+                if variant_name in self.previous_skipped_variants:
+                    self.skipped_variants[variant_name] = cleaned_name
+                    continue
+                if self.exists(variant_name):
+                    continue
+            variants.append((variant_name, compress))
+        self.precompressed_variants[cleaned_name] = []
+        if not variants:
+            return
+
+        if self._precompress_pool is None:
+            self.add_precompressed_variants(cleaned_name, self.compress_content(
+                variants, content_bytes, reopen))
+            return
+        self._pending_precompressions.append((
+            cleaned_name,
+            self._precompress_pool.apply_async(
+                self.compress_content, (variants, content_bytes, reopen))
+        ))
+        self.collect_precompressed_files()
+
+    def precompress_stored_file(self, name):
+        # Make sure that a hashed file which isn't processed in this run has
+        # its precompressed variants. It's read from the storage only if any
+        # of them is missing.
+        self.precompress_content(name, reopen=lambda: self.open(name))
+
+    def precompress_ignored_file(self, name, paths):
+        # Content of a file ignored for hashing may change, thus its variants
+        # are created again from its minified content or its source file.
+        # Minified content which isn't in memory is only read from the
+        # storage if a variant is missing, since the file isn't copied in
+        # this run.
+        cleaned_name = self.clean_name(name)
+        if cleaned_name in self.minified_files:
+            self.precompress_content(
+                cleaned_name,
+                reopen=lambda: self.minified_files.open(cleaned_name),
+                refresh=True
+            )
+        elif settings.DEBUG or self.get_minifier(cleaned_name) is None:
+            storage, path = paths[name]
+            self.precompress_content(cleaned_name,
+                                     reopen=lambda: storage.open(path),
+                                     refresh=True)
+        else:
+            self.precompress_stored_file(cleaned_name)
+
+    def compress_content(self, variants, content_bytes=None, reopen=None):
+        # Save compressed variants of the content, unless they are not
+        # smaller than the content. Returns a tuple of names of saved and
+        # skipped variants.
+        with self.stats.stage('precompress'):
+            if content_bytes is None:
+                content = reopen()
+                try:
+                    content_bytes = content.read()
+                finally:
+                    content.close()
+            saved_names = []
+            skipped_names = []
+            for variant_name, compress in variants:
+                compressed_content = compress(content_bytes)
+                if self.exists(variant_name):
+                    self.delete(variant_name)
+                if len(compressed_content) >= len(content_bytes):
+                    skipped_names.append(variant_name)
+                    continue
+                saved_name = self._save(variant_name,
+                                        ContentFile(compressed_content),
+                                        disable_minified_cache=True)
+                saved_names.append(force_text(self.clean_name(saved_name)))
+            return saved_names, skipped_names
+
+    def add_precompressed_variants(self, cleaned_name, result):
+        saved_names, skipped_names = result
+        self.precompressed_variants[cleaned_name] = saved_names
+        for variant_name in skipped_names:
+            self.skipped_variants[variant_name] = cleaned_name
+
+    def collect_precompressed_files(self, wait=False):
+        # Collect results of precompression threads in order of submission.
+        # Unless "wait" is True, only wait when too many files are pending.
+        max_pending = (self.precompress_workers or 1) * 4
+        while self._pending_precompressions:
+            cleaned_name, result = self._pending_precompressions[0]
+            if not wait and not result.ready() and \
+                    len(self._pending_precompressions) < max_pending:
+                break
+            self._pending_precompressions.popleft()
+            self.add_precompressed_variants(cleaned_name, result.get())
+
+    def load_skipped_variants(self):
+        # Return names of precompressed variants which the previous run
+        # didn't save, as recorded in the manifest
+        content = self.read_manifest()
+        if content is None:
+            return set()
+        try:
+            stored = json.loads(content)
+        except ValueError:
+            return set()
+        return set(stored.get('skipped_variants', ()))
+
+    def get_manifest_payload(self):
+        payload = {'paths': self.hashed_files,
+                   'version': self.manifest_version}
+        if self.skipped_variants:
+            # Record variants of final files which aren't saved, so that they
+            # aren't compressed again by the next run
+            final_names = set(itervalues(self.hashed_files))
+            skipped_variants = sorted(
+                variant_name for variant_name, cleaned_name
+                in iteritems(self.skipped_variants)
+                if cleaned_name in final_names
+            )
+            if skipped_variants:
+                payload['skipped_variants'] = skipped_variants
+        return payload
+
+    def get_compact_manifest_path(self):
+        # The compact manifest is memory-mapped, thus only available in the
+        # local file system
+        try:
+            return self.path(self.compact_manifest_name)
+        except NotImplementedError:
+            return None
+
+    def load_compact_manifest(self):
+        # Return the compact manifest, or None if it's unavailable or older
+        # than the JSON manifest
+        path = self.get_compact_manifest_path()
+        if path is None:
+            return None
+        try:
+            compact_mtime = os.path.getmtime(path)
+            manifest_mtime = os.path.getmtime(self.path(self.manifest_name))
+        except OSError:
+            return None
+        if compact_mtime < manifest_mtime:
+            return None
+        try:
+            return CompactManifest(path)
+        except (IOError, OSError, ValueError):
+            logger.warning("Couldn't load compact manifest '%s'", path)
+            return None
+
+    def load_manifest(self):
+        if self._deferring_manifest:
+            # Loaded on first use of "hashed_files"
+            return None
+        if self.compact_manifest_enabled:
+            compact_manifest = self.load_compact_manifest()
+            if compact_manifest is not None:
+                return compact_manifest
+        return super(SmartManifestFilesMixin, self).load_manifest()
+
+    def save_manifest(self):
+        with self.stats.stage('manifest'):
+            self._save_manifest()
+
+    def _save_manifest(self):
+        if self.shard_index is not None:
+            # The manifest is written by the merge run
+            self.save_shard_manifest()
+            return
+        # Same as save_manifest() of ManifestFilesMixin, plus skipped
+        # precompressed variants
+        if self.exists(self.manifest_name):
+            self.delete(self.manifest_name)
+        contents = json.dumps(self.get_manifest_payload()).encode('utf-8')
+        self._save(self.manifest_name, ContentFile(contents))
+        path = self.get_compact_manifest_path()
+        if path is None:
+            return
+        if self.compact_manifest_enabled:
+            write_compact_manifest(
+                path, self.hashed_files,
+                getattr(self, 'file_permissions_mode', None))
+        elif os.path.exists(path):
+            # Never leave a stale compact manifest behind
+            os.remove(path)
+
+    def in_shard(self, name):
+        # Whether a file belongs to the shard of this run. Files are assigned
+        # to shards by a checksum of their names, which is the same in every
+        # process.
+        checksum = zlib.crc32(force_bytes(self.clean_name(name))) & 0xffffffff
+        return checksum % self.shard_count == self.shard_index
+
+    def get_shard_paths(self, paths):
+        # Return non-adjustable files of the shard of this run. Adjustable
+        # files are left to the merge run, since they reference files of
+        # other shards.
+        return OrderedDict(
+            (name, paths[name]) for name in paths
+            if not self._adjustable_matcher(name) and self.in_shard(name)
+        )
+
+    def get_shard_manifest_name(self, index):
+        return self.shard_manifest_name % (index, self.shard_count)
+
+    def save_shard_manifest(self):
+        name = self.get_shard_manifest_name(self.shard_index)
+        payload = self.get_manifest_payload()
+        if self.exists(name):
+            self.delete(name)
+        contents = json.dumps(payload).encode('utf-8')
+        self._save(name, ContentFile(contents), disable_minified_cache=True)
+
+    def read_shard_manifests(self, paths):
+        # Return a dict mapping cleaned names of files processed by shard runs
+        # to their hashed names. Raises ValueError if a partial manifest is
+        # missing.
+        shard_hashed_files = {}
+        for index in range(self.shard_count):
+            name = self.get_shard_manifest_name(index)
+            try:
+                with self.open(name) as manifest:
+                    stored = json.loads(manifest.read().decode('utf-8'))
+            except IOError:
+                raise ValueError(
+                    "Missing partial manifest '%s'. All shards must be run "
+                    "before merging." % name
+                )
+            except ValueError:
+                stored = None
+            if not isinstance(stored, dict) or \
+                    stored.get('version') != self.manifest_version:
+                raise ValueError("Couldn't load partial manifest '%s'" % name)
+            shard_hashed_files.update(stored['paths'])
+            self.previous_skipped_variants.update(
+                stored.get('skipped_variants', ()))
+
+        shard_files = {}
+        for name in paths:
+            cleaned_name = self.clean_name(name)
+            hash_key = self.hash_key(cleaned_name)
+            if hash_key in shard_hashed_files:
+                shard_files[cleaned_name] = shard_hashed_files[hash_key]
+        return shard_files
+
+    def save_stats_report(self, stats):
+        # Write statistics of post-processing as a JSON file next to the
+        # manifest
+        name = self.stats_report_name
+        if self.exists(name):
+            self.delete(name)
+        contents = json.dumps(stats, indent=2, sort_keys=True).encode('utf-8')
+        self._save(name, ContentFile(contents), disable_minified_cache=True)
+
+    @property
+    def parallel_min_enabled(self):
+        return bool(self.min_workers and self.min_workers > 1 and
+                    (self.js_min_enabled or self.css_min_enabled))
+
     def post_process(self, paths, *args, **kwargs):
+        # Run I/O of post-processing in the async I/O engine if enabled
+        if self.async_io_enabled and not kwargs.get('dry_run', False):
+            self._io_engine = AsyncIOEngine(self.async_io_concurrency)
+        try:
+            for post_processed in self.post_process_files(paths, *args,
+                                                          **kwargs):
+                yield post_processed
+        finally:
+            if self._io_engine is not None:
+                self._io_engine.close()
+                self._io_engine = None
+
+    def post_process_files(self, paths, *args, **kwargs):
+        dry_run = kwargs.get('dry_run', False)
+        self._post_processing = True
+        if self.stats_enabled:
+            self.stats = PostProcessStats(self.stats_top_files)
+        else:
+            self.stats = null_stats
+        stats = self.stats
+        # Files being copied are all saved before the target is listed
+        with stats.stage('minify'):
+            self.collect_minified_copies(wait=True)
+        shard_run = self.shard_index is not None
+        merge_run = self.shard_count is not None and not shard_run
+        if shard_run:
+            paths = self.get_shard_paths(paths)
+        self.file_references = {}
+        self.incremental_skipped_files = {}
+        self.incremental_source_maps = {}
+        self.source_map_names = set()
+        # Listed before planning, so that existence checks of the plans are
+        # answered from the list as well
+        self.existing_files = None
+        if self.exists_cache_enabled and not dry_run:
+            with stats.stage('list'):
+                self.existing_files = set(
+                    self.clean_name(name)
+                    for name in self.list_existing_files()
+                )
+        self.precompressed_variants = {}
+        self.skipped_variants = {}
+        self.previous_skipped_variants = set()
+        if self.precompress_formats and not dry_run:
+            self.previous_skipped_variants = self.load_skipped_variants()
+        if self.incremental_enabled and not dry_run:
+            # Must be done before the manifest is reset by ManifestFilesMixin
+            with stats.stage('incremental'):
+                self.incremental_skipped_files = self.plan_incremental(paths)
+        if merge_run and not dry_run:
+            # Files processed by shard runs are reused as they are
+            self.incremental_skipped_files.update(
+                self.read_shard_manifests(paths)
+            )
+
+        self.previous_hashed_files = {}
+        if self.config.local_copy_method == 'copy' and \
+                self.local_write_available and not dry_run:
+            # Must be done before the manifest is reset by ManifestFilesMixin
+            try:
+                self.previous_hashed_files = super(
+                    SmartManifestFilesMixin, self).load_manifest()
+            except ValueError:
+                pass
+
         all_post_processed = super(SmartManifestFilesMixin,
                                    self).post_process(paths, *args, **kwargs)
 
+        self.processing_order = None
+        self.finalized_files = set()
+        self.digest_cache = {}
+        self.stored_digests = {}
+        self.deduplicated_files = 0
+        self.deduplicated_bytes = 0
+        if self._io_engine is not None:
+            # Hashed files are saved by the async I/O engine instead
+            self._save_pool = self._io_engine
+        elif self.save_workers and self.save_workers > 1 and not dry_run:
+            self._save_pool = ThreadPool(self.save_workers)
+        if self.precompress_formats and self.precompress_workers and \
+                self.precompress_workers > 1 and not dry_run:
+            self._precompress_pool = ThreadPool(self.precompress_workers)
+        self.checkpoint_files = None
+        if self.checkpoint_interval is not None and not dry_run:
+            with stats.stage('checkpoint'):
+                self.resume_checkpoint(paths)
         try:
+            if self.parallel_min_enabled and not settings.DEBUG and \
+                    not dry_run:
+                with stats.stage('minify'):
+                    self.minify_paths(paths)
+
+            if not dry_run:
+                try:
+                    with stats.stage('order'):
+                        self.processing_order = \
+                            self.get_processing_order(paths)
+                except ValueError as exc:
+                    # Report it. collectstatic raises it and stops, while
+                    # other callers which go on get the repeated passes of
+                    # HashedFilesMixin.
+                    yield 'All', None, exc
+
             for post_processed in all_post_processed:
                 yield post_processed
         finally:
-            temp_file_set = set(itervalues(self.minified_files))
-            for f in temp_file_set:
-                try:
-                    os.remove(f)
-                except OSError as err:
-                    pass
-            for f in temp_file_set:
-                yield f, '<temp file deleted>', True
+            self._url_memo = {}
+            self._url_memo_hashed_files = None
+            self._url_cache_hashed_files = None
+            if self._save_pool is not None:
+                # Pending files are all collected unless the run is aborted.
+                # The async I/O engine is closed by post_process().
+                if self._save_pool is not self._io_engine:
+                    self._save_pool.close()
+                self._save_pool.join()
+                self._save_pool = None
+                self._pending_saves.clear()
+            if self._precompress_pool is not None:
+                self._precompress_pool.close()
+                self._precompress_pool.join()
+                self._precompress_pool = None
+                self._pending_precompressions.clear()
+            # Copies left behind by an aborted run
+            for staged_path in list(self.staged_files):
+                self.discard_staged_file(staged_path)
+            self.previous_hashed_files = {}
+            temp_file_set = self.minified_files.clear() + \
+                self.minified_source_maps.clear()
+            min_cache = self.min_cache
+            if min_cache is not None:
+                # Keep the persistent minification cache within its size cap
+                min_cache.cull()
+
+        # Not yielded in the "finally" block above, since the generator may be
+        # closed by an error reported earlier
+        for f in temp_file_set:
+            yield f, '<temp file deleted>', True
 
-        if self.delete_unhashed_enabled:
+        if self.delete_unhashed_enabled and not shard_run:
             # Delete unhashed files from target storage
-            if self.hashing_ignored_files:
-                # Prevent hashing ignored files from being deleted
+            if self.hashing_ignored_files or self.source_map_names:
+                # Prevent hashing ignored files from being deleted, and
+                # generated source maps which only have hashed names
                 unhashed_files = (set(iterkeys(self.hashed_files)) -
-                                  self.hashing_ignored_files)
+                                  self.hashing_ignored_files -
+                                  self.source_map_names)
             else:
                 unhashed_files = iterkeys(self.hashed_files)
-            for f in unhashed_files:
-                self.delete(f)
+            for f in self.delete_files(unhashed_files):
                 yield f, '<unhashed file deleted>', True
 
         if self.delete_intermediate_enabled:
-            # Delete intermediate files from target storage
-            for f in self.intermediate_files:
-                self.delete(f)
+            # Delete intermediate files from target storage, along with their
+            # precompressed variants
+            intermediate_files = set(self.intermediate_files)
+            if self.precompress_formats:
+                intermediate_files.update(
+                    variant_name for name in self.intermediate_files
+                    for variant_name, compress
+                    in self.get_precompressed_names(name)
+                    if self.exists(variant_name)
+                )
+            for f in self.delete_files(intermediate_files):
                 yield f, '<intermediate file deleted>', True
 
+        if self.precompress_formats and not dry_run:
+            # Report precompressed variants of final files, which are created
+            # while post-processing
+            for name in sorted(set(itervalues(self.hashed_files))):
+                for variant_name in self.precompressed_variants.get(name, ()):
+                    yield name, variant_name, True
+
+        if self.incremental_enabled and not dry_run and not shard_run:
+            with stats.stage('incremental'):
+                self.update_incremental_index(paths)
+                self.save_incremental_index()
+
+        if self.preload_manifest_name and not dry_run and not shard_run:
+            self.save_preload_manifest()
+
+        if merge_run and not dry_run:
+            # Partial manifests are merged into the manifest
+            self.delete_files(
+                self.get_shard_manifest_name(index)
+                for index in range(self.shard_count)
+            )
+
+        if self.checkpoint_files is not None:
+            # All files are done
+            checkpoint_name = self.get_checkpoint_name()
+            if self.exists(checkpoint_name):
+                self.delete(checkpoint_name)
+            self.checkpoint_files = None
+
+        self.existing_files = None
+        self._post_processing = False
+        self.stored_digests = {}
+        if self.deduplicated_files:
+            logger.info('Deduplicated files: %s, bytes not written: %s',
+                        self.deduplicated_files, self.deduplicated_bytes)
+
+        if stats.enabled:
+            stats.finish()
+            self.stats = null_stats
+            self.last_stats = stats.as_dict()
+            if self.stats_report_name and not dry_run:
+                self.save_stats_report(self.last_stats)
+            post_process_stats.send(sender=self.__class__, storage=self,
+                                    stats=self.last_stats)
+
 
 class SmartManifestStaticFilesStorage(SmartManifestFilesMixin,
                                       StaticFilesStorage):
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Run the test suite: python runtests.py [test labels]
+import os
+import sys
+
+import django
+from django.conf import settings
+from django.test.utils import get_runner
+
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    settings.configure(
+        DEBUG=False,
+        DATABASES={
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': ':memory:',
+            },
+        },
+        INSTALLED_APPS=['django.contrib.staticfiles'],
+        STATIC_URL='/static/',
+        STATICFILES_STORAGE='django_smartstaticfiles.storage.'
+                            'SmartManifestStaticFilesStorage',
+        USE_I18N=False,
+        LOGGING_CONFIG=None,
+    )
+    django.setup()
+    test_runner = get_runner(settings)()
+    failures = test_runner.run_tests(sys.argv[1:] or ['tests'])
+    sys.exit(bool(failures))
+
+
+if __name__ == '__main__':
+    main()
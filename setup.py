@@ -11,7 +11,7 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 setup(
     name='django-smartstaticfiles',
     version='0.3.2',
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'tests.*']),
     include_package_data=True,
     license='BSD License',
     description='Provides enhanced static files storage backend for Django 1.11',
@@ -25,6 +25,7 @@ setup(
     extras_require={
         'jsmin': ['rjsmin'],
         'cssmin': ['rcssmin'],
+        'brotli': ['brotli'],
     },
     classifiers=[
         'Development Status :: 3 - Alpha',
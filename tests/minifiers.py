@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+
+def minify_with_source_map(content, **kwargs):
+    # Collapse whitespace, and return a source map along with the result
+    if not isinstance(content, bytes):
+        content = content.encode('utf-8')
+    source_map = {'version': 3, 'sources': ['source'], 'names': [],
+                  'mappings': 'AAAA'}
+    return b' '.join(content.split()), source_map
+
+
+# Contents minified by "minify_counting", in order
+minified_contents = []
+
+
+def minify_counting(content, **kwargs):
+    # Collapse whitespace, recording the content
+    minified_contents.append(content)
+    return b' '.join(content.split())
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import re
+import threading
+import time
+from collections import Counter
+
+from django.contrib.staticfiles.storage import StaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+
+from django_smartstaticfiles.engine import asyncio
+from django_smartstaticfiles.storage import SmartManifestFilesMixin
+
+
+class CountingFileSystemStorage(StaticFilesStorage):
+    # A local storage backend which counts calls made while post-processing,
+    # as if each of them were a request to a remote storage
+    calls = Counter()
+    opened_names = set()
+
+    def count(self, method):
+        if self._post_processing:
+            self.calls[method] += 1
+
+    def exists(self, name):
+        self.count('exists')
+        return super(CountingFileSystemStorage, self).exists(name)
+
+    def delete(self, name):
+        self.count('delete')
+        return super(CountingFileSystemStorage, self).delete(name)
+
+    def listdir(self, path):
+        self.count('listdir')
+        return super(CountingFileSystemStorage, self).listdir(path)
+
+    def _open(self, name, mode='rb'):
+        self.count('open')
+        if self._post_processing:
+            self.opened_names.add(name)
+        return super(CountingFileSystemStorage, self)._open(name, mode)
+
+
+class CountingStorage(SmartManifestFilesMixin, CountingFileSystemStorage):
+    pass
+
+
+class OpeningStorage(SmartManifestFilesMixin, StaticFilesStorage):
+    # Records names of all files opened, e.g. the manifest while resolving
+    # URLs
+    opened_names = []
+
+    def _open(self, name, mode='rb'):
+        self.opened_names.append(name)
+        return super(OpeningStorage, self)._open(name, mode)
+
+
+class BulkDeleteStorage(CountingStorage):
+    def bulk_delete(self, names):
+        self.count('bulk_delete')
+        for name in names:
+            super(CountingFileSystemStorage, self).delete(name)
+
+
+class LatencyFileSystemStorage(StaticFilesStorage):
+    # A local storage backend which sleeps in each save and existence check
+    # while post-processing, as if they were requests to a remote storage,
+    # and records the maximum number of them running at the same time in
+    # threads other than "caller_thread" (i.e. in the async I/O engine).
+    # Requests matching "fail_pattern" (e.g. "_save css/a.css") raise IOError,
+    # or only those in the engine if "fail_in_caller" is False.
+    latency = 0.01
+    fail_pattern = None
+    fail_in_caller = True
+    caller_thread = None
+    max_running = 0
+    engines = []
+
+    _lock = threading.Lock()
+    _running = 0
+
+    def request(self, method, name):
+        if not self._post_processing:
+            return
+        cls = LatencyFileSystemStorage
+        in_caller = threading.current_thread() is cls.caller_thread
+        if in_caller:
+            time.sleep(self.latency)
+        else:
+            with cls._lock:
+                cls._running += 1
+                cls.max_running = max(cls.max_running, cls._running)
+            try:
+                time.sleep(self.latency)
+            finally:
+                with cls._lock:
+                    cls._running -= 1
+        if self.fail_pattern and (self.fail_in_caller or not in_caller) and \
+                re.search(self.fail_pattern, '%s %s' % (method, name)):
+            raise IOError("Couldn't reach '%s'" % name)
+
+    def exists(self, name):
+        self.request('exists', name)
+        return super(LatencyFileSystemStorage, self).exists(name)
+
+    def _save(self, name, content):
+        self.request('_save', name)
+        return super(LatencyFileSystemStorage, self)._save(name, content)
+
+
+class LatencyStorage(SmartManifestFilesMixin, LatencyFileSystemStorage):
+    def post_process_files(self, *args, **kwargs):
+        # Remember the async I/O engine, which is gone after post-processing
+        self.engines.append(self._io_engine)
+        return super(LatencyStorage, self).post_process_files(*args, **kwargs)
+
+
+class NativeAsyncStorage(SmartManifestFilesMixin, StaticFilesStorage):
+    # A storage backend with native coroutine methods, which are awaited in
+    # the event loop of the async I/O engine
+    async_calls = []
+
+    def async_exists(self, name):
+        self.async_calls.append(('exists', name))
+        return asyncio.sleep(
+            0.001, result=StaticFilesStorage.exists(self, name))
+
+    def async_save(self, name, content):
+        self.async_calls.append(('save', name))
+        return asyncio.sleep(
+            0.001, result=StaticFilesStorage._save(self, name, content))
+
+    def async_delete(self, name):
+        self.async_calls.append(('delete', name))
+        StaticFilesStorage.delete(self, name)
+        return asyncio.sleep(0.001)
+
+
+class PoolMinifyStorage(SmartManifestFilesMixin, StaticFilesStorage):
+    # Records files being copied which are minified in the process pool
+    pooled_names = []
+
+    def submit_minified_copy(self, name, content):
+        submitted = super(PoolMinifyStorage, self).submit_minified_copy(
+            name, content)
+        if submitted:
+            self.pooled_names.append(name)
+        return submitted
+
+
+class SmallMemoryStorage(SmartManifestFilesMixin, StaticFilesStorage):
+    # Files over 16 bytes are handled as large files, which aren't read into
+    # memory. Records source files copied by copy_local_file(), which reads
+    # them again.
+    max_in_memory_size = 16
+    copied_sources = []
+
+    def copy_local_file(self, source_path, name):
+        self.copied_sources.append(source_path)
+        return super(SmallMemoryStorage, self).copy_local_file(source_path,
+                                                               name)
+
+
+class SaveOverrideStorage(SmallMemoryStorage):
+    # Records names saved through _save()
+    saved_names = []
+
+    def _save(self, name, content, *args, **kwargs):
+        self.saved_names.append(name)
+        return super(SaveOverrideStorage, self)._save(name, content, *args,
+                                                      **kwargs)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptingStorage(SmartManifestFilesMixin, StaticFilesStorage):
+    # Records names saved while post-processing (but checkpoints), and raises
+    # Interrupted instead of saving once "save_limit" of them are saved
+    save_limit = None
+    saved_names = []
+
+    def _save_content(self, name, content):
+        if self._post_processing and 'checkpoint' not in name:
+            if self.save_limit is not None and \
+                    len(self.saved_names) >= self.save_limit:
+                raise Interrupted(name)
+            self.saved_names.append(name)
+        return super(InterruptingStorage, self)._save_content(name, content)
+
+
+class MemoryStorage(Storage):
+    # A storage backend keeping files in memory, which is not in the local
+    # file system
+    files = {}
+
+    def _open(self, name, mode='rb'):
+        if name not in self.files:
+            raise IOError("No such file: '%s'" % name)
+        return ContentFile(self.files[name], name=name)
+
+    def _save(self, name, content):
+        self.files[name] = b''.join(content.chunks())
+        return name
+
+    def exists(self, name):
+        return name in self.files
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, filenames = set(), []
+        for name in self.files:
+            if name.startswith(prefix):
+                head, _, tail = name[len(prefix):].partition('/')
+                if tail:
+                    directories.add(head)
+                else:
+                    filenames.append(head)
+        return sorted(directories), sorted(filenames)
+
+    def size(self, name):
+        return len(self.files[name])
+
+    def url(self, name):
+        return '/static/' + name
+
+
+class CopyingMemoryStorage(SmartManifestFilesMixin, MemoryStorage):
+    # Provides the "copy" method used for deduplication, and records its
+    # calls
+    copied_names = []
+
+    def copy(self, name, new_name):
+        self.copied_names.append((name, new_name))
+        self.files[new_name] = self.files[name]
+
+
+class PrecompressThreadsStorage(CountingStorage):
+    # Records threads which precompress files
+    compress_threads = set()
+
+    def compress_content(self, *args, **kwargs):
+        self.compress_threads.add(threading.current_thread())
+        return super(PrecompressThreadsStorage, self).compress_content(
+            *args, **kwargs)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.utils.six import itervalues
+
+from .storage import InterruptingStorage, Interrupted
+from .utils import CollectstaticTestCase
+
+
+class CheckpointTests(CollectstaticTestCase):
+    storage = 'tests.storage.InterruptingStorage'
+    files = dict(
+        [('img/icon%d.png' % i, 'icon %d' % i) for i in range(8)] +
+        [('css/page%d.css' % i,
+          '.page%d { background: url("../img/icon%d.png"); }' % (i, i))
+         for i in range(4)] +
+        [('css/all.css',
+          ''.join('@import url("page%d.css");\n' % i for i in range(4)))]
+    )
+    # Save a checkpoint after every file
+    config = {'CHECKPOINT_INTERVAL': 0}
+
+    def setUp(self):
+        super(CheckpointTests, self).setUp()
+        InterruptingStorage.save_limit = None
+        del InterruptingStorage.saved_names[:]
+
+    def tearDown(self):
+        InterruptingStorage.save_limit = None
+
+    def read_checkpoint(self):
+        path = os.path.join(self.static_root, 'staticfiles.checkpoint.json')
+        with io.open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def interrupt(self, save_limit):
+        InterruptingStorage.save_limit = save_limit
+        with self.assertRaises(Interrupted):
+            self.collectstatic()
+        InterruptingStorage.save_limit = None
+        del InterruptingStorage.saved_names[:]
+        self.assertNotIn('staticfiles.json', self.list_files())
+        checkpoint = self.read_checkpoint()
+        self.assertTrue(checkpoint['completed'])
+        self.assertLess(len(checkpoint['completed']), len(self.files))
+        return checkpoint
+
+    def assert_same_as_single_run(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        self.collectstatic(static_root=static_root)
+        manifest = self.read_manifest()
+        self.assertEqual(manifest, self.read_manifest(static_root))
+        self.assertEqual(self.list_files(), self.list_files(static_root))
+
+    def test_resume(self):
+        checkpoint = self.interrupt(6)
+        storage = self.collectstatic()
+        # Completed files aren't processed again
+        self.assertEqual(set(storage.incremental_skipped_files),
+                         set(checkpoint['completed']))
+        completed_names = set(itervalues(checkpoint['hashed_files']))
+        self.assertFalse(completed_names &
+                         set(InterruptingStorage.saved_names))
+        # The checkpoint is deleted once all files are done
+        self.assertNotIn('staticfiles.checkpoint.json', self.list_files())
+        self.assert_same_as_single_run()
+
+    def test_resume_adjustable(self):
+        # Interrupted while saving adjustable files, after all images
+        checkpoint = self.interrupt(10)
+        completed_css = [name for name in checkpoint['completed']
+                         if name.startswith('css/')]
+        self.assertTrue(completed_css)
+        # References of completed adjustable files are kept, so that they
+        # aren't scanned again
+        for name in completed_css:
+            self.assertIn(name, checkpoint['references'])
+        storage = self.collectstatic()
+        for name in completed_css:
+            self.assertEqual(storage.file_references[name],
+                             set(checkpoint['references'][name]))
+        self.assertNotIn('staticfiles.checkpoint.json', self.list_files())
+        self.assert_same_as_single_run()
+
+    def test_missing_hashed_file(self):
+        # A completed file whose hashed file is gone is processed again
+        checkpoint = self.interrupt(6)
+        hashed_name = checkpoint['hashed_files'][checkpoint['completed'][0]]
+        os.remove(os.path.join(self.static_root, hashed_name))
+        self.collectstatic()
+        self.assertIn(hashed_name, InterruptingStorage.saved_names)
+        self.assert_same_as_single_run()
+
+    def test_changed_source(self):
+        # The checkpoint is outdated once a source file changes
+        self.interrupt(6)
+        self.write_files({'img/icon7.png': 'changed icon'})
+        storage = self.collectstatic()
+        self.assertEqual(storage.incremental_skipped_files, {})
+        self.assertNotIn('staticfiles.checkpoint.json', self.list_files())
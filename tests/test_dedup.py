@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import json
+import os
+
+from .storage import CopyingMemoryStorage, MemoryStorage
+from .utils import CollectstaticTestCase
+
+
+class DedupTestCase(CollectstaticTestCase):
+    files = {
+        'img/a.png': 'same image',
+        'img/b.png': 'same image',
+        'img/copy/a.png': 'same image',
+        'img/c.png': 'other image',
+    }
+    duplicates = ('img/a.png', 'img/b.png', 'img/copy/a.png')
+    config = {'DEDUP_ENABLED': True, 'STATS_ENABLED': True}
+
+    def get_path(self, name):
+        return os.path.join(self.static_root, name)
+
+    def assert_manifest(self):
+        manifest = self.read_manifest()
+        digest = manifest['img/a.png'].split('.')[-2]
+        self.assertEqual(manifest['img/b.png'], 'img/b.%s.png' % digest)
+        self.assertEqual(manifest['img/copy/a.png'],
+                         'img/copy/a.%s.png' % digest)
+        for name, content in self.files.items():
+            self.assertEqual(self.read_file(manifest[name]), content)
+        return manifest
+
+
+class LinkDedupTests(DedupTestCase):
+    def test_hardlink(self):
+        storage = self.collectstatic({'DEDUP_LINK_METHOD': 'hardlink'})
+        manifest = self.assert_manifest()
+        inodes = set(os.stat(self.get_path(manifest[name])).st_ino
+                     for name in self.duplicates)
+        self.assertEqual(len(inodes), 1)
+        self.assertNotEqual(
+            os.stat(self.get_path(manifest['img/c.png'])).st_ino,
+            next(iter(inodes)))
+        self.assertEqual(storage.last_stats['deduplicated_files'], 2)
+
+    def test_symlink(self):
+        self.collectstatic({'DEDUP_LINK_METHOD': 'symlink'})
+        manifest = self.assert_manifest()
+        links = [name for name in self.duplicates
+                 if os.path.islink(self.get_path(manifest[name]))]
+        self.assertEqual(len(links), 2)
+        for name in links:
+            # Relative to the directory of the link
+            self.assertFalse(
+                os.path.isabs(os.readlink(self.get_path(manifest[name]))))
+
+    def test_reflink(self):
+        # Cloned where supported, copied otherwise
+        storage = self.collectstatic({'DEDUP_LINK_METHOD': 'reflink'})
+        manifest = self.assert_manifest()
+        for name in self.duplicates:
+            path = self.get_path(manifest[name])
+            self.assertFalse(os.path.islink(path))
+            self.assertEqual(os.stat(path).st_nlink, 1)
+        self.assertEqual(storage.last_stats['deduplicated_files'], 2)
+
+    def test_link_failure(self):
+        original_link = os.link
+
+        def link(source, target):
+            raise OSError('cross-device link')
+
+        os.link = link
+        try:
+            self.collectstatic({'DEDUP_LINK_METHOD': 'hardlink'})
+        finally:
+            os.link = original_link
+        manifest = self.assert_manifest()
+        for name in self.duplicates:
+            self.assertEqual(os.stat(self.get_path(manifest[name])).st_nlink,
+                             1)
+
+    def test_disabled(self):
+        storage = self.collectstatic({'DEDUP_ENABLED': False})
+        manifest = self.assert_manifest()
+        for name in self.duplicates:
+            self.assertEqual(os.stat(self.get_path(manifest[name])).st_nlink,
+                             1)
+        self.assertEqual(storage.last_stats['deduplicated_files'], 0)
+
+
+class CopyDedupTests(DedupTestCase):
+    # Deduplicated by the "copy" method of a storage which isn't in the local
+    # file system
+    storage = 'tests.storage.CopyingMemoryStorage'
+
+    def setUp(self):
+        super(CopyDedupTests, self).setUp()
+        MemoryStorage.files.clear()
+        del CopyingMemoryStorage.copied_names[:]
+
+    def read_manifest(self, static_root=None):
+        return json.loads(
+            MemoryStorage.files['staticfiles.json'].decode('utf-8'))['paths']
+
+    def read_file(self, name, static_root=None):
+        return MemoryStorage.files[name].decode('utf-8')
+
+    def test_copy(self):
+        storage = self.collectstatic()
+        manifest = self.assert_manifest()
+        hashed_names = set(manifest[name] for name in self.duplicates)
+        copied_names = CopyingMemoryStorage.copied_names
+        self.assertEqual(len(copied_names), 2)
+        for stored_name, new_name in copied_names:
+            self.assertIn(stored_name, hashed_names)
+            self.assertIn(new_name, hashed_names)
+            self.assertNotEqual(stored_name, new_name)
+        self.assertEqual(storage.last_stats['deduplicated_files'], 2)
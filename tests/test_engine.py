@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from django.test import SimpleTestCase
+
+from django_smartstaticfiles.engine import (
+    AsyncIOEngine, async_io_available, asyncio,
+)
+
+from .storage import LatencyFileSystemStorage, NativeAsyncStorage
+from .utils import CollectstaticTestCase
+
+
+@unittest.skipUnless(async_io_available, 'requires asyncio')
+class AsyncIOEngineTests(SimpleTestCase):
+    concurrency = 3
+
+    def setUp(self):
+        self.engine = AsyncIOEngine(self.concurrency)
+        self.addCleanup(self.engine.close)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def operation(self, value, latency):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(latency)
+        finally:
+            with self.lock:
+                self.running -= 1
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def test_results_in_order(self):
+        # Later operations finish first
+        results = [self.engine.apply_async(self.operation,
+                                           (i, 0.002 * (20 - i)))
+                   for i in range(20)]
+        self.assertEqual([result.get() for result in results],
+                         list(range(20)))
+        self.assertEqual(self.max_running, self.concurrency)
+
+    def test_join(self):
+        results = [self.engine.apply_async(self.operation, (i, 0.005))
+                   for i in range(10)]
+        self.engine.join()
+        self.assertTrue(all(result.ready() for result in results))
+
+    def test_exception(self):
+        error = IOError('failed')
+        failed = self.engine.apply_async(self.operation, (error, 0.005))
+        succeeded = self.engine.apply_async(self.operation, (1, 0.005))
+        with self.assertRaises(IOError) as cm:
+            failed.get()
+        self.assertIs(cm.exception, error)
+        self.assertEqual(succeeded.get(), 1)
+
+    def test_run(self):
+        self.assertEqual(self.engine.run(asyncio.sleep, 0.001, 'slept'),
+                         'slept')
+
+    def test_run_exception(self):
+        def fail():
+            future = asyncio.Future()
+            future.set_exception(IOError('failed'))
+            return future
+
+        with self.assertRaises(IOError):
+            self.engine.run(fail)
+
+    def test_closed(self):
+        self.engine.close()
+        with self.assertRaises(RuntimeError):
+            self.engine.apply_async(self.operation, (1, 0))
+
+
+@unittest.skipUnless(async_io_available, 'requires asyncio')
+class AsyncIOStorageTests(CollectstaticTestCase):
+    storage = 'tests.storage.LatencyStorage'
+    files = dict(
+        [('css/page%d.css' % i,
+          '.page%d { background: url("../img/icon%d.png"); }' % (i, i))
+         for i in range(8)] +
+        [('img/icon%d.png' % i, 'icon %d' % i) for i in range(8)]
+    )
+    config = {'ASYNC_IO_ENABLED': True, 'ASYNC_IO_CONCURRENCY': 2}
+
+    def setUp(self):
+        super(AsyncIOStorageTests, self).setUp()
+        LatencyFileSystemStorage.fail_pattern = None
+        LatencyFileSystemStorage.caller_thread = threading.current_thread()
+        LatencyFileSystemStorage.max_running = 0
+        del LatencyFileSystemStorage.engines[:]
+        del NativeAsyncStorage.async_calls[:]
+
+    def tearDown(self):
+        LatencyFileSystemStorage.fail_pattern = None
+        LatencyFileSystemStorage.fail_in_caller = True
+
+    def assert_same_as_blocking_run(self, storage=None):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        self.collectstatic({'ASYNC_IO_ENABLED': False},
+                           static_root=static_root, storage=storage)
+        manifest = self.read_manifest()
+        self.assertEqual(manifest, self.read_manifest(static_root))
+        for hashed_name in manifest.values():
+            self.assertEqual(self.read_file(hashed_name),
+                             self.read_file(hashed_name, static_root))
+
+    def test_concurrency(self):
+        # Hashed files are saved and source files are checked ahead by the
+        # engine, while collectstatic goes on
+        self.collectstatic()
+        self.assertEqual(LatencyFileSystemStorage.max_running, 2)
+        self.assert_same_as_blocking_run()
+
+    def assert_engine_closed(self):
+        engine, = LatencyFileSystemStorage.engines
+        self.assertTrue(engine._closed)
+        self.assertFalse(engine._thread.is_alive())
+
+    def test_save_failure(self):
+        # Hashed files are saved by the engine
+        LatencyFileSystemStorage.fail_pattern = \
+            r'^_save css/page3\.[0-9a-f]{12}\.css$'
+        with self.assertRaises(IOError):
+            self.collectstatic()
+        self.assert_engine_closed()
+
+    def test_exists_failure(self):
+        # Existence of hashed names is checked ahead by the engine, and
+        # checked again by collectstatic if that fails
+        LatencyFileSystemStorage.fail_pattern = \
+            r'^exists img/icon5\.[0-9a-f]{12}\.png$'
+        with self.assertRaises(IOError):
+            self.collectstatic()
+        self.assert_engine_closed()
+
+    def test_exists_failure_ahead(self):
+        LatencyFileSystemStorage.fail_pattern = \
+            r'^exists img/icon5\.[0-9a-f]{12}\.png$'
+        LatencyFileSystemStorage.fail_in_caller = False
+        self.collectstatic()
+        self.assert_same_as_blocking_run()
+
+    def test_native_coroutines(self):
+        storage = 'tests.storage.NativeAsyncStorage'
+        self.collectstatic(storage=storage)
+        async_calls = NativeAsyncStorage.async_calls
+        self.assertEqual(set(method for method, _ in async_calls),
+                         {'exists', 'save', 'delete'})
+        saved_names = set(name for method, name in async_calls
+                          if method == 'save')
+        self.assertTrue(set(self.read_manifest().values()) <= saved_names)
+        self.assert_same_as_blocking_run(storage)
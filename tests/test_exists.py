@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from .storage import CountingFileSystemStorage
+from .utils import CollectstaticTestCase
+
+
+class CountingTestCase(CollectstaticTestCase):
+    storage = 'tests.storage.CountingStorage'
+    files = {
+        'css/base.css': '@import url("sub/inner.css");\n'
+                        '.a { background: url("../img/a.png"); }\n',
+        'css/sub/inner.css': '.b { background: url("../../img/b.png"); }\n',
+        'js/main.js': 'var a = 1;\n',
+        'img/a.png': 'a',
+        'img/b.png': 'b',
+    }
+    config = {'EXISTS_CACHE_ENABLED': True}
+
+    def setUp(self):
+        super(CountingTestCase, self).setUp()
+        CountingFileSystemStorage.calls.clear()
+
+    @property
+    def calls(self):
+        return CountingFileSystemStorage.calls
+
+
+class ExistsCacheTests(CountingTestCase):
+    def test_exists_from_listing(self):
+        self.collectstatic()
+        self.assertEqual(self.calls['exists'], 0)
+        self.assertGreater(self.calls['listdir'], 0)
+
+    def test_exists_without_listing(self):
+        self.collectstatic({'EXISTS_CACHE_ENABLED': False})
+        self.assertGreater(self.calls['exists'], 0)
+        self.assertEqual(self.calls['listdir'], 0)
+
+    def test_incremental_rerun(self):
+        config = {'INCREMENTAL_ENABLED': True}
+        self.collectstatic(config)
+        manifest = self.read_manifest()
+        CountingFileSystemStorage.calls.clear()
+        storage = self.collectstatic(config)
+        # Unchanged files are planned without querying the storage
+        self.assertEqual(len(storage.incremental_skipped_files),
+                         len(self.files))
+        self.assertEqual(self.calls['exists'], 0)
+        self.assertEqual(self.read_manifest(), manifest)
+
+
+class DeleteTests(CountingTestCase):
+    def test_delete_one_by_one(self):
+        self.collectstatic()
+        # Unhashed copies of all files are deleted
+        self.assertEqual(self.calls['delete'], len(self.files))
+        self.assertEqual(self.calls['bulk_delete'], 0)
+        self.assertFalse(self.list_files() & set(self.files))
+
+    def test_bulk_delete(self):
+        self.collectstatic(storage='tests.storage.BulkDeleteStorage')
+        self.assertEqual(self.calls['delete'], 0)
+        self.assertEqual(self.calls['bulk_delete'], 1)
+        self.assertFalse(self.list_files() & set(self.files))
+        self.assertEqual(set(self.read_manifest().values()),
+                         self.list_files() - {'staticfiles.json'})
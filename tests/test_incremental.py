@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+from .utils import CollectstaticTestCase
+
+
+class IncrementalTests(CollectstaticTestCase):
+    files = {
+        'css/a.css': '.a {\n    background: url("../img/x.png");\n}\n',
+        'css/b.css': '@import url("a.css");\n.b {\n    color: red;\n}\n',
+        'css/c.css': '.c {\n    color: blue;\n}\n',
+        'img/x.png': 'image',
+    }
+    config = {'INCREMENTAL_ENABLED': True}
+
+    def assert_referenced_change(self, config=None):
+        self.collectstatic(config)
+        previous_manifest = self.read_manifest()
+        self.write_files({'img/x.png': 'changed image'})
+        self.collectstatic(config)
+        manifest = self.read_manifest()
+
+        # Files referencing the changed file (transitively) are hashed again
+        for name in ('img/x.png', 'css/a.css', 'css/b.css'):
+            self.assertNotEqual(manifest[name], previous_manifest[name])
+        self.assertEqual(manifest['css/c.css'], previous_manifest['css/c.css'])
+        content = self.read_file(manifest['css/a.css'])
+        self.assertIn(manifest['img/x.png'].split('/')[-1], content)
+        self.assertIn(manifest['css/a.css'].split('/')[-1],
+                      self.read_file(manifest['css/b.css']))
+        return content
+
+    def test_referenced_change(self):
+        self.assert_referenced_change()
+
+    def test_referenced_change_minified(self):
+        # The referencing file isn't skipped by the minification pool
+        content = self.assert_referenced_change(
+            {'CSS_MIN_ENABLED': True, 'MIN_WORKERS': 2})
+        self.assertNotIn('\n', content.strip())
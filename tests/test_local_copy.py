@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+import stat
+
+from .storage import SaveOverrideStorage, SmallMemoryStorage
+from .utils import CollectstaticTestCase
+
+
+class LocalCopyTests(CollectstaticTestCase):
+    storage = 'tests.storage.SmallMemoryStorage'
+    files = {
+        'media/video.bin': 'frame ' * 1000,
+        'media/small.bin': 'tiny',
+    }
+    config = {'STATS_ENABLED': True}
+
+    def setUp(self):
+        super(LocalCopyTests, self).setUp()
+        del SaveOverrideStorage.saved_names[:]
+        del SmallMemoryStorage.copied_sources[:]
+
+    def assert_copied(self):
+        manifest = self.read_manifest()
+        for name, content in self.files.items():
+            self.assertEqual(self.read_file(manifest[name]), content)
+        # No temporary copies are left behind
+        self.assertFalse(any('.smartstaticfiles-' in name
+                             for name in self.list_files()))
+        return manifest
+
+    def test_read_once(self):
+        storage = self.collectstatic()
+        self.assert_copied()
+        stats = storage.last_stats
+        # The large file is hashed while being copied, instead of being read
+        # again by copy_local_file()
+        self.assertEqual(stats['bytes_read'], 6000 + 4)
+        self.assertEqual(stats['storage_calls']['copy'], 1)
+        self.assertEqual(SmallMemoryStorage.copied_sources, [])
+
+    def test_rerun(self):
+        self.collectstatic()
+        storage = self.collectstatic()
+        self.assert_copied()
+        # The hashed file of the previous run exists, thus it's only hashed
+        self.assertLess(storage.last_stats['bytes_written'], 6000)
+        self.assertNotIn('copy', storage.last_stats['storage_calls'])
+
+    def test_file_permissions(self):
+        with self.settings(FILE_UPLOAD_PERMISSIONS=0o640):
+            self.collectstatic()
+        manifest = self.assert_copied()
+        path = os.path.join(self.static_root, manifest['media/video.bin'])
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+
+    def test_hardlink(self):
+        self.collectstatic({'LOCAL_COPY_METHOD': 'hardlink'})
+        manifest = self.assert_copied()
+        path = os.path.join(self.static_root, manifest['media/video.bin'])
+        self.assertEqual(os.stat(path).st_nlink, 2)
+
+    def test_save_override(self):
+        # Files are saved through an overridden _save()
+        self.collectstatic(storage='tests.storage.SaveOverrideStorage')
+        manifest = self.assert_copied()
+        self.assertIn(manifest['media/video.bin'],
+                      SaveOverrideStorage.saved_names)
+
+    def test_disabled(self):
+        storage = self.collectstatic({'LOCAL_COPY_METHOD': None})
+        self.assert_copied()
+        self.assertNotIn('copy', storage.last_stats['storage_calls'])
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+import shutil
+import stat
+import tempfile
+
+from django.test import SimpleTestCase
+
+from django_smartstaticfiles import manifest, storage as smart_storage
+from django_smartstaticfiles.manifest import (
+    CompactManifest, write_compact_manifest,
+)
+
+from .storage import OpeningStorage
+from .utils import CollectstaticTestCase
+
+
+class WriteCompactManifestTests(SimpleTestCase):
+    hashed_files = {'css/a.css': 'css/a.0123456789ab.css'}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'staticfiles.json.idx')
+        self.umask = os.umask(0o022)
+        self.addCleanup(os.umask, self.umask)
+
+    def get_mode(self):
+        return stat.S_IMODE(os.stat(self.path).st_mode)
+
+    def test_write(self):
+        write_compact_manifest(self.path, self.hashed_files)
+        compact_manifest = CompactManifest(self.path)
+        try:
+            self.assertEqual(dict(compact_manifest), self.hashed_files)
+        finally:
+            compact_manifest.close()
+
+    def test_permissions_from_umask(self):
+        write_compact_manifest(self.path, self.hashed_files)
+        self.assertEqual(self.get_mode(), 0o644)
+
+    def test_permissions_mode(self):
+        write_compact_manifest(self.path, self.hashed_files, 0o640)
+        self.assertEqual(self.get_mode(), 0o640)
+
+    def test_failure_removes_temp_file(self):
+        original_rename = os.rename
+
+        def rename(src, dst):
+            raise OSError('rename failed')
+
+        manifest.os.rename = rename
+        try:
+            with self.assertRaises(OSError):
+                write_compact_manifest(self.path, self.hashed_files)
+        finally:
+            manifest.os.rename = original_rename
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class CollectstaticCompactManifestTests(CollectstaticTestCase):
+    files = {'css/a.css': 'body { color: red; }'}
+    config = {'COMPACT_MANIFEST_ENABLED': True}
+
+    def test_file_upload_permissions(self):
+        with self.settings(FILE_UPLOAD_PERMISSIONS=0o640):
+            self.collectstatic()
+        path = os.path.join(self.static_root, 'staticfiles.json.idx')
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o640)
+
+
+class ManifestLoadingTests(CollectstaticTestCase):
+    files = {'css/a.css': 'body { color: red; }'}
+    config = {'MANIFEST_RELOAD_INTERVAL': 60}
+
+    def setUp(self):
+        super(ManifestLoadingTests, self).setUp()
+        OpeningStorage.opened_names = []
+        # A clock which only moves when the tests advance it
+        self.now = 0
+        original_timer = smart_storage.default_timer
+        smart_storage.default_timer = lambda: self.now
+        self.addCleanup(setattr, smart_storage, 'default_timer',
+                        original_timer)
+        self.collectstatic()
+
+    def recollect(self, config=None):
+        # Deploy changed files, changing the size of the manifest too
+        self.write_files({'css/a.css': 'body { color: blue; }',
+                          'css/b.css': 'body { color: green; }'})
+        self.collectstatic(config)
+
+    def manifest_url(self, name):
+        return '/static/' + self.read_manifest()[name]
+
+    def test_lazy_loading(self):
+        with self.runtime_settings():
+            storage = OpeningStorage()
+            self.assertIsNone(storage._hashed_files)
+            self.assertEqual(OpeningStorage.opened_names, [])
+            self.assertEqual(storage.url('css/a.css'),
+                             self.manifest_url('css/a.css'))
+            storage.url('css/a.css')
+        self.assertEqual(OpeningStorage.opened_names, ['staticfiles.json'])
+
+    def test_reload_after_interval(self):
+        with self.runtime_settings():
+            storage = OpeningStorage()
+            old_url = storage.url('css/a.css')
+        self.recollect()
+        with self.runtime_settings():
+            self.now = 59
+            self.assertEqual(storage.url('css/a.css'), old_url)
+            self.now = 60
+            self.assertEqual(storage.url('css/a.css'),
+                             self.manifest_url('css/a.css'))
+            self.assertNotEqual(storage.url('css/a.css'), old_url)
+        self.assertEqual(OpeningStorage.opened_names,
+                         ['staticfiles.json', 'staticfiles.json'])
+
+    def test_unchanged_manifest_not_reloaded(self):
+        with self.runtime_settings():
+            storage = OpeningStorage()
+            url = storage.url('css/a.css')
+            self.now = 60
+            self.assertEqual(storage.url('css/a.css'), url)
+            self.now = 120
+            self.assertEqual(storage.url('css/a.css'), url)
+        self.assertEqual(OpeningStorage.opened_names, ['staticfiles.json'])
+
+    def test_no_reload_interval(self):
+        with self.runtime_settings({'MANIFEST_RELOAD_INTERVAL': None}):
+            storage = OpeningStorage()
+            old_url = storage.url('css/a.css')
+        self.recollect()
+        with self.runtime_settings({'MANIFEST_RELOAD_INTERVAL': None}):
+            self.now = 3600
+            self.assertEqual(storage.url('css/a.css'), old_url)
+        self.assertEqual(OpeningStorage.opened_names, ['staticfiles.json'])
+
+    def test_reload_closes_compact_manifest(self):
+        config = {'COMPACT_MANIFEST_ENABLED': True}
+        self.collectstatic(config)
+        with self.runtime_settings(config):
+            storage = OpeningStorage()
+            storage.url('css/a.css')
+            old_manifest = storage.hashed_files
+            self.assertIsInstance(old_manifest, CompactManifest)
+        self.recollect(config)
+        with self.runtime_settings(config):
+            self.now = 60
+            self.assertEqual(storage.url('css/b.css'),
+                             self.manifest_url('css/b.css'))
+            self.assertIsInstance(storage.hashed_files, CompactManifest)
+        self.assertIsNot(storage.hashed_files, old_manifest)
+        with self.assertRaises(ValueError):
+            old_manifest['css/a.css']
+        storage.hashed_files.close()
+
+
+class UrlCacheTests(CollectstaticTestCase):
+    files = {
+        'css/a.css': 'body { color: red; }',
+        'css/b.css': 'body { color: green; }',
+        'css/c.css': 'body { color: blue; }',
+    }
+    config = {'URL_CACHE_MAX_SIZE': 2}
+
+    def setUp(self):
+        super(UrlCacheTests, self).setUp()
+        self.collectstatic()
+
+    def test_least_recently_used_evicted(self):
+        with self.runtime_settings():
+            storage = OpeningStorage()
+            url = storage.url('css/a.css')
+            storage.url('css/b.css')
+            self.assertEqual(storage.url('css/a.css'), url)
+            storage.url('css/c.css')
+            self.assertEqual(list(storage._url_cache),
+                             ['css/a.css', 'css/c.css'])
+            self.assertEqual(storage._url_cache['css/a.css'], url)
+            storage.url('css/b.css')
+            self.assertEqual(list(storage._url_cache),
+                             ['css/c.css', 'css/b.css'])
+
+    def test_no_limit(self):
+        with self.runtime_settings({'URL_CACHE_MAX_SIZE': None}):
+            storage = OpeningStorage()
+            for name in ('css/a.css', 'css/b.css', 'css/c.css'):
+                storage.url(name)
+            self.assertEqual(list(storage._url_cache),
+                             ['css/a.css', 'css/b.css', 'css/c.css'])
+
+    def test_disabled(self):
+        with self.runtime_settings({'URL_CACHE_MAX_SIZE': 0}):
+            storage = OpeningStorage()
+            url = storage.url('css/a.css')
+            self.assertEqual(storage.url('css/a.css'), url)
+            self.assertEqual(list(storage._url_cache), [])
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from django_smartstaticfiles.cache import MinifiedContentCache
+
+from . import minifiers
+from .utils import CollectstaticTestCase
+
+
+class MinifiedContentCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+
+    def set_entry(self, cache, key, content, mtime):
+        cache.set(key, content)
+        os.utime(cache.path(key), (mtime, mtime))
+
+    def test_make_key(self):
+        cache = MinifiedContentCache(self.location)
+        key = cache.make_key('a', minifiers.minify_counting)
+        self.assertEqual(key, cache.make_key('a', minifiers.minify_counting,
+                                             {}))
+        self.assertNotEqual(key, cache.make_key('b',
+                                                minifiers.minify_counting))
+        self.assertNotEqual(key, cache.make_key(
+            'a', minifiers.minify_with_source_map))
+        self.assertNotEqual(key, cache.make_key(
+            'a', minifiers.minify_counting, {'keep_bang_comments': True}))
+
+    def test_get_set(self):
+        cache = MinifiedContentCache(self.location)
+        self.assertIsNone(cache.get_minified('aa01'))
+        cache.set_minified('aa01', b'minified')
+        self.assertEqual(cache.get_minified('aa01'), (b'minified', None))
+
+    def test_lru_eviction(self):
+        cache = MinifiedContentCache(self.location, max_size=30)
+        self.set_entry(cache, 'aa01', b'0123456789', 100)
+        self.set_entry(cache, 'aa02', b'0123456789', 200)
+        self.set_entry(cache, 'aa03', b'0123456789', 300)
+        self.assertEqual(cache.cull(), 0)
+        # Using the oldest entry makes the next oldest one evicted first
+        self.assertEqual(cache.get('aa01'), b'0123456789')
+        cache.set('aa04', b'0123456789')
+        self.assertEqual(cache.cull(), 1)
+        self.assertIsNone(cache.get('aa02'))
+        for key in ('aa01', 'aa03', 'aa04'):
+            self.assertEqual(cache.get(key), b'0123456789')
+
+    def test_eviction_until_size_fits(self):
+        cache = MinifiedContentCache(self.location, max_size=15)
+        self.set_entry(cache, 'aa01', b'0123456789', 100)
+        self.set_entry(cache, 'aa02', b'0123456789', 200)
+        self.set_entry(cache, 'aa03', b'01234', 300)
+        self.assertEqual(cache.cull(), 1)
+        self.assertIsNone(cache.get('aa01'))
+        self.assertEqual(cache.get('aa02'), b'0123456789')
+        self.assertEqual(cache.get('aa03'), b'01234')
+
+    def test_no_limit(self):
+        cache = MinifiedContentCache(self.location)
+        self.set_entry(cache, 'aa01', b'0123456789', 100)
+        self.assertEqual(cache.cull(), 0)
+        self.assertEqual(cache.get('aa01'), b'0123456789')
+
+
+class CollectstaticMinCacheTests(CollectstaticTestCase):
+    files = {
+        'js/a.js': 'var a  =  1;',
+        'js/b.js': 'var b  =  2;',
+    }
+    config = {
+        'JS_MIN_ENABLED': True,
+        'JS_MIN_FUNC': 'tests.minifiers.minify_counting',
+        'JS_MIN_FUNC_KWARGS': {},
+    }
+
+    def setUp(self):
+        super(CollectstaticMinCacheTests, self).setUp()
+        minifiers.minified_contents[:] = []
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.config = dict(self.config, MIN_CACHE_DIR=self.cache_dir)
+
+    def collectstatic_fresh(self):
+        # Run collectstatic into an empty STATIC_ROOT, so that all files are
+        # copied and minified again
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        self.collectstatic(static_root=static_root)
+        return static_root
+
+    def get_cache_size(self):
+        size = 0
+        for directory, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                size += os.path.getsize(os.path.join(directory, filename))
+        return size
+
+    def test_hits_across_runs(self):
+        first_root = self.collectstatic_fresh()
+        self.assertEqual(sorted(minifiers.minified_contents),
+                         [b'var a  =  1;', b'var b  =  2;'])
+        second_root = self.collectstatic_fresh()
+        self.assertEqual(len(minifiers.minified_contents), 2)
+        self.assertEqual(self.read_manifest(second_root),
+                         self.read_manifest(first_root))
+        hashed_name = self.read_manifest(second_root)['js/a.js']
+        self.assertEqual(self.read_file(hashed_name, second_root),
+                         'var a = 1;')
+
+    def test_changed_content_misses(self):
+        self.collectstatic_fresh()
+        self.write_files({'js/a.js': 'var a  =  3;'})
+        self.collectstatic_fresh()
+        self.assertEqual(minifiers.minified_contents[2:], [b'var a  =  3;'])
+
+    def test_eviction_across_runs(self):
+        # Room for one minified file only
+        self.config['MIN_CACHE_MAX_SIZE'] = 15
+        self.collectstatic_fresh()
+        self.assertEqual(len(minifiers.minified_contents), 2)
+        self.assertLessEqual(self.get_cache_size(), 15)
+        self.collectstatic_fresh()
+        self.assertEqual(len(minifiers.minified_contents), 3)
+        self.assertLessEqual(self.get_cache_size(), 15)
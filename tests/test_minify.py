@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from .storage import PoolMinifyStorage
+from .utils import CollectstaticTestCase
+
+# Run collectstatic without post-processing in another process, so that
+# files left to the minification pool are saved while it exits
+NO_POST_PROCESS_SCRIPT = '''
+import sys
+import django
+from django.conf import settings
+from django.core.management import call_command
+
+settings.configure(
+    INSTALLED_APPS=['django.contrib.staticfiles'],
+    STATIC_URL='/static/',
+    STATIC_ROOT=sys.argv[1],
+    STATICFILES_DIRS=[sys.argv[2]],
+    STATICFILES_STORAGE='django_smartstaticfiles.storage.'
+                        'SmartManifestStaticFilesStorage',
+    SMARTSTATICFILES_CONFIG={
+        'JS_MIN_ENABLED': True,
+        'CSS_MIN_ENABLED': True,
+        'MIN_WORKERS': 2,
+    },
+    USE_I18N=False,
+    LOGGING_CONFIG=None,
+)
+django.setup()
+call_command('collectstatic', interactive=False, verbosity=0,
+             post_process=False)
+'''
+
+
+class MinifyPoolTests(CollectstaticTestCase):
+    storage = 'tests.storage.PoolMinifyStorage'
+    files = dict(
+        [('css/page%d.css' % i,
+          '/* Page %d */\n.page%d {\n    background: url("../img/a.png");\n'
+          '}\n' % (i, i))
+         for i in range(6)] +
+        [('js/app%d.js' % i,
+          '// App %d\nfunction app%d(value) {\n    return value + %d;\n}\n'
+          % (i, i, i))
+         for i in range(6)] +
+        [('img/a.png', 'image'), ('js/lib.min.js', 'var lib;')]
+    )
+    config = {'JS_MIN_ENABLED': True, 'CSS_MIN_ENABLED': True}
+
+    def setUp(self):
+        super(MinifyPoolTests, self).setUp()
+        del PoolMinifyStorage.pooled_names[:]
+
+    def make_static_root(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        return static_root
+
+    def assert_same_files(self, static_root, other_static_root):
+        files = self.list_files(static_root)
+        self.assertEqual(files, self.list_files(other_static_root))
+        for name in files:
+            self.assertEqual(self.read_file(name, static_root),
+                             self.read_file(name, other_static_root))
+
+    def test_same_as_serial(self):
+        self.collectstatic({'MIN_WORKERS': 2})
+        static_root = self.make_static_root()
+        self.collectstatic(static_root=static_root)
+        self.assert_same_files(self.static_root, static_root)
+
+    def test_copied_files_pooled(self):
+        self.collectstatic({'MIN_WORKERS': 2})
+        minifiable_names = set(
+            name for name in self.files
+            if name.endswith(('.css', '.js')) and
+            not name.endswith('.min.js'))
+        self.assertEqual(set(PoolMinifyStorage.pooled_names),
+                         minifiable_names)
+        # Unhashed files are copied again by every run
+        del PoolMinifyStorage.pooled_names[:]
+        self.collectstatic({'MIN_WORKERS': 2})
+        self.assertEqual(set(PoolMinifyStorage.pooled_names),
+                         minifiable_names)
+
+    def test_no_post_process(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.check_call(
+            [sys.executable, '-c', NO_POST_PROCESS_SCRIPT, self.static_root,
+             self.source_dir],
+            env=env,
+        )
+        static_root = self.make_static_root()
+        self.collectstatic(static_root=static_root,
+                           storage='django_smartstaticfiles.storage.'
+                                   'SmartManifestStaticFilesStorage',
+                           post_process=False)
+        self.assert_same_files(self.static_root, static_root)
+        self.assertNotIn('\n    return',
+                         self.read_file('js/app0.js', static_root))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import posixpath
+from collections import OrderedDict
+
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase
+from django.utils import six
+
+from django_smartstaticfiles.storage import sort_topologically
+
+from .utils import CollectstaticTestCase
+
+
+class SortTopologicallyTests(SimpleTestCase):
+    def test_dependencies_come_first(self):
+        graph = OrderedDict([
+            ('a', {'b'}),
+            ('b', {'c'}),
+            ('c', set()),
+        ])
+        self.assertEqual(sort_topologically(graph), ['c', 'b', 'a'])
+
+    def test_unknown_nodes_are_ignored(self):
+        graph = OrderedDict([('a', {'missing.png'}), ('b', {'a'})])
+        self.assertEqual(sort_topologically(graph), ['a', 'b'])
+
+    def test_cycle(self):
+        graph = OrderedDict([
+            ('a', {'b'}),
+            ('b', {'c'}),
+            ('c', {'a'}),
+        ])
+        with self.assertRaisesMessage(
+                ValueError,
+                'Circular references between files: a -> b -> c -> a'):
+            sort_topologically(graph)
+
+
+class ProcessingOrderTests(CollectstaticTestCase):
+    # Adjustable files in the same directory, so that sorting by directory
+    # level can't settle the nested references
+    files = {
+        'css/a.css': '@import url("b.css");\n',
+        'css/b.css': '.b { background: url("c.css"); }\n',
+        'css/c.css': '.c { background: url("../img/x.png"); }\n',
+        'img/x.png': 'x',
+    }
+
+    def test_processing_order(self):
+        storage = self.collectstatic()
+        source_storage = FileSystemStorage(location=self.source_dir)
+        paths = OrderedDict((name, (source_storage, name))
+                            for name in sorted(self.files))
+        order = storage.get_processing_order(paths)
+        self.assertEqual(order[:1], ['img/x.png'])
+        self.assertEqual(order[1:], ['css/c.css', 'css/b.css', 'css/a.css'])
+
+    def test_single_pass(self):
+        storage = self.collectstatic()
+        manifest = self.read_manifest()
+        # Every adjustable file is hashed once, after the files it references
+        self.assertEqual(storage.intermediate_files, set())
+        self.assertIn(posixpath.basename(manifest['css/b.css']),
+                      self.read_file(manifest['css/a.css']))
+        self.assertIn(posixpath.basename(manifest['css/c.css']),
+                      self.read_file(manifest['css/b.css']))
+        self.assertIn(posixpath.basename(manifest['img/x.png']),
+                      self.read_file(manifest['css/c.css']))
+
+    def test_cycle(self):
+        self.write_files({'css/c.css': '@import url("a.css");\n'})
+        with six.assertRaisesRegex(
+                self, ValueError,
+                r'^Circular references between files: '
+                r'css/(\w)\.css -> css/\w\.css -> css/\w\.css -> css/\1\.css$'):
+            self.collectstatic()
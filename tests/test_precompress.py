@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import gzip
+import io
+import json
+import os
+import threading
+
+from .storage import CountingFileSystemStorage, PrecompressThreadsStorage
+from .utils import CollectstaticTestCase
+
+
+class PrecompressTests(CollectstaticTestCase):
+    storage = 'tests.storage.CountingStorage'
+    files = {
+        'css/big.css': '.big { color: red; }\n' * 100,
+        'css/tiny.css': '.a{}',
+        'img/x.png': 'x' * 100,
+    }
+    config = {'PRECOMPRESS_FORMATS': ['gzip']}
+
+    def setUp(self):
+        super(PrecompressTests, self).setUp()
+        CountingFileSystemStorage.calls.clear()
+        CountingFileSystemStorage.opened_names.clear()
+
+    def read_gzip_file(self, name):
+        with gzip.open(os.path.join(self.static_root, name), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def read_skipped_variants(self):
+        path = os.path.join(self.static_root, 'staticfiles.json')
+        with io.open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))['skipped_variants']
+
+    def assert_precompressed(self):
+        manifest = self.read_manifest()
+        big_name = manifest['css/big.css']
+        tiny_name = manifest['css/tiny.css']
+        self.assertEqual(self.read_gzip_file(big_name + '.gz'),
+                         self.read_file(big_name))
+        # Not smaller than the file, nor matching the file patterns
+        files = self.list_files()
+        self.assertNotIn(tiny_name + '.gz', files)
+        self.assertNotIn(manifest['img/x.png'] + '.gz', files)
+        self.assertEqual(self.read_skipped_variants(), [tiny_name + '.gz'])
+        for name in self.files:
+            if name.startswith('js/'):
+                self.assertEqual(
+                    self.read_gzip_file(manifest[name] + '.gz'),
+                    self.read_file(manifest[name]))
+
+    def test_precompress(self):
+        self.collectstatic()
+        self.assert_precompressed()
+        # Compressed from content in memory instead of the saved files
+        self.assertEqual(CountingFileSystemStorage.opened_names,
+                         {'staticfiles.json'})
+
+    def test_rerun(self):
+        config = {'INCREMENTAL_ENABLED': True}
+        self.collectstatic(config)
+        CountingFileSystemStorage.opened_names.clear()
+        self.collectstatic(config)
+        self.assert_precompressed()
+        # Existing and skipped variants of unchanged files are kept as they
+        # are
+        self.assertFalse(
+            any(name.startswith('css/') or name.startswith('img/')
+                for name in CountingFileSystemStorage.opened_names))
+
+    def test_missing_variant(self):
+        config = {'INCREMENTAL_ENABLED': True}
+        self.collectstatic(config)
+        big_name = self.read_manifest()['css/big.css']
+        os.remove(os.path.join(self.static_root, big_name + '.gz'))
+        self.collectstatic(config)
+        self.assert_precompressed()
+
+
+class PrecompressWorkersTests(PrecompressTests):
+    # The same with precompression threads, which check existence of, delete
+    # and save variants concurrently (and along with writer threads)
+    storage = 'tests.storage.PrecompressThreadsStorage'
+    files = dict(
+        PrecompressTests.files,
+        **dict(('js/app%d.js' % i, 'var app%d = %d;\n' % (i, i) * 50)
+               for i in range(20))
+    )
+    config = {
+        'PRECOMPRESS_FORMATS': ['gzip'],
+        'PRECOMPRESS_WORKERS': 4,
+        'SAVE_WORKERS': 2,
+    }
+
+    def setUp(self):
+        super(PrecompressWorkersTests, self).setUp()
+        PrecompressThreadsStorage.compress_threads.clear()
+
+    def test_threads(self):
+        self.collectstatic()
+        self.assert_precompressed()
+        threads = PrecompressThreadsStorage.compress_threads
+        self.assertTrue(threads)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_exists_cache(self):
+        self.collectstatic({'EXISTS_CACHE_ENABLED': True,
+                            'INCREMENTAL_ENABLED': True})
+        self.write_files({'js/app3.js': 'var changed = 3;\n' * 50})
+        self.collectstatic({'EXISTS_CACHE_ENABLED': True,
+                            'INCREMENTAL_ENABLED': True})
+        self.assert_precompressed()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import io
+import json
+import os
+
+from .storage import OpeningStorage
+from .utils import CollectstaticTestCase
+
+
+class PreloadManifestTests(CollectstaticTestCase):
+    files = {
+        'css/a.css': '@import url("b.css");\n'
+                     'body { background: url("../img/a.png"); }',
+        'css/b.css': '@font-face { src: url("../fonts/b.woff"); }',
+        'img/a.png': 'png',
+        'fonts/b.woff': 'woff',
+    }
+    config = {'PRELOAD_MANIFEST_NAME': 'staticfiles.preload.json'}
+
+    def setUp(self):
+        super(PreloadManifestTests, self).setUp()
+        OpeningStorage.opened_names = []
+        self.collectstatic()
+        self.hashed_files = self.read_manifest()
+
+    def hashed_urls(self, *names):
+        return ['/static/' + self.hashed_files[name] for name in names]
+
+    def read_preload_manifest(self):
+        path = os.path.join(self.static_root, 'staticfiles.preload.json')
+        with io.open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def test_preload_manifest(self):
+        hashed_files = self.hashed_files
+        self.assertEqual(self.read_preload_manifest(), {
+            'version': '1.0',
+            'paths': {
+                hashed_files['css/a.css']: [
+                    hashed_files['css/b.css'],
+                    hashed_files['img/a.png'],
+                    hashed_files['fonts/b.woff'],
+                ],
+                hashed_files['css/b.css']: [hashed_files['fonts/b.woff']],
+            },
+        })
+
+    def test_preload_urls(self):
+        with self.runtime_settings():
+            storage = OpeningStorage()
+            self.assertEqual(
+                storage.preload_urls('css/a.css'),
+                self.hashed_urls('css/b.css', 'img/a.png', 'fonts/b.woff'))
+            self.assertEqual(storage.preload_urls('css/b.css'),
+                             self.hashed_urls('fonts/b.woff'))
+            self.assertEqual(storage.preload_urls('img/a.png'), [])
+
+    def test_lookups_served_from_memory(self):
+        with self.runtime_settings():
+            storage = OpeningStorage()
+            urls = storage.preload_urls('css/a.css')
+            # Lookups after the first one don't read the storage, even if
+            # the preload manifest has changed
+            os.remove(os.path.join(self.static_root,
+                                   'staticfiles.preload.json'))
+            for _ in range(3):
+                self.assertEqual(storage.preload_urls('css/a.css'), urls)
+                self.assertEqual(storage.preload_urls('css/b.css'),
+                                 self.hashed_urls('fonts/b.woff'))
+        self.assertEqual(OpeningStorage.opened_names,
+                         ['staticfiles.json', 'staticfiles.preload.json'])
+
+    def test_disabled(self):
+        with self.runtime_settings({'PRELOAD_MANIFEST_NAME': None}):
+            storage = OpeningStorage()
+            self.assertEqual(storage.preload_urls('css/a.css'), [])
+        self.assertEqual(OpeningStorage.opened_names, ['staticfiles.json'])
+
+    def test_missing_preload_manifest(self):
+        os.remove(os.path.join(self.static_root, 'staticfiles.preload.json'))
+        with self.runtime_settings():
+            storage = OpeningStorage()
+            self.assertEqual(storage.preload_urls('css/a.css'), [])
+            self.assertEqual(storage.preload_urls('css/b.css'), [])
+        self.assertEqual(OpeningStorage.opened_names,
+                         ['staticfiles.json', 'staticfiles.preload.json'])
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zlib
+
+from django.utils import six
+
+from .utils import CollectstaticTestCase
+
+# Run collectstatic for a shard in another process, as on a build node
+SHARD_SCRIPT = '''
+import json
+import sys
+import django
+from django.conf import settings
+from django.core.management import call_command
+
+settings.configure(
+    INSTALLED_APPS=['django.contrib.staticfiles'],
+    STATIC_URL='/static/',
+    STATIC_ROOT=sys.argv[1],
+    STATICFILES_DIRS=[sys.argv[2]],
+    STATICFILES_STORAGE='django_smartstaticfiles.storage.'
+                        'SmartManifestStaticFilesStorage',
+    SMARTSTATICFILES_CONFIG=json.loads(sys.argv[3]),
+    USE_I18N=False,
+    LOGGING_CONFIG=None,
+)
+django.setup()
+call_command('collectstatic', interactive=False, verbosity=0)
+'''
+
+
+class ShardTests(CollectstaticTestCase):
+    shard_count = 3
+    files = dict(
+        [('css/page%d.css' % i,
+          '@import url("base.css");\n'
+          '.page%d { background: url("../img/icon%d.png"); }' % (i, i))
+         for i in range(6)] +
+        [('img/icon%d.png' % i, 'icon %d' % i) for i in range(6)] +
+        [('js/app%d.js' % i, 'var app%d = %d;' % (i, i)) for i in range(6)] +
+        [('css/base.css', 'body { color: red; }')]
+    )
+
+    def collectstatic_shards(self, config=None):
+        for index in range(self.shard_count):
+            shard_config = {'SHARD_COUNT': self.shard_count,
+                            'SHARD_INDEX': index}
+            shard_config.update(config or {})
+            self.collectstatic(shard_config)
+        merge_config = {'SHARD_COUNT': self.shard_count}
+        merge_config.update(config or {})
+        self.collectstatic(merge_config)
+
+    def collectstatic_shard_processes(self, config=None):
+        # Run all shards at the same time in separate processes sharing
+        # STATIC_ROOT, then merge them in this process
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        processes = []
+        for index in range(self.shard_count):
+            shard_config = {'SHARD_COUNT': self.shard_count,
+                            'SHARD_INDEX': index}
+            shard_config.update(config or {})
+            processes.append(subprocess.Popen(
+                [sys.executable, '-c', SHARD_SCRIPT, self.static_root,
+                 self.source_dir, json.dumps(shard_config)],
+                env=env,
+            ))
+        for process in processes:
+            self.assertEqual(process.wait(), 0)
+        merge_config = {'SHARD_COUNT': self.shard_count}
+        merge_config.update(config or {})
+        self.collectstatic(merge_config)
+
+    def collectstatic_single(self, config=None):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        self.collectstatic(config, static_root=static_root)
+        return static_root
+
+    def assert_same_as_single_run(self, config=None, processes=False):
+        if processes:
+            self.collectstatic_shard_processes(config)
+        else:
+            self.collectstatic_shards(config)
+        static_root = self.collectstatic_single(config)
+        manifest = self.read_manifest()
+        self.assertEqual(manifest, self.read_manifest(static_root))
+        self.assertEqual(self.list_files(), self.list_files(static_root))
+        for hashed_name in manifest.values():
+            self.assertEqual(self.read_file(hashed_name),
+                             self.read_file(hashed_name, static_root))
+
+    def test_merge(self):
+        self.assert_same_as_single_run()
+        # Partial manifests are merged and deleted
+        for name in self.list_files():
+            self.assertFalse(name.startswith('staticfiles.shard-'))
+
+    def test_merge_incremental(self):
+        self.assert_same_as_single_run({'INCREMENTAL_ENABLED': True})
+
+    def test_merge_shard_processes(self):
+        self.assert_same_as_single_run(processes=True)
+        for name in self.list_files():
+            self.assertFalse(name.startswith('staticfiles.shard-'))
+
+    def test_merge_shard_processes_minified(self):
+        self.assert_same_as_single_run(
+            {'JS_MIN_ENABLED': True, 'CSS_MIN_ENABLED': True},
+            processes=True)
+
+    def test_shard_run(self):
+        self.collectstatic({'SHARD_COUNT': self.shard_count,
+                            'SHARD_INDEX': 1})
+        files = self.list_files()
+        # The manifest is written by the merge run
+        self.assertIn('staticfiles.shard-1-of-3.json', files)
+        self.assertNotIn('staticfiles.json', files)
+        # Only files of the shard are copied
+        for name in self.files:
+            checksum = zlib.crc32(name.encode('utf-8')) & 0xffffffff
+            self.assertEqual(name in files, checksum % self.shard_count == 1)
+
+    def test_missing_partial_manifest(self):
+        self.collectstatic({'SHARD_COUNT': self.shard_count,
+                            'SHARD_INDEX': 0})
+        with six.assertRaisesRegex(self, ValueError,
+                                   'Missing partial manifest'):
+            self.collectstatic({'SHARD_COUNT': self.shard_count})
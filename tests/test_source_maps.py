@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import hashlib
+import json
+import shutil
+import tempfile
+
+from .utils import CollectstaticTestCase
+
+
+class SourceMapTests(CollectstaticTestCase):
+    files = {
+        'js/app.js': 'function app() {\n    return 1;\n}\n',
+        'css/site.css': '.site {\n    background: url("../img/a.png");\n}\n',
+        'img/a.png': 'image',
+    }
+    config = {
+        'JS_MIN_ENABLED': True,
+        'CSS_MIN_ENABLED': True,
+        'JS_MIN_FUNC': 'tests.minifiers.minify_with_source_map',
+        'CSS_MIN_FUNC': 'tests.minifiers.minify_with_source_map',
+        'JS_MIN_FUNC_KWARGS': None,
+        'CSS_MIN_FUNC_KWARGS': None,
+        'SOURCE_MAPS_ENABLED': True,
+    }
+
+    def assert_source_map(self, name, comment_template):
+        manifest = self.read_manifest()
+        map_name = manifest[name + '.map']
+        content = self.read_file(map_name)
+        # Hashed by its own content
+        self.assertEqual(
+            map_name, '%s.%s.map' % (name,
+                                     hashlib.md5(content.encode('utf-8'))
+                                     .hexdigest()[:12]))
+        self.assertEqual(json.loads(content)['mappings'], 'AAAA')
+        # Referenced by its hashed name
+        minified = self.read_file(manifest[name])
+        self.assertTrue(minified.endswith(
+            comment_template % map_name.split('/')[-1]))
+        self.assertNotIn('\n    ', minified)
+
+    def test_source_maps(self):
+        self.collectstatic()
+        self.assert_source_map('js/app.js', '//# sourceMappingURL=%s')
+        self.assert_source_map('css/site.css', '/*# sourceMappingURL=%s */')
+        files = self.list_files()
+        # Source maps are kept under their hashed names only
+        self.assertNotIn('js/app.js.map', files)
+        self.assertNotIn('css/site.css.map', files)
+
+    def test_min_workers(self):
+        self.collectstatic({'MIN_WORKERS': 2})
+        self.assert_source_map('js/app.js', '//# sourceMappingURL=%s')
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        self.collectstatic(static_root=static_root)
+        self.assertEqual(self.read_manifest(),
+                         self.read_manifest(static_root))
+
+    def test_disabled(self):
+        self.collectstatic({'SOURCE_MAPS_ENABLED': False})
+        manifest = self.read_manifest()
+        self.assertNotIn('js/app.js.map', manifest)
+        self.assertNotIn('sourceMappingURL',
+                         self.read_file(manifest['js/app.js']))
+        self.assertFalse(any(name.endswith('.map')
+                             for name in self.list_files()))
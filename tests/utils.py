@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, absolute_import
+
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from django.utils.six import StringIO, iteritems
+
+
+class CollectstaticTestCase(SimpleTestCase):
+    # Runs collectstatic from a temporary source directory into a temporary
+    # STATIC_ROOT. Subclasses provide the source files and settings.
+    storage = 'django_smartstaticfiles.storage.SmartManifestStaticFilesStorage'
+    config = {}
+    files = {}
+
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root)
+        self.write_files(self.files)
+
+    def write_files(self, files):
+        for name, content in iteritems(files):
+            path = os.path.join(self.source_dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with io.open(path, 'wb') as f:
+                f.write(content.encode('utf-8'))
+
+    def collectstatic(self, config=None, static_root=None, storage=None,
+                      **options):
+        # Run collectstatic, and return the storage it used
+        settings_config = dict(self.config)
+        settings_config.update(config or {})
+        with self.settings(
+            STATIC_ROOT=static_root or self.static_root,
+            STATICFILES_DIRS=[self.source_dir],
+            STATICFILES_STORAGE=storage or self.storage,
+            SMARTSTATICFILES_CONFIG=settings_config,
+        ):
+            options.setdefault('interactive', False)
+            options.setdefault('verbosity', 0)
+            options.setdefault('stdout', StringIO())
+            options.setdefault('stderr', StringIO())
+            call_command('collectstatic', **options)
+            return staticfiles_storage._wrapped
+
+    def runtime_settings(self, config=None):
+        # Settings of a process serving the collected files
+        settings_config = dict(self.config)
+        settings_config.update(config or {})
+        return self.settings(STATIC_ROOT=self.static_root,
+                             SMARTSTATICFILES_CONFIG=settings_config)
+
+    def read_manifest(self, static_root=None):
+        path = os.path.join(static_root or self.static_root, 'staticfiles.json')
+        with io.open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))['paths']
+
+    def read_file(self, name, static_root=None):
+        path = os.path.join(static_root or self.static_root, name)
+        with io.open(path, 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def list_files(self, static_root=None):
+        root = static_root or self.static_root
+        names = set()
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                names.add(os.path.relpath(os.path.join(directory, filename),
+                                          root).replace(os.sep, '/'))
+        return names